@@ -1,6 +1,7 @@
 import json
 import sys
 from bxast import *
+from tacrun import Instr
 
 TOTAL_VARIABLES = 0
 TOTAL_LABELS = 0
@@ -50,9 +51,9 @@ def fresh_label():
 def bool_expr_to_code(x, Lt, Lf, local_vars):
     if isinstance(x, Bool):
         if x.value == "true":
-            return [{"opcode":"jmp", "args":[Lt], "result":None}]
+            return [Instr(None, "jmp", [Lt])]
         elif x.value == "false":
-            return [{"opcode":"jmp", "args":[Lf], "result":None}]
+            return [Instr(None, "jmp", [Lf])]
         else:
             print(f"Unrecognized boolean value: {x.value}, line {x.location[0]}")
             sys.exit(1)
@@ -70,22 +71,22 @@ def bool_expr_to_code(x, Lt, Lf, local_vars):
             t2 = fresh()
             e1 = expression_to_code(x.arg1, t1, local_vars)
             e2 = expression_to_code(x.arg2, t2, local_vars)
-            return e1 + e2 + [{"opcode":"sub", "args":[t1, t2], "result":t1},
-                                {"opcode":jump, "args":[t1, Lt], "result":None},
-                                {"opcode":"jmp", "args":[Lf], "result":None}]
+            return e1 + e2 + [Instr(t1, "sub", [t1, t2]),
+                                Instr(None, jump, [t1, Lt]),
+                                Instr(None, "jmp", [Lf])]
 
         if x.arg2.type_ == "bool":
             if x.op.name == "BOOLAND":
                 Li = fresh_label()
                 e1 = bool_expr_to_code(x.arg1, Li, Lf, local_vars)
                 e2 = bool_expr_to_code(x.arg2, Lt, Lf, local_vars)
-                return e1 + [{"opcode":"label", "args":[Li], "result":None}] + e2
+                return e1 + [Instr(None, "label", [Li])] + e2
 
             if x.op.name == "BOOLOR":
                 Li = fresh_label()
                 e1 = bool_expr_to_code(x.arg1, Lt, Li, local_vars)
                 e2 = bool_expr_to_code(x.arg2, Lt, Lf, local_vars)
-                return e1 + [{"opcode":"label", "args":[Li], "result":None}] + e2
+                return e1 + [Instr(None, "label", [Li])] + e2
 
             if x.op.name == "EQUALS":
                 Lz = fresh_label()
@@ -94,9 +95,9 @@ def bool_expr_to_code(x, Lt, Lf, local_vars):
                 ez = bool_expr_to_code(x.arg2, Lt, Lf, local_vars)
                 eo = bool_expr_to_code(x.arg2, Lf, Lt, local_vars)
                 return e1 +\
-                       [{"opcode":"label", "args":[Lz], "result":None}] +\
+                       [Instr(None, "label", [Lz])] +\
                        ez +\
-                       [{"opcode":"label", "args":[Lo], "result":None}] +\
+                       [Instr(None, "label", [Lo])] +\
                        eo
 
             if x.op.name == "NEQUALS":
@@ -106,9 +107,9 @@ def bool_expr_to_code(x, Lt, Lf, local_vars):
                 ez = bool_expr_to_code(x.arg2, Lf, Lt, local_vars)
                 eo = bool_expr_to_code(x.arg2, Lt, Lf, local_vars)
                 return e1 +\
-                       [{"opcode":"label", "args":[Lz], "result":None}] +\
+                       [Instr(None, "label", [Lz])] +\
                        ez +\
-                       [{"opcode":"label", "args":[Lo], "result":None}] +\
+                       [Instr(None, "label", [Lo])] +\
                        eo
 
             print(f"Unrecognized boolean expression name {x.op.name}, line {x.location[0]}")
@@ -128,17 +129,17 @@ def bool_expr_to_code(x, Lt, Lf, local_vars):
 def expression_to_code(e, x, local_vars):
     """
     input: an expression e and a temporary x
-    output: a list of arrays of length 3 each containing:
+    output: a list of Instr each containing:
         - an opcode
         - arguments
         - a temporary to store the result
         Which represent the expression
     """
     if isinstance(e, Number):
-        return [{"opcode":"const", "args":[e.value],  "result":x}]
+        return [Instr(x, "const", [e.value])]
 
     if isinstance(e, Variable):
-        return [{"opcode":"copy", "args":[local_vars[e.name]], "result":x}]
+        return [Instr(x, "copy", [local_vars[e.name]])]
 
     if isinstance(e, BinopApp):
         op_names = {"PLUS": "add",
@@ -156,29 +157,28 @@ def expression_to_code(e, x, local_vars):
         z = fresh()
         e1 = expression_to_code(e.arg1, y, local_vars)
         e2 = expression_to_code(e.arg2, z, local_vars)
-        return e1 + e2 + [{"opcode":op_names[e.op.name], "args":[y, z],
-                           "result":x}]
+        return e1 + e2 + [Instr(x, op_names[e.op.name], [y, z])]
 
     if isinstance(e, UnopApp):
         op_names = {"UMINUS": "neg", "BITCOMPL": "not"}
         y = fresh()
         e1 = expression_to_code(e.arg, y, local_vars)
-        return e1 + [{"opcode":op_names[e.op.name], "args":[y], "result":x}]
+        return e1 + [Instr(x, op_names[e.op.name], [y])]
 
     if isinstance(e, ProcCall):
         res = []
         for i, arg in enumerate(e.args):
             if isinstance(arg, Variable):
                 y = local_vars[arg.name]
-                res.append({"opcode":"param", "args": [i+1, y], "result":None})
+                res.append(Instr(None, "param", [i+1, y]))
             else:
                 y = fresh()
                 e = expression_to_code(arg, y, local_vars)
                 res += e
-                res.append({"opcode":"param", "args":[i+1, y], "result":None})
+                res.append(Instr(None, "param", [i+1, y]))
         
         name = '@' + e.proc_name
-        res.append({"opcode":"call", "args":[name, len(e.args)], "result":x})
+        res.append(Instr(x, "call", [name, len(e.args)]))
 
 
     print(f"Unrecognized expression type: {type(e)}, line {e.location[0]}")
@@ -188,7 +188,7 @@ def expression_to_code(e, x, local_vars):
 def statement_to_code(s, local_vars: Muncher):
     """
     input: a statement s and a dict mapping declared variables to temporaries
-    output: a list of arrays of length 3 each containing:
+    output: a list of Instr each containing:
         - an opcode
         - arguments
         - a temporary to store the result
@@ -201,12 +201,12 @@ def statement_to_code(s, local_vars: Muncher):
             Lt = fresh_label()
             Lf = fresh_label()
             e1 = bool_expr_to_code(s.expression, Lt, Lf, local_vars)
-            return [{"opcode":"const", "args":[0], "result":t}] +\
+            return [Instr(t, "const", [0])] +\
                    e1 +\
-                   [{"opcode":"label", "args":[Lt], "result":None},
-                    {"opcode":"const", "args":[1], "result":t},
-                    {"opcode":"label", "args":[Lf], "result":None},
-                    {"opcode":"copy", "args":[t], "result":x}]
+                   [Instr(None, "label", [Lt]),
+                    Instr(t, "const", [1]),
+                    Instr(None, "label", [Lf]),
+                    Instr(x, "copy", [t])]
 
         if s.expression.type_ == "int":
             return expression_to_code(s.expression, x, local_vars)
@@ -223,13 +223,13 @@ def statement_to_code(s, local_vars: Muncher):
 
             if isinstance(expression, Variable):
                 x = local_vars[expression.name]
-                res += [{"opcode":"copy", "args":[x], "result":y}] 
+                res += [Instr(y, "copy", [x])] 
                 continue
 
             x = fresh()
             e1 = expression_to_code(expression, x, local_vars)
 
-            res += e1 + [{"opcode":"copy", "args":[x], "result":y}]
+            res += e1 + [Instr(y, "copy", [x])]
         return res
 
     if isinstance(s, Block):
@@ -248,12 +248,12 @@ def statement_to_code(s, local_vars: Muncher):
         s1 = statement_to_code(s.block, local_vars)
         s2 = statement_to_code(s.optelse, local_vars)
         return e1 +\
-            [{"opcode":"label", "args":[Lt], "result":None}] +\
+            [Instr(None, "label", [Lt])] +\
                s1 +\
-               [{"opcode":"jmp", "args":[Lo], "result":None},
-                {"opcode":"label", "args":[Lf], "result":None}] +\
+               [Instr(None, "jmp", [Lo]),
+                Instr(None, "label", [Lf])] +\
                s2 +\
-               [{"opcode":"label", "args":[Lo], "result":None}]
+               [Instr(None, "label", [Lo])]
 
     if isinstance(s, While):
         Lhead = fresh_label()
@@ -265,19 +265,19 @@ def statement_to_code(s, local_vars: Muncher):
         s1 = statement_to_code(s.block, local_vars)
         local_vars.break_stack.pop()
         local_vars.continue_stack.pop()
-        return [{"opcode":"label", "args":[Lhead], "result":None}] +\
+        return [Instr(None, "label", [Lhead])] +\
                e1 +\
-               [{"opcode":"label", "args":[Lbod], "result":None}] +\
+               [Instr(None, "label", [Lbod])] +\
                s1 +\
-               [{"opcode":"jmp", "args":[Lhead], "result":None},
-                {"opcode":"label", "args":[Lend], "result":None}]
+               [Instr(None, "jmp", [Lhead]),
+                Instr(None, "label", [Lend])]
 
     if isinstance(s, Jump):
         if s.type_ == "break":
-            return [{"opcode":"jmp", "args":[local_vars.break_stack[-1]], "result":None}]
+            return [Instr(None, "jmp", [local_vars.break_stack[-1]])]
 
         if s.type_ == "continue":
-            return [{"opcode":"jmp", "args":[local_vars.continue_stack[-1]], "result":None}]
+            return [Instr(None, "jmp", [local_vars.continue_stack[-1]])]
 
         print(f"Unrecognized jump type {s.type_}, line {s.location[0]}")
         sys.exit(1)
@@ -288,7 +288,7 @@ def statement_to_code(s, local_vars: Muncher):
     
     if isinstance(s, Return):
         if s.expression is None:
-            return [{"opcode":"ret", "args":[], "result":None}]
+            return [Instr(None, "ret", [])]
         
         if isinstance(s.expression, Variable):
             x = local_vars[s.expression.name]
@@ -298,9 +298,9 @@ def statement_to_code(s, local_vars: Muncher):
             e1 = expression_to_code(s.expression, x, local_vars)
 
         if isinstance(s.expression, ProcCall):
-            return e1 + [{"opcode":"ret", "args":[], "result":None}]
+            return e1 + [Instr(None, "ret", [])]
         
-        return e1 + [{"opcode":"ret", "args":[x], "result":None}]
+        return e1 + [Instr(None, "ret", [x])]
     
     print(f"Unrecognized statement type: {type(s)}, line {s.location[0]}")
     sys.exit(1)
@@ -10,10 +10,12 @@ from parser import parser
 import sys
 import json
 import ast2tac as ast2tac
+from tacrun import instr_default
 
 def loadfile(fn):
+    # a fresh lexer per file, so that line numbers start over
     with open(fn, 'r') as f:
-        ast = parser.parse(f.read(), lexer=lexer)
+        ast = parser.parse(f.read(), lexer=lexer.clone())
     return ast
 
 def to_tac(filename, keep_tac):
@@ -33,7 +35,7 @@ def to_tac(filename, keep_tac):
     tac = ast2tac.program2tac(ast)
     if keep_tac:
         with open(rname, 'w') as afp:
-            json.dump(tac, afp, indent=1)
+            json.dump(tac, afp, indent=1, default=instr_default)
         print(f"{rname} produced")
 
     return tac
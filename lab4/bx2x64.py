@@ -1,9 +1,10 @@
 from scanner import lexer
-from our_parser import parser
+from parser import parser
 import sys
 import json
 import ast2tac
 import tac2x64
+from tacrun import instr_default
 
 def loadfile(fn):
     with open(fn, 'r') as f:
@@ -23,9 +24,8 @@ def main():
         ast.check_syntax()
 
         tac = ast2tac.program2tac(ast)
-        res = [{"proc": "@main", "body": tac}]
         with open(rname, 'w') as afp:
-            json.dump(res, afp, indent=1)
+            json.dump(tac, afp, indent=1, default=instr_default)
         print(f"{rname} produced")
 
         tac2x64.compile_tac(rname)
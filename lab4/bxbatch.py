@@ -0,0 +1,133 @@
+"""
+Usage: python3 bxbatch.py [-j N] [--tac-only] [--cache DIR] file.bx|file.tac.json ...
+Produces: file.tac.json, file.s and file.exe for each input
+
+Compiles many files at once. The front end and the code generator run in a
+pool of N worker processes, so that N files are compiled in parallel (each
+worker reuses its scanner and parser from one file to the next), and the
+gcc steps run as soon as their assembly is ready, at most N at a time. With a cache, files
+compiled before with the same compiler and flags are copied out of it.
+"""
+
+import io
+import os
+import sys
+import argparse
+import subprocess
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import tac2x64
+from bxcache import Cache
+
+def products(fname, tac_only, link):
+    """The stem of the files made from fname, and their suffixes in order"""
+    if fname.endswith('.bx'):
+        stem, suffixes = fname[:-3], ['.tac.json']
+    elif fname.endswith('.tac.json'):
+        stem, suffixes = fname[:-9], []
+    else:
+        stem, suffixes = fname[:-5], []
+    if not tac_only: suffixes.append('.s')
+    if link: suffixes.append('.exe')
+    return stem, suffixes
+
+def front(fname, regalloc, optimize, tac_only, link, cache=None, key=None):
+    """
+    Runs in a worker: compiles fname down to assembly, returning the name of
+    the last file produced, the output printed on the way and whether it
+    came from the cache, or None and the reason for a failure
+    """
+    log = io.StringIO()
+    try:
+        if key is not None:
+            stem, suffixes = products(fname, tac_only, link)
+            if suffixes and cache.get(key, stem, suffixes):
+                return stem + suffixes[-1], '', True
+        with redirect_stdout(log):
+            if fname.endswith('.bx'):
+                import bx2tac
+                bx2tac.to_tac(fname, True)
+                fname = fname[:-3] + '.tac.json'
+            if tac_only: return fname, log.getvalue(), False
+            return tac2x64.tac_to_file(fname, regalloc, optimize), log.getvalue(), False
+    except SystemExit:
+        # the front end reports its errors and exits
+        return None, log.getvalue(), False
+    except Exception as e:
+        return None, log.getvalue() + f'{type(e).__name__}: {e}\n', False
+
+def back(sname):
+    try:
+        return tac2x64.link(sname), ''
+    except subprocess.CalledProcessError as e:
+        return None, f'gcc exited with status {e.returncode}\n'
+    except OSError as e:
+        return None, f'{e}\n'
+
+def compile_all(fnames, jobs=None, regalloc='stack', optimize=True, tac_only=False,
+                cache=None):
+    """
+    Compiles fnames with jobs processes, returning a dict from each file
+    to None if it failed or the last file produced for it otherwise
+    """
+    jobs = jobs or os.cpu_count()
+    link = not tac_only and sys.platform != "win32"
+    results = {}
+    keys = {}
+    def report(fname, out, log):
+        results[fname] = out
+        if out is None:
+            print(f'{fname}: failed', file=sys.stderr)
+            sys.stderr.write(log)
+            return
+        print(f'{fname} -> {out}')
+        if fname in keys:
+            stem, suffixes = products(fname, tac_only, link)
+            if suffixes: cache.put(keys[fname], stem, suffixes)
+    with ProcessPoolExecutor(jobs) as workers, ThreadPoolExecutor(jobs) as linkers:
+        pending = {}
+        for fname in fnames:
+            key = None
+            if cache is not None:
+                try:
+                    key = cache.key(fname, regalloc, optimize, tac_only, link)
+                except OSError:
+                    pass
+            future = workers.submit(front, fname, regalloc, optimize, tac_only, link,
+                                    cache, key)
+            pending[future] = fname
+            if key is not None: keys[fname] = key
+        linking = {}
+        for future in as_completed(pending):
+            fname = pending[future]
+            out, log, cached = future.result()
+            if cached: del keys[fname]
+            if cached or out is None or not link:
+                report(fname, out, log)
+            else:
+                linking[linkers.submit(back, out)] = fname
+        for future in as_completed(linking):
+            report(linking[future], *future.result())
+    return results
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('fnames', metavar='file', nargs='+',
+                    help='.bx or .tac.json files to compile')
+    ap.add_argument('-j', '--jobs', type=int, default=None,
+                    help='how many files to compile at once (default: one per cpu)')
+    ap.add_argument('--tac-only', action='store_true',
+                    help='stop after producing the .tac.json files')
+    ap.add_argument('--regalloc', default='stack', choices=tac2x64.allocators.keys(),
+                    help='how to place the temporaries (default: a stack slot each)')
+    ap.add_argument('--no-peephole', dest='optimize', action='store_false',
+                    help='emit the assembly without peephole optimization')
+    ap.add_argument('--cache', metavar='DIR', default=os.environ.get('BXCACHE'),
+                    help='reuse the files compiled before from DIR (default: $BXCACHE)')
+    ap.add_argument('--cache-size', metavar='MB', type=int, default=256,
+                    help='how large the cache may grow (default: 256)')
+    args = ap.parse_args()
+    cache = args.cache and Cache(args.cache, args.cache_size << 20)
+    results = compile_all(args.fnames, args.jobs, args.regalloc, args.optimize,
+                          args.tac_only, cache)
+    sys.exit(0 if all(out is not None for out in results.values()) else 1)
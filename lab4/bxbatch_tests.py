@@ -0,0 +1,51 @@
+import unittest
+import json
+import os
+import tempfile
+from bxbatch import *
+
+class testBatch(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.fnames = []
+        for k in range(3):
+            fname = os.path.join(self.dir.name, f'p{k}.tac.json')
+            with open(fname, 'w') as fp:
+                json.dump([{"proc": "@main", "args": [],
+                            "body": [{"opcode": "const", "args": [k], "result": "%0"},
+                                     {"opcode": "print", "args": ["%0"], "result": None}]}], fp)
+            self.fnames.append(fname)
+
+    def test_every_file_compiled(self):
+        results = compile_all(self.fnames, 2, tac_only=True)
+        self.assertEqual(results, {fname: fname for fname in self.fnames})
+        results = compile_all(self.fnames, 2, 'color')
+        for fname in self.fnames:
+            self.assertTrue(os.path.exists(fname[:-9] + '.s'))
+
+    def test_failure_does_not_stop_others(self):
+        bad = os.path.join(self.dir.name, 'bad.tac.json')
+        with open(bad, 'w') as fp:
+            fp.write('[')
+        results = compile_all(self.fnames + [bad], 2)
+        self.assertIsNone(results[bad])
+        self.assertEqual(len([out for out in results.values() if out is not None]), 3)
+
+    def test_cached_files_reused(self):
+        cache = Cache(os.path.join(self.dir.name, 'cache'))
+        compile_all(self.fnames, 2, cache=cache)
+        for fname in self.fnames:
+            os.remove(fname[:-9] + '.s')
+        # a changed file is compiled again, the others come out of the cache
+        with open(self.fnames[0], 'w') as fp:
+            fp.write('[')
+        results = compile_all(self.fnames, 2, cache=cache)
+        self.assertIsNone(results[self.fnames[0]])
+        for fname in self.fnames[1:]:
+            self.assertTrue(os.path.exists(fname[:-9] + '.s'))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+if __name__ == '__main__':
+    unittest.main()
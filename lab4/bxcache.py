@@ -0,0 +1,82 @@
+"""
+An on-disk cache of compiled files
+
+Each entry is a directory named by a hash of a source file, the flags it
+was compiled with and the source of the compiler itself, holding a copy of
+every file produced from it (.tac.json, .s, .exe). The cache is bounded in
+size: when it grows too large, the least recently used entries go first.
+Entries are renamed into place once complete, so that several processes
+may share a cache.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+# the files whose changes invalidate every entry
+compiler_sources = ['scanner.py', 'parser.py', 'bxast.py', 'ast2tac.py',
+                    'tacrun.py', 'bx2tac.py', 'tac2x64.py', 'peephole.py',
+                    'bx_runtime.c']
+
+def compiler_version():
+    h = hashlib.sha256()
+    here = Path(__file__).parent
+    for name in compiler_sources:
+        h.update((here / name).read_bytes())
+    return h.hexdigest()
+
+class Cache:
+    def __init__(self, root, max_size=256 << 20):
+        self.root = Path(root)
+        self.max_size = max_size
+        self.version = compiler_version()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def key(self, fname, *flags):
+        h = hashlib.sha256(self.version.encode())
+        h.update(repr(flags).encode())
+        h.update(Path(fname).read_bytes())
+        return h.hexdigest()
+
+    def get(self, key, stem, suffixes):
+        """
+        Copies the files cached under key to stem + suffix for each of the
+        suffixes, returning False if any is missing
+        """
+        entry = self.root / key
+        try:
+            for suffix in suffixes:
+                shutil.copy(entry / suffix, stem + suffix)
+            os.utime(entry)
+        except OSError:
+            # absent, or evicted while we were copying
+            return False
+        return True
+
+    def put(self, key, stem, suffixes):
+        tmp = Path(tempfile.mkdtemp(dir=self.root, prefix='.tmp'))
+        for suffix in suffixes:
+            shutil.copy(stem + suffix, tmp / suffix)
+        try:
+            os.rename(tmp, self.root / key)
+        except OSError:
+            # another process cached the same file first
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in self.root.iterdir():
+            if entry.name.startswith('.'): continue
+            try:
+                size = sum(f.stat().st_size for f in entry.iterdir())
+                entries.append((entry.stat().st_mtime, size, entry))
+            except OSError:
+                continue
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_size: break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
@@ -0,0 +1,47 @@
+import unittest
+import os
+import tempfile
+from bxcache import *
+
+class testCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache = Cache(os.path.join(self.dir.name, 'cache'), max_size=250)
+        self.stem = os.path.join(self.dir.name, 'p')
+
+    def store(self, name, size):
+        with open(self.stem + '.s', 'w') as fp:
+            fp.write('x' * size)
+        self.cache.put(name, self.stem, ['.s'])
+
+    def test_key_depends_on_flags_and_source(self):
+        with open(self.stem + '.bx', 'w') as fp:
+            fp.write('def main() { }')
+        key = self.cache.key(self.stem + '.bx', 'stack')
+        self.assertNotEqual(key, self.cache.key(self.stem + '.bx', 'color'))
+        with open(self.stem + '.bx', 'a') as fp:
+            fp.write('\n')
+        self.assertNotEqual(key, self.cache.key(self.stem + '.bx', 'stack'))
+
+    def test_round_trip(self):
+        self.store('a', 10)
+        os.remove(self.stem + '.s')
+        self.assertTrue(self.cache.get('a', self.stem, ['.s']))
+        self.assertTrue(os.path.exists(self.stem + '.s'))
+        self.assertFalse(self.cache.get('b', self.stem, ['.s']))
+
+    def test_least_recently_used_evicted(self):
+        self.store('a', 100)
+        self.store('b', 100)
+        os.utime(self.cache.root / 'a', (0, 0))
+        os.utime(self.cache.root / 'b', (1, 1))
+        self.assertTrue(self.cache.get('a', self.stem, ['.s']))
+        self.store('c', 100)
+        self.assertEqual(sorted(entry.name for entry in self.cache.root.iterdir()),
+                         ['a', 'c'])
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+if __name__ == '__main__':
+    unittest.main()
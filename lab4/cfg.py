@@ -1,4 +1,15 @@
 import sys
+from collections import deque
+from itertools import islice
+from tacrun import Instr
+
+# the conditional jumps on a temporary that are taken (implied) or not taken
+# (negated) when a given one on the same temporary is taken
+implications = {"jz":["jz"], "jl":["jl", "jle", "jnz"], "jle":["jle"],
+                "jnz":["jnz"], "jnl":["jnl"], "jnle":["jnle", "jnl", "jnz"]}
+negations = {"jz":["jl", "jnle", "jnz"], "jl":["jnl", "jnle", "jz"],
+             "jle":["jnle"], "jnz":["jz"], "jnl":["jl"],
+             "jnle":["jz", "jl", "jle"]}
 
 class Node:
     def __init__(self,label,body=None):
@@ -12,19 +23,19 @@ class Node:
     def __str__(self):
         res = ""
         for instr in self.instrs:
-            if len(instr["args"]) == 1:
-                args = instr["args"][0]
-            elif len(instr["args"]) == 0:
+            if len(instr.args) == 1:
+                args = instr.args[0]
+            elif len(instr.args) == 0:
                 args = ""
             else:
-                arg1 = instr["args"][0]
-                arg2 = instr["args"][1]
+                arg1 = instr.args[0]
+                arg2 = instr.args[1]
                 args = f"{arg1}, {arg2}"
-            opcode = instr["opcode"]
-            if instr["result"] is None:
+            opcode = instr.opcode
+            if instr.result is None:
                 res += f"{opcode} {args}\n"
             else:
-                result = instr["result"]
+                result = instr.result
                 res += f"{result} = {opcode} {args}\n"
         return res
 
@@ -39,11 +50,12 @@ class Node:
             self.instrs.append(instr)
 
     def update_jumps(self):
+        self.size = len(self.instrs)
         self.dests = []
         self.cond_jumps = []
         for i, instr in enumerate(self.instrs):
-            instruction = instr["opcode"]
-            args = instr["args"]
+            instruction = instr.opcode
+            args = instr.args
             if instruction[0]=='j':
                 if instruction != "jmp":
                     self.cond_jumps.append((instruction, args[0], args[1], i))
@@ -52,12 +64,29 @@ class Node:
         self.remove_modified_jumps()
 
     def remove_modified_jumps(self):
-        temp = self.cond_jumps.copy()
-        for jump in temp:
-            for line in range(jump[3]+1, self.size):
-                if self.instrs[line]["result"] == jump[1]:
-                    self.cond_jumps.remove(jump)
-                    break
+        """
+        Drops the conditional jumps whose temporary is written later in the
+        block, going through it once from the end
+        """
+        kept = []
+        written = set()
+        k = len(self.cond_jumps) - 1
+        for line in range(self.size - 1, -1, -1):
+            if k >= 0 and self.cond_jumps[k][3] == line:
+                if self.cond_jumps[k][1] not in written:
+                    kept.append(self.cond_jumps[k])
+                k -= 1
+            written.add(self.instrs[line].result)
+        kept.reverse()
+        self.cond_jumps = kept
+
+    def forwards(self):
+        """
+        The label this block jumps to if it does nothing else, else None
+        """
+        if len(self.instrs) == 2 and self.instrs[1].opcode == "jmp":
+            return self.instrs[1].args[0]
+        return None
 
     def replace_line(self, lineno, newline):
         self.instrs[lineno] = newline
@@ -80,6 +109,7 @@ class CFG:
         self.labels_to_nodes = {node.label:node for node in self.nodes}
         self.entry = self.nodes[0]
         self.edges=dict()
+        self.preds=dict()
         self.update_edges()
 
     def __str__(self):
@@ -90,12 +120,15 @@ class CFG:
 
     def update_edges(self):
         """
-        Update the edges dictionnary using the information stored in the node
-        objects
+        Rebuild the edges and predecessors dictionnaries from the information
+        stored in the node objects, for when their jumps have changed
         """
         self.edges=dict()
+        self.preds={node.label:dict() for node in self.nodes}
         for node in self.nodes:
             self.edges[node.label]=node.dests
+            for dest in node.dests:
+                self.preds.setdefault(dest, dict())[node.label]=None
         self.nodes_to_labels = {node:node.label for node in self.nodes}
         self.labels_to_nodes = {node.label:node for node in self.nodes}
 
@@ -126,20 +159,22 @@ class CFG:
             label = node
         else:
             label = node.label
-
-        prevs=[]
-        for lab, dests in self.edges.items():
-            if label in dests:
-                prevs.append(lab)
-        return prevs
+        # the predecessors of each label are kept as the keys of a dict, an
+        # ordered set
+        return list(self.preds.get(label, ()))
 
     def new_node(self, node):
         """
-        Given a node object, add it to self.nodes and update the edges
+        Given a node object, add it to self.nodes and to the edges
         """
-        if node not in self.nodes:
+        if node not in self.nodes_to_labels:
             self.nodes.append(node)
-            self.update_edges()
+            self.nodes_to_labels[node] = node.label
+            self.labels_to_nodes[node.label] = node
+            self.edges[node.label] = node.dests
+            self.preds.setdefault(node.label, dict())
+            for dest in node.dests:
+                self.preds.setdefault(dest, dict())[node.label] = None
 
     def delete_node(self, node):
         """
@@ -150,8 +185,12 @@ class CFG:
             node = self.labels_to_nodes[node]
         label=node.label
         self.nodes.remove(node)
-        del self.edges[label]
-        self.update_edges()
+        for dest in self.edges.pop(label):
+            if dest in self.preds:
+                self.preds[dest].pop(label, None)
+        del self.preds[label]
+        del self.nodes_to_labels[node]
+        del self.labels_to_nodes[label]
         self.entry = self.nodes[0]
 
     def remove_edge(self,src,dest):
@@ -161,6 +200,7 @@ class CFG:
         """
         if dest in self.edges[src]:
             self.edges[src].remove(dest)
+            self.preds[dest].pop(src, None)
 
     def add_edge(self,src,dest):
         """
@@ -169,147 +209,295 @@ class CFG:
         """
         if dest not in self.edges[src]:
             self.edges[src].append(dest)
+            self.preds.setdefault(dest, dict())[src] = None
 
-    def aux_uce(self, node_label, visited):
-        visited.add(node_label)
-        for nbr_label in self.next(node_label):
-            if nbr_label not in visited:
-                self.aux_uce(nbr_label, visited)
+    def reachable(self):
+        """
+        Returns a bytearray with a 1 at the index in self.nodes of every node
+        reachable from the entry, found by an iterative depth-first search
+        """
+        index = {node.label: i for i, node in enumerate(self.nodes)}
+        visited = bytearray(len(self.nodes))
+        visited[index[self.entry.label]] = 1
+        stack = [self.entry]
+        while stack:
+            for dest in stack.pop().dests:
+                i = index.get(dest)
+                if i is not None and not visited[i]:
+                    visited[i] = 1
+                    stack.append(self.nodes[i])
+        return visited
 
     def uce(self):
-        visited = set()
-        self.aux_uce(self.entry.label, visited)
-
-        to_delete = []
-        for node in self.nodes:
-            if node.label not in visited:
-                to_delete.append(node)
-
-        for node in to_delete:
-            self.delete_node(node)
-
-        self.update_edges()
+        """
+        Removes the nodes unreachable from the entry, all at once
+        """
+        visited = self.reachable()
+        if all(visited):
+            return
+        for node, seen in zip(self.nodes, visited):
+            if seen:
+                continue
+            label = node.label
+            for dest in self.edges.pop(label):
+                if dest in self.preds:
+                    self.preds[dest].pop(label, None)
+            self.preds.pop(label, None)
+            del self.nodes_to_labels[node]
+            del self.labels_to_nodes[label]
+        self.nodes = [node for node, seen in zip(self.nodes, visited) if seen]
+
+    def jump_target(self, label, resolved):
+        """
+        Follows the blocks that only jump elsewhere from label, returning the
+        label of the first one doing something else, or label itself if they
+        loop. The targets found are recorded in resolved for the labels
+        passed through; as a block never stops only jumping elsewhere, a
+        recorded target is still on the way, if no longer the end of it
+        """
+        # the keys of a dict, an ordered set
+        path = {label: None}
+        target = label
+        while True:
+            ahead = resolved.get(target, target)
+            if ahead != target:
+                if ahead in path:
+                    return label
+                path[ahead] = None
+                target = ahead
+            node = self.labels_to_nodes.get(target)
+            dest = node.forwards() if node is not None else None
+            if dest is None:
+                break
+            if dest in path:
+                return label
+            path[dest] = None
+            target = dest
+        for step in path:
+            resolved[step] = target
+        return target
+
+    def jp1_node(self, node, resolved):
+        """
+        Retargets the jumps of node past the blocks that only jump elsewhere
+        and drops the conditional jumps made redundant by the final jmp,
+        returning the number of jumps threaded
+        """
+        threaded = 0
+        for i, instr in enumerate(node.instrs):
+            if instr.opcode[0] != 'j':
+                continue
+            dest = instr.args[-1]
+            target = self.jump_target(dest, resolved)
+            if target != dest:
+                node.replace_line(i, Instr(None, instr.opcode,
+                                           instr.args[:-1] + (target,)))
+                threaded += 1
+        # a conditional jump to where the jmp after it goes is not needed
+        instrs = node.instrs
+        while len(instrs) > 2 and instrs[-1].opcode == "jmp" and \
+              instrs[-2].opcode[0] == 'j' and \
+              instrs[-2].args[-1] == instrs[-1].args[0]:
+            del instrs[-2]
+            threaded += 1
+        return threaded
 
     def jp2_node(self, node):
-        implications = {"jz":["jz"], "jl":["jl", "jle", "jnz"], "jle":["jle"],
-                        "jnz":["jnz"], "jnl":["jnl"], "jnle":["jnle", "jnl",
-                                                              "jnz"]}
-        negations = {"jz":["jl", "jnle", "jnz"], "jl":["jnl", "jnle", "jz"],
-                     "jle":["jnle"], "jnz":["jz"], "jnl":["jl"], "jnle":["jz",
-                                                                         "jl",
-                                                                         "jle"]}
+        """
+        For each conditional jump of node to a block only reachable through
+        it, replaces the conditional jumps of that block that it implies by a
+        jmp and removes those it negates, up to the first write of the
+        temporary tested. Returns the number of jumps threaded and the
+        blocks changed
+        """
+        threaded = 0
+        changed = []
+        targets = [instr.args[-1] for instr in node.instrs
+                   if instr.opcode[0] == 'j']
         for jump, temporary, dest, _ in node.cond_jumps:
-            B2 = self.labels_to_nodes[dest]
+            B2 = self.labels_to_nodes.get(dest)
+            # the entry is also reached from the caller, and reaching B2 by
+            # two jumps tells nothing about the temporary
+            if B2 is None or B2 is node or B2 is self.entry or \
+               targets.count(dest) != 1 or \
+               list(self.preds[dest]) != [node.label]:
+                continue
             implied = implications[jump]
             negated = negations[jump]
-            if self.prev(B2) != [node.label]:
-                break
-            # we store lines to delete to later remove them in reverse order
-            to_delete = []
+            removed = 0
+            instrs = []
             for i, instr in enumerate(B2.instrs):
-                if instr["result"] == temporary:
+                if instr.result == temporary:
+                    instrs.extend(islice(B2.instrs, i, None))
                     break
-                if instr["opcode"] in implied and \
-                   instr["args"][0] == temporary:
-                    newline = {"opcode":"jmp",
-                               "args":[instr["args"][1]],
-                               "result":None}
-                    B2.replace_line(i, newline)
-                    B2.remove_lines(i+1, -1)
+                if instr.opcode in implied and \
+                   instr.args[0] == temporary:
+                    instrs.append(Instr(None, "jmp", [instr.args[1]]))
+                    removed += 1
                     break
-                if instr["opcode"] in negated and \
-                   instr["args"][0] == temporary:
-                    to_delete.append(i)
+                if instr.opcode in negated and \
+                   instr.args[0] == temporary:
+                    removed += 1
+                    continue
+                instrs.append(instr)
+            if removed:
+                B2.instrs = instrs
+                threaded += removed
+                changed.append(B2)
+        return threaded, changed
+
+    def refresh_jumps(self, node):
+        """
+        Updates the successors of node, and the edges and predecessors, after
+        its jumps were changed. Returns the labels it no longer jumps to
+        """
+        old = node.dests
+        node.update_jumps()
+        self.edges[node.label] = node.dests
+        for dest in node.dests:
+            self.preds.setdefault(dest, dict())[node.label] = None
+        lost = [dest for dest in old if dest not in node.dests]
+        for dest in lost:
+            if dest in self.preds:
+                self.preds[dest].pop(node.label, None)
+        return lost
+
+    def thread_jumps(self, jp1=True, jp2=True):
+        """
+        Threads jumps with JP1, retargeting jumps past the blocks that only
+        jump elsewhere, and JP2, simplifying the conditional jumps decided
+        by the conditional jump leading to their block, until neither
+        applies. After the first pass over all the blocks, a block is only
+        processed again when its successors change, when one of its
+        successors comes to only jump elsewhere, or when it becomes the only
+        predecessor of a successor. Returns the number of jumps threaded
+        """
+        self.uce()
+        threaded = 0
+        worklist = deque(self.nodes)
+        queued = set(self.nodes)
+        dead = set()
+        # where the chains of blocks that only jump elsewhere lead
+        resolved = dict()
+
+        def push(label):
+            node = self.labels_to_nodes.get(label)
+            if node is not None and node not in queued and node not in dead:
+                worklist.append(node)
+                queued.add(node)
+
+        def changed(node, was_link=False):
+            lost = self.refresh_jumps(node)
+            push(node.label)
+            if not was_link and node.forwards() is not None:
+                # a new link in the chains, to thread the jumps to it through
+                for label in self.preds[node.label]:
+                    push(label)
+            while lost:
+                dest = lost.pop()
+                preds = self.preds.get(dest)
+                if preds is None or dest not in self.labels_to_nodes or \
+                   dest == self.entry.label:
+                    continue
+                if len(preds) == 1:
+                    push(next(iter(preds)))
+                elif not preds:
+                    # unreachable now, so no longer a predecessor of its
+                    # successors, and left for uce() to remove
+                    succ = self.labels_to_nodes[dest]
+                    dead.add(succ)
+                    for label in succ.dests:
+                        if label in self.preds:
+                            self.preds[label].pop(dest, None)
+                            lost.append(label)
+
+        while worklist:
+            node = worklist.popleft()
+            queued.discard(node)
+            if node in dead:
+                continue
+            if jp1:
+                was_link = node.forwards() is not None
+                count = self.jp1_node(node, resolved)
+                if count:
+                    threaded += count
+                    changed(node, was_link)
+            if jp2:
+                count, blocks = self.jp2_node(node)
+                threaded += count
+                for block in blocks:
+                    changed(block)
 
-            for i in to_delete[::-1]:
-                B2.remove_lines(i, i+1)
+        self.uce()
+        return threaded
 
+    def jp1(self):
+        return self.thread_jumps(jp2=False)
 
     def jp2(self):
-        for node in self.nodes:
-            self.jp2_node(node)
-
-        for node in self.nodes:
-            node.update_jumps()
+        return self.thread_jumps(jp1=False)
 
-        self.update_edges()
-        self.uce()
+    def absorbable(self, node):
+        """
+        Returns the node that node can be merged with: its only successor,
+        reached by its final jmp and having it as only predecessor
+        """
+        if len(node.dests) != 1:
+            return None
+        label = node.dests[0]
+        if label == node.label or label == self.entry.label or \
+           len(self.preds[label]) != 1:
+            return None
+        instrs = node.instrs
+        if instrs[-1].opcode != "jmp" or \
+           (len(instrs) > 1 and instrs[-2].opcode[0] == 'j'):
+            return None
+        return self.labels_to_nodes[label]
 
-    def coalesce_aux(self):
-        # print(self.edges)
-        i=1
-        nl=[]
-        jl=[]
-        for label in self.edges.keys():
-            # print(i,label)
-            i+=1
-            if len(self.edges[label]) ==1 and self.prev(self.labels_to_nodes[self.edges[label][0]])==[label]:
-                # print("ok")
-                nl.append(label)
-                nl.append(self.edges[label][0])
-                jl.append(nl)
-                nl=[]
-        return jl
-    
     def coalesce(self):
-        jl=self.coalesce_aux()
-        init_len=len(jl)
-        while init_len>0:
-            # print(jl)
-            ls=jl[0]
-            if len(ls)==2:
-                # print(ls)
-                label=ls[0]
-                # print("Before this operation, my label is", self.labels_to_nodes[label].instrs[0])
-                linstr=self.labels_to_nodes[label].last_instr()
-                # print("And my last instr is",linstr)
-                if linstr["opcode"]=='jmp':
-                    self.labels_to_nodes[label].remove_last_instr()
-                new_body=self.labels_to_nodes[self.edges[label][0]].instrs
-                # print(new_body[0])
-                del new_body[0]
-                self.labels_to_nodes[label].append_instrs(new_body)
-                # print("After this operation, my label is", self.labels_to_nodes[label].instrs[0])
-                for edg in self.edges[self.edges[label][0]]:
-                    self.edges[label].append(edg)
-                self.delete_node(self.labels_to_nodes[self.edges[label][0]])
-                self.edges[label].remove(ls[1])
-                self.update_edges()
-            init_len-=1
-            jl=self.coalesce_aux()    
-        # print(self.edges)
-        # print(self.labels_to_nodes['%.L4'].instrs)
-
-
-
-    def jp1_aux(self):
-        """creates a node list of all the linear sequences inside the cfg"""
-        init_len=len(self.nodes)
-        nl=[]
-        jl=[]
-        for i in range(0,init_len):
-            node=self.nodes[i]
-            nl.append(node)
-            if len(node.dests)==1 and self.prev(self.nodes[i+1])[-1]==node.label and node.last_instr()["opcode"] == "jmp":
-                continue
-            else:
-                jl.append(nl)
-                nl=[]
-        return jl
-                
-
-    def jp1(self):
-        jl=self.jp1_aux()
-        for ls in jl:
-            if len(ls)>2:
-                first=jl[0]
-                first.remove_lines(-2,-1)
-                label=ls[-1].label()
-                first.append_instrs({'opcode': 'jmp', 'args': [label], 'result': None})
-                self.uce()
+        """
+        Merges every chain of blocks, each the only successor of the previous
+        one and having it as only predecessor, into its first block in a
+        single pass: the bodies are spliced in, and the merged blocks are
+        removed all at once at the end
+        """
+        targets = set()
+        for node in self.nodes:
+            succ = self.absorbable(node)
+            if succ is not None:
+                targets.add(succ)
 
+        merged = set()
+        for node in self.nodes:
+            if node in targets:
+                continue
+            succ = self.absorbable(node)
+            while succ is not None:
+                # drop the jmp to succ and the label of succ
+                node.instrs.pop()
+                node.instrs.extend(islice(succ.instrs, 1, None))
+                node.dests = succ.dests
+                self.edges[node.label] = node.dests
+                for dest in node.dests:
+                    preds = self.preds[dest]
+                    del preds[succ.label]
+                    preds[node.label] = None
+                del self.edges[succ.label]
+                del self.preds[succ.label]
+                del self.labels_to_nodes[succ.label]
+                del self.nodes_to_labels[succ]
+                merged.add(succ)
+                succ = self.absorbable(node)
+
+        if merged:
+            self.nodes = [node for node in self.nodes if node not in merged]
 
     def serialize(self):
+        """
+        Lays the blocks out depth-first from the entry, with those not ending
+        in a jmp, which nothing falls through from, last, and drops the jmps
+        to the label just after them
+        """
         visited=set()
         body=[]
         nl=[self.entry]
@@ -318,28 +506,23 @@ class CFG:
             node=nl.pop()
             if node in visited:
                 continue
-            if len(node.dests)-len(node.cond_jumps)==0:
-                ret_node.append(node)
-                continue
             visited.add(node)
-            body+=node.instrs
+            if node.instrs[-1].opcode != "jmp":
+                ret_node.append(node)
+            else:
+                body+=node.instrs
             nl.extend(self.next_node(node))
         while len(ret_node)>0:
-            node=ret_node.pop()
-            if node in visited:
-                continue
-            visited.add(node)
-            body+=node.instrs
-            body=filter_fallthrough(body)
-        return body
+            body+=ret_node.pop().instrs
+        return filter_fallthrough(body)
 
 def filter_fallthrough(body):
     new_body=[]
     init_length=len(body)
     for i in range(0, init_length):
-        if body[i]["opcode"]=='jmp':
-            arg=body[i]["args"][-1]
-            if body[i+1]["opcode"]=="label" and body[i+1]["args"][-1]==arg:
+        if body[i].opcode=='jmp' and i+1 < init_length:
+            arg=body[i].args[-1]
+            if body[i+1].opcode=="label" and body[i+1].args[-1]==arg:
                 continue
         new_body.append(body[i])
-    return new_body
\ No newline at end of file
+    return new_body
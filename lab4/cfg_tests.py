@@ -1,16 +1,24 @@
 import unittest
 import os
+import sys
 from cfg import *
 from tac_cfopt import *
 
 dirname, filename = os.path.split(os.path.abspath(__file__))
 
+def instr(opcode, args, result=None):
+    return {"opcode": opcode, "args": args, "result": result}
+
+def body_cfg(body):
+    proc = add_labels({"proc": "@main", "body": [Instr.load(i) for i in body]})
+    return CFG(proc["proc"], create_nodes(add_jumps(proc_to_blocks(proc))))
+
 class testUce(unittest.TestCase):
     def setUp(self):
         fname = "./examples/dead_code.tac.json"
 
         with open(fname, 'r') as f:
-            js_obj = json.load(f)
+            js_obj = json.load(f, object_hook=instr_hook)
 
         proc = js_obj[0]
         new_proc = add_labels(proc)
@@ -41,14 +49,101 @@ class testUce(unittest.TestCase):
         self.assertEqual(self.cfg.edges, expected_edges)
         self.assertEqual(len(self.cfg.nodes), 3)
 
+    def test_uce_preds(self):
+        self.cfg.uce()
+        self.assertEqual(self.cfg.prev("%.L4"), ["%.L1"])
+
+    def test_uce_long_chain(self):
+        # deeper than the recursion limit, with a dead block after each jump
+        n = sys.getrecursionlimit() + 1
+        body = []
+        for k in range(n):
+            body.append(instr("label", [f"%.L{k}"]))
+            body.append(instr("jmp", [f"%.L{k+1}"]))
+            body.append(instr("label", [f"%.D{k}"]))
+            body.append(instr("jmp", [f"%.L{k+1}"]))
+        body.append(instr("label", [f"%.L{n}"]))
+        body.append(instr("ret", []))
+        cfg = body_cfg(body)
+        cfg.uce()
+        self.assertEqual(len(cfg.nodes), n + 1)
+        self.assertNotIn("%.D0", cfg.labels_to_nodes)
+        self.assertEqual(cfg.prev("%.L1"), ["%.L0"])
+
+    def tearDown(self):
+        del self.cfg
+
+class testAdjacency(unittest.TestCase):
+    def setUp(self):
+        fname = "./examples/dead_code.tac.json"
+
+        with open(fname, 'r') as f:
+            js_obj = json.load(f, object_hook=instr_hook)
+
+        proc = js_obj[0]
+        new_proc = add_labels(proc)
+        proc_name = new_proc["proc"]
+        blocks = proc_to_blocks(new_proc)
+        blocks = add_jumps(blocks)
+        nodes = create_nodes(blocks)
+        self.cfg = CFG(proc_name, nodes)
+
+    def test_prev_init(self):
+        self.assertEqual(self.cfg.prev("%.L4"), ['%.L1', '%.L3'])
+        self.assertEqual(self.cfg.prev("%.L1"), [])
+
+    def test_prev_after_edge_changes(self):
+        self.cfg.add_edge("%.L1", "%.L2")
+        self.cfg.remove_edge("%.L3", "%.L4")
+        self.assertEqual(self.cfg.prev("%.L2"), ['%.L1'])
+        self.assertEqual(self.cfg.prev("%.L4"), ['%.L1'])
+
+    def test_prev_after_node_changes(self):
+        self.cfg.delete_node("%.L2")
+        self.assertEqual(self.cfg.prev("%.L3"), [])
+        self.cfg.new_node(Node("%.L6", [Instr(None, "label", ["%.L6"]),
+                                        Instr(None, "jmp", ["%.L5"])]))
+        self.assertEqual(self.cfg.prev("%.L5"), ['%.L4', '%.L6'])
+        self.assertIs(self.cfg.labels_to_nodes["%.L6"], self.cfg.nodes[-1])
+
     def tearDown(self):
         del self.cfg
 
+class testJP1(unittest.TestCase):
+    def test_jump_chain(self):
+        cfg = body_cfg([instr("label", ["%.L1"]),
+                        instr("jz", ["%1", "%.L2"]),
+                        instr("jmp", ["%.L4"]),
+                        instr("label", ["%.L2"]),
+                        instr("jmp", ["%.L3"]),
+                        instr("label", ["%.L3"]),
+                        instr("jmp", ["%.L4"]),
+                        instr("label", ["%.L4"]),
+                        instr("ret", [])])
+        # the jz now goes where the jmp after it does, and is dropped
+        self.assertEqual(cfg.jp1(), 2)
+        self.assertEqual([i.js_obj for i in cfg.entry.instrs],
+                         [instr("label", ["%.L1"]), instr("jmp", ["%.L4"])])
+        self.assertEqual(cfg.edges, {"%.L1": ["%.L4"], "%.L4": []})
+        self.assertEqual(cfg.prev("%.L4"), ["%.L1"])
+
+    def test_jump_loop(self):
+        cfg = body_cfg([instr("label", ["%.L1"]),
+                        instr("jz", ["%1", "%.L2"]),
+                        instr("ret", []),
+                        instr("label", ["%.L2"]),
+                        instr("jmp", ["%.L3"]),
+                        instr("label", ["%.L3"]),
+                        instr("jmp", ["%.L2"])])
+        self.assertEqual(cfg.jp1(), 0)
+        self.assertEqual(len(cfg.nodes), 3)
+
+
 class testJP2(unittest.TestCase):
 
     def prepfile(self, fname):
         with open(fname, 'r') as f:
-            js_obj = json.load(f)
+            js_obj = json.load(f, object_hook=instr_hook)
 
         proc = js_obj[0]
         new_proc = add_labels(proc)
@@ -75,7 +170,7 @@ class testJP2(unittest.TestCase):
         node2 = self.cfg1.labels_to_nodes["%.L2"]
         expected_jmp = {"opcode":"jmp", "args":["%.L3"], "result":None}
 
-        self.assertEqual(node2.instrs[1], expected_jmp)
+        self.assertEqual(node2.instrs[1].js_obj, expected_jmp)
         self.assertEqual(len(node2.instrs), 2)
 
     def test_jp2_negated(self):
@@ -85,16 +180,34 @@ class testJP2(unittest.TestCase):
         node2 = self.cfg2.labels_to_nodes["%.L2"]
         expected_jmp = {"opcode":"jmp", "args":["%.L30"], "result":None}
 
-        self.assertEqual(node2.instrs[1], expected_jmp)
+        self.assertEqual(node2.instrs[1].js_obj, expected_jmp)
         self.assertEqual(len(node2.instrs), 2)
 
+    def test_jp2_count(self):
+        self.assertEqual(self.cfg2.jp2(), 1)
+        self.assertEqual(self.cfg2.jp2(), 0)
+
+    def test_two_ways_in(self):
+        # %.L2 is reached when %1 is zero or negative
+        cfg = body_cfg([instr("label", ["%.L1"]),
+                        instr("jz", ["%1", "%.L2"]),
+                        instr("jl", ["%1", "%.L2"]),
+                        instr("ret", []),
+                        instr("label", ["%.L2"]),
+                        instr("jnz", ["%1", "%.L3"]),
+                        instr("ret", []),
+                        instr("label", ["%.L3"]),
+                        instr("ret", [])])
+        self.assertEqual(cfg.jp2(), 0)
+        self.assertEqual(len(cfg.nodes), 3)
+
     def test_updating_temporary(self):
         self.cfg3.jp2()
         self.assertEqual(len(self.cfg2.nodes), 5)
 
         node2 = self.cfg3.labels_to_nodes["%.L2"]
         expected_jmp = {"opcode":"jz", "args":["%1", "%.L3"], "result":None}
-        self.assertEqual(node2.instrs[2], expected_jmp)
+        self.assertEqual(node2.instrs[2].js_obj, expected_jmp)
         self.assertEqual(len(node2.instrs), 4)
 
 
@@ -108,7 +221,7 @@ class testCoalescing(unittest.TestCase):
     
     def prepfile(self, fname):
         with open(fname, 'r') as f:
-            js_obj = json.load(f)
+            js_obj = json.load(f, object_hook=instr_hook)
 
         proc = js_obj[0]
         new_proc = add_labels(proc)
@@ -126,6 +239,20 @@ class testCoalescing(unittest.TestCase):
         self.assertEqual(len(self.cfg1.nodes), 5)
         self.cfg1.coalesce()
         self.assertEqual(len(self.cfg1.nodes), 3)
+
+    def test_coalesce_chain(self):
+        body = []
+        for k in range(50):
+            body.append(instr("label", [f"%.L{k}"]))
+            body.append(instr("print", ["%0"]))
+            body.append(instr("jmp", [f"%.L{k+1}"]))
+        body.append(instr("label", ["%.L50"]))
+        body.append(instr("ret", []))
+        cfg = body_cfg(body)
+        cfg.coalesce()
+        self.assertEqual(len(cfg.nodes), 1)
+        self.assertEqual(cfg.edges, {cfg.entry.label: []})
+        self.assertEqual(len(cfg.entry.instrs), 1 + 50 + 1)
     
     def tearDown(self):
         del self.cfg1
@@ -135,7 +262,7 @@ class testSerialization(unittest.TestCase):
     
     def prepfile(self, fname):
         with open(fname, 'r') as f:
-            js_obj = json.load(f)
+            js_obj = json.load(f, object_hook=instr_hook)
 
         proc = js_obj[0]
         new_proc = add_labels(proc)
@@ -164,13 +291,13 @@ class testSerialization(unittest.TestCase):
         jmp_count_init = 0
         for node in self.cfg1.nodes:
             for instr in node.instrs:
-                if instr["opcode"] == "jmp":
+                if instr.opcode == "jmp":
                     jmp_count_init += 1
         self.assertEqual(jmp_count_init, 3)
 
         jmp_count = 0
         for line in res:
-            if line["opcode"] == "jmp":
+            if line.opcode == "jmp":
                 jmp_count += 1
         
         self.assertEqual(jmp_count, 2)
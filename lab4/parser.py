@@ -2,6 +2,7 @@ from os import scandir
 import ply.yacc as yacc
 import bxast as bxast
 import sys
+import plytab
 from scanner import tokens
 
 # Program
@@ -347,4 +348,4 @@ precedence = (
     ('right', 'BITCOMPL')
 )
 
-parser = yacc.yacc(start='program')
+parser = plytab.yacc(sys.modules[__name__], 'lab4_parser_parsetab', start='program')
@@ -0,0 +1,413 @@
+"""
+Peephole optimization of x64 assembly (AT&T syntax)
+
+The assembly lines are parsed into Insn objects, rewritten by the
+functions in `patterns' until none of them applies, and printed back.
+Every pattern is local: it looks at a few neighbouring instructions, or
+at the instructions of one basic block, and assumes that distinct memory
+operands do not overlap, which holds for the operands tac_to_asm() uses:
+the stack slots addressed from %rbp, the outgoing arguments addressed
+from %rsp (which does not move in the body of a procedure) and the
+globals addressed from %rip.
+"""
+
+import re
+
+class Insn:
+    """An instruction `opcode' with its operands `args' as AT&T strings,
+    destination last; a label has the opcode None and its name as only
+    argument"""
+
+    __slots__ = ('opcode', 'args')
+
+    def __init__(self, opcode, *args):
+        self.opcode = opcode
+        self.args = args
+
+    @staticmethod
+    def parse(line):
+        line = line.strip()
+        if line.endswith(':'): return Insn(None, line[:-1])
+        opcode, _, rest = line.partition(' ')
+        # the commas inside parentheses separate the parts of an address
+        args = re.findall(r'(?:[^,(]|\([^)]*\))+', rest)
+        return Insn(opcode, *(arg.strip() for arg in args))
+
+    def __str__(self):
+        if self.opcode is None: return f'{self.args[0]}:'
+        if len(self.args) == 0: return self.opcode
+        return f'{self.opcode} {", ".join(self.args)}'
+
+    def __repr__(self):
+        return f'Insn({self.opcode!r}, {", ".join(map(repr, self.args))})'
+
+    def __eq__(self, other):
+        return isinstance(other, Insn) and \
+            self.opcode == other.opcode and self.args == other.args
+
+    def is_label(self):
+        return self.opcode is None
+
+    def is_jump(self):
+        return self.opcode is not None and self.opcode.startswith('j')
+
+    def is_cond_jump(self):
+        return self.is_jump() and self.opcode != 'jmp'
+
+def is_reg(arg): return arg.startswith('%')
+def is_imm(arg): return arg.startswith('$')
+def is_mem(arg): return not is_reg(arg) and not is_imm(arg)
+def _registers(arg): return re.findall(r'%\w+', arg)
+
+caller_saved = ('%rax', '%rcx', '%rdx', '%rsi', '%rdi',
+                '%r8', '%r9', '%r10', '%r11')
+# the implicit operands of some instructions
+_implicit_reads = {'cqto': ('%rax',), 'idivq': ('%rax', '%rdx'),
+                   'retq': ('%rax', '%rsp'), 'callq': caller_saved + ('%rsp',),
+                   'pushq': ('%rsp',), 'popq': ('%rsp',)}
+# a call may also read and write the memory of its stack arguments and of
+# the globals, addressed from these registers
+_call_memory = ('%rsp', '%rip')
+_implicit_writes = {'cqto': ('%rdx',), 'idivq': ('%rax', '%rdx'),
+                    'callq': caller_saved + _call_memory}
+# the byte registers that name part of a 64-bit one
+_low_bytes = {'%rax': '%al', '%rcx': '%cl', '%rdx': '%dl', '%rbx': '%bl'}
+_no_writes = frozenset(('cmpq', 'testq', 'pushq', 'retq'))
+_single_dest = frozenset(('negq', 'notq', 'incq', 'decq', 'popq'))
+
+def writes(insn):
+    """The operands written by `insn'"""
+    if insn.is_label() or insn.is_jump() or insn.opcode in _no_writes: return ()
+    if insn.opcode in _implicit_writes: return _implicit_writes[insn.opcode]
+    if insn.opcode == 'imulq' and len(insn.args) == 1: return ('%rax', '%rdx')
+    if insn.opcode in _single_dest: return insn.args
+    return insn.args[-1:]
+
+def reads(insn, loc):
+    """Whether `insn' may read the operand `loc' (a register or a memory
+    operand)"""
+    if insn.opcode in _implicit_reads and loc in _implicit_reads[insn.opcode]:
+        return True
+    if insn.opcode == 'imulq' and len(insn.args) == 1 and loc == '%rax':
+        return True
+    if insn.opcode == 'callq' and is_mem(loc) and any(r in loc for r in _call_memory):
+        return True
+    args = insn.args
+    if insn.opcode in ('movq', 'leaq') and args[-1] == loc:
+        args = args[:-1]
+    low = _low_bytes.get(loc, loc)
+    return any(loc in arg or low in arg for arg in args)
+
+def dead_after(code, i, loc):
+    """Whether the operand `loc' is overwritten after `code[i]' before
+    being read, without leaving the block"""
+    for j in range(i + 1, len(code)):
+        insn = code[j]
+        if insn.is_label() or insn.is_jump() or insn.opcode == 'retq':
+            return False
+        if reads(insn, loc): return False
+        if loc in writes(insn): return True
+    return False
+
+_no_flags = frozenset(('movq', 'leaq', 'notq'))
+_sets_flags = frozenset(('cmpq', 'testq', 'addq', 'subq', 'andq', 'orq', 'xorq',
+                         'negq', 'incq', 'decq', 'imulq', 'callq'))
+
+def flags_dead_after(code, i):
+    """Whether the flags are set again after `code[i]' before being read,
+    without leaving the block"""
+    for j in range(i + 1, len(code)):
+        insn = code[j]
+        if insn.is_label() or insn.is_jump() or insn.opcode == 'retq':
+            return False
+        if insn.opcode in _sets_flags: return True
+    return False
+
+# ------------------------------------------------------------------------------
+# patterns: each takes the list of Insn and returns the new list, or None
+# if it changed nothing
+
+_commutative = frozenset(('addq', 'andq', 'orq', 'xorq'))
+_arith = _commutative | {'subq'}
+
+def redundant_moves(code):
+    """Remove `movq X, X', the second move of `movq A, B; movq B, A', and a
+    move to a register overwritten right after without being read. Forward
+    a store to a load from the same location, and a move through a
+    register that dies right away."""
+    out = []
+    changed = False
+    for i, insn in enumerate(code):
+        prev = out[-1] if out else None
+        if insn.opcode == 'movq':
+            src, dst = insn.args
+            if src == dst:
+                changed = True
+                continue
+            if prev is not None and prev.opcode == 'movq':
+                psrc, pdst = prev.args
+                if psrc == dst and pdst == src:
+                    changed = True
+                    continue
+                if pdst == dst and is_reg(dst) and dst not in src:
+                    out[-1] = insn
+                    changed = True
+                    continue
+                if is_reg(pdst) and src == pdst and dead_after(code, i, pdst) \
+                   and not (is_mem(psrc) and is_mem(dst)):
+                    out[-1] = Insn('movq', psrc, dst)
+                    changed = True
+                    continue
+                if is_reg(psrc) and is_mem(pdst) and src == pdst and is_reg(dst):
+                    insn = Insn('movq', psrc, dst)
+                    changed = True
+        out.append(insn)
+    return out if changed else None
+
+def redundant_loads(code):
+    """Remove a `movq X, R' when the register R already holds the value of
+    X, because of an earlier move between them in the block with neither
+    of them written since"""
+    out = []
+    changed = False
+    equal = set()       # (register, operand) known to hold the same value
+    for insn in code:
+        if insn.opcode == 'movq' and (insn.args[1], insn.args[0]) in equal:
+            changed = True
+            continue
+        if insn.is_label():
+            equal.clear()
+        else:
+            for w in writes(insn):
+                equal = {(r, x) for r, x in equal if r != w and w not in x}
+            if insn.opcode == 'movq':
+                src, dst = insn.args
+                if is_reg(dst) and dst not in src: equal.add((dst, src))
+                if is_reg(src) and src not in dst: equal.add((src, dst))
+        out.append(insn)
+    return out if changed else None
+
+def dead_stores(code):
+    """Remove a `movq X, M' to memory overwritten later in the block before
+    being read. The blocks are scanned backwards, collecting the memory
+    operands overwritten before being read; they are indexed by the
+    registers of their address, forgotten when one of these is written."""
+    out = []
+    dead = set()
+    users = dict()      # register -> the operands of `dead' addressed from it
+    def forget(operands):
+        for m in list(operands):
+            dead.discard(m)
+            for r in _registers(m): users[r].discard(m)
+    for insn in reversed(code):
+        if insn.is_label() or insn.is_jump() or insn.opcode == 'retq':
+            dead.clear()
+            users.clear()
+        elif insn.opcode == 'movq' and insn.args[1] in dead:
+            continue
+        else:
+            forget(arg for arg in insn.args if arg in dead)
+            if insn.opcode == 'callq':
+                forget(m for r in _call_memory for m in users.get(r, ()))
+            for w in writes(insn): forget(users.get(w, ()))
+            if insn.opcode == 'movq' and is_mem(insn.args[1]):
+                dead.add(insn.args[1])
+                for r in _registers(insn.args[1]):
+                    users.setdefault(r, set()).add(insn.args[1])
+        out.append(insn)
+    out.reverse()
+    return out if len(out) != len(code) else None
+
+def dead_code(code):
+    """Remove an instruction whose only effect is to write registers that are
+    dead after it, and flags that are set again before being read"""
+    out = []
+    for i, insn in enumerate(code):
+        dests = writes(insn)
+        if insn.opcode in _no_flags | _arith and len(dests) > 0 and \
+           all(is_reg(d) and dead_after(code, i, d) for d in dests) and \
+           (insn.opcode in _no_flags or flags_dead_after(code, i)):
+            continue
+        out.append(insn)
+    return out if len(out) != len(code) else None
+
+def fold_scratch(code):
+    """Compute `movq A, R; OP B, R; movq R, D' directly in D, when the
+    register R dies: as `OP B, A' if D is A (or `OP A, B' if D is B and OP
+    commutes), else as `movq A, D; OP B, D'. The same for `negq' and
+    `notq'."""
+    out = []
+    changed = False
+    i = 0
+    while i < len(code):
+        seq = code[i:i + 3]
+        if len(seq) == 3 and seq[0].opcode == 'movq' and seq[2].opcode == 'movq':
+            (a, r), (s, d) = seq[0].args, seq[2].args
+            op = seq[1]
+            if is_reg(r) and s == r and r not in a and r not in d \
+               and dead_after(code, i + 2, r):
+                new = None
+                if op.opcode in _arith and op.args[1] == r and r not in op.args[0]:
+                    b = op.args[0]
+                    if d == a and not (is_mem(a) and is_mem(b)):
+                        new = [Insn(op.opcode, b, a)]
+                    elif d == b and op.opcode in _commutative and \
+                         not (is_mem(a) and is_mem(b)):
+                        new = [Insn(op.opcode, a, b)]
+                    elif d not in b and not is_mem(d):
+                        new = [Insn('movq', a, d), Insn(op.opcode, b, d)]
+                elif op.opcode in ('negq', 'notq') and op.args == (r,):
+                    if d == a: new = [Insn(op.opcode, a)]
+                    elif not (is_mem(a) and is_mem(d)):
+                        new = [Insn('movq', a, d), Insn(op.opcode, d)]
+                if new is not None:
+                    out.extend(new)
+                    changed = True
+                    i += 3
+                    continue
+        out.append(code[i])
+        i += 1
+    return out if changed else None
+
+# the flags after these set ZF and SF from the result as `cmpq $0' does;
+# after the logical ones OF is cleared as well, so any condition agrees
+_zf_setters = frozenset(('addq', 'subq', 'negq', 'incq', 'decq'))
+_flag_setters = frozenset(('andq', 'orq', 'xorq'))
+_zf_jumps = frozenset(('jz', 'jnz', 'je', 'jne'))
+
+def reuse_flags(code):
+    """Remove a `cmpq $0, X' when the flags were last set by the
+    instruction computing the value of X, only moved around since; for
+    an addition or subtraction the overflow flag may differ, so the
+    following conditional jumps must only test for zero."""
+    out = []
+    changed = False
+    for i, insn in enumerate(code):
+        if insn.opcode == 'cmpq' and insn.args[0] == '$0':
+            loc = insn.args[1]
+            j = len(out) - 1
+            while j >= 0 and out[j].opcode == 'movq':
+                if out[j].args[1] == loc: loc = out[j].args[0]
+                j -= 1
+            setter = out[j] if j >= 0 else None
+            conds = []
+            for j in range(i + 1, len(code)):
+                nxt = code[j]
+                if not nxt.is_cond_jump(): break
+                conds.append(nxt.opcode)
+            if setter is not None and writes(setter) == (loc,) and len(conds) > 0 and \
+               (setter.opcode in _flag_setters or
+                setter.opcode in _zf_setters and all(c in _zf_jumps for c in conds)):
+                changed = True
+                continue
+        out.append(insn)
+    return out if changed else None
+
+_inverse = {'jz': 'jnz', 'je': 'jne', 'jl': 'jnl', 'jle': 'jnle',
+            'jg': 'jng', 'jge': 'jnge'}
+_inverse.update({v: k for k, v in _inverse.items()})
+
+def thread_jumps(code):
+    """Retarget the jumps to a label followed by `jmp M' to M, remove the
+    jumps to the label right after them, turn `jcc L1; jmp L2; L1:' into
+    `jncc L2; L1:', and drop the code after an unconditional jump up to
+    the next label as well as the local labels no jump refers to."""
+    changed = False
+    # label -> the target of the jmp following it, if any
+    forward = dict()
+    for i, insn in enumerate(code):
+        if insn.is_label():
+            k = i + 1
+            while k < len(code) and code[k].is_label(): k += 1
+            if k < len(code) and code[k].opcode == 'jmp':
+                forward[insn.args[0]] = code[k].args[0]
+    def final(lab):
+        seen = {lab}
+        while lab in forward and forward[lab] not in seen:
+            lab = forward[lab]
+            seen.add(lab)
+        return lab
+    out = []
+    dead = False
+    for i, insn in enumerate(code):
+        if insn.is_label(): dead = False
+        elif dead:
+            changed = True
+            continue
+        if insn.is_jump():
+            lab = final(insn.args[0])
+            if lab != insn.args[0]:
+                insn = Insn(insn.opcode, lab)
+                changed = True
+            k = i + 1
+            while k < len(code) and code[k].is_label():
+                if code[k].args[0] == lab: break
+                k += 1
+            if k < len(code) and code[k].is_label():
+                changed = True
+                continue
+            if insn.opcode == 'jmp' and len(out) > 0 and out[-1].is_cond_jump() and \
+               out[-1].opcode in _inverse and i + 1 < len(code) and \
+               code[i + 1].is_label() and code[i + 1].args[0] == out[-1].args[0]:
+                out[-1] = Insn(_inverse[out[-1].opcode], lab)
+                changed = True
+                continue
+        if insn.opcode in ('jmp', 'retq'): dead = True
+        out.append(insn)
+    targets = {insn.args[0] for insn in out if insn.is_jump()}
+    kept = [insn for insn in out if not insn.is_label() or
+            not insn.args[0].startswith('.L') or insn.args[0] in targets]
+    if len(kept) != len(out): changed = True
+    return kept if changed else None
+
+def reduce_strength(code):
+    """Replace a multiplication by a power of two by a left shift: an
+    `imulq $2^k, R', or a one-operand `imulq X' where X is known to hold
+    2^k in the block (%rdx is then left alone instead of getting the high
+    half of the product, which tac_to_asm() never reads)."""
+    out = []
+    changed = False
+    known = dict()      # operand -> constant it holds
+    def shift(value):
+        if not isinstance(value, int) or value <= 0 or value & (value - 1): return None
+        return value.bit_length() - 1
+    for insn in code:
+        if insn.opcode == 'imulq':
+            k = None
+            if len(insn.args) == 1:
+                k = shift(known.get(insn.args[0]))
+                if k is not None:
+                    insn = Insn('salq', f'${k}', '%rax') if k > 0 else None
+            elif len(insn.args) == 2 and is_imm(insn.args[0]):
+                k = shift(int(insn.args[0][1:]))
+                if k is not None:
+                    insn = Insn('salq', f'${k}', insn.args[1]) if k > 0 else None
+            if k is not None:
+                changed = True
+                if insn is None: continue
+        if insn.is_label() or insn.opcode == 'callq':
+            known.clear()
+        else:
+            for w in writes(insn):
+                for loc in [loc for loc in known if w in loc]: del known[loc]
+            if insn.opcode == 'movq' and is_imm(insn.args[0]):
+                try: known[insn.args[1]] = int(insn.args[0][1:])
+                except ValueError: pass
+        out.append(insn)
+    return out if changed else None
+
+patterns = [reduce_strength, fold_scratch, redundant_moves, redundant_loads,
+            dead_stores, dead_code, reuse_flags, thread_jumps]
+
+def optimize(lines):
+    """Apply the patterns to the assembly `lines' until none applies"""
+    code = [Insn.parse(line) for line in lines]
+    changed = True
+    while changed:
+        changed = False
+        for pattern in patterns:
+            new = pattern(code)
+            if new is not None:
+                code = new
+                changed = True
+    return [str(insn) for insn in code]
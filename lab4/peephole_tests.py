@@ -0,0 +1,127 @@
+import unittest
+from peephole import *
+
+def parse(lines):
+    return [Insn.parse(line) for line in lines]
+
+class testInsn(unittest.TestCase):
+    def test_parse_round_trip(self):
+        for line in ["movq -8(%rbp), %r11", "leaq .lprintfmt(%rip), %rdi",
+                     "movq (%rax,%rcx,8), %rdx", "cqto", ".L1:"]:
+            self.assertEqual(str(Insn.parse(line)), line)
+
+    def test_address_is_one_operand(self):
+        self.assertEqual(Insn.parse("movq (%rax,%rcx,8), %rdx").args,
+                         ("(%rax,%rcx,8)", "%rdx"))
+
+    def test_shift_count_reads_rcx(self):
+        self.assertTrue(reads(Insn.parse("salq %cl, %r11"), "%rcx"))
+
+class testMoves(unittest.TestCase):
+    def test_self_move(self):
+        code = parse(["movq %rax, %rax", "retq"])
+        self.assertEqual(redundant_moves(code), parse(["retq"]))
+
+    def test_store_then_load(self):
+        code = parse(["movq %rsi, -8(%rbp)", "movq -8(%rbp), %rsi", "retq"])
+        self.assertEqual(optimize(map(str, code)), ["movq %rsi, -8(%rbp)", "retq"])
+
+    def test_reload_after_store(self):
+        code = parse(["movq -8(%rbp), %r11", "movq %r11, -16(%rbp)",
+                      "movq -8(%rbp), %r11", "notq %r11", "movq %r11, -24(%rbp)"])
+        self.assertEqual(redundant_loads(code),
+                         parse(["movq -8(%rbp), %r11", "movq %r11, -16(%rbp)",
+                                "notq %r11", "movq %r11, -24(%rbp)"]))
+
+    def test_reload_after_write_kept(self):
+        code = parse(["movq -8(%rbp), %r11", "notq %r11", "movq -8(%rbp), %r11"])
+        self.assertIsNone(redundant_loads(code))
+
+    def test_dead_store(self):
+        code = parse(["movq $1, -8(%rbp)", "movq $2, -8(%rbp)", "retq"])
+        self.assertEqual(dead_stores(code), parse(["movq $2, -8(%rbp)", "retq"]))
+
+    def test_store_read_before_overwrite_kept(self):
+        code = parse(["movq $1, -8(%rbp)", "addq -8(%rbp), %rax",
+                      "movq $2, -8(%rbp)", "retq"])
+        self.assertIsNone(dead_stores(code))
+
+    def test_global_store_before_call_kept(self):
+        code = parse(["movq $1, g(%rip)", "callq f", "movq $2, g(%rip)", "retq"])
+        self.assertIsNone(dead_stores(code))
+
+    def test_global_reload_after_call_kept(self):
+        code = parse(["movq g(%rip), %rbx", "callq f", "movq g(%rip), %rbx"])
+        self.assertIsNone(redundant_loads(code))
+
+class testFold(unittest.TestCase):
+    def test_in_place(self):
+        code = parse(["movq -8(%rbp), %r11", "addq $1, %r11",
+                      "movq %r11, -8(%rbp)", "movq $0, %r11"])
+        self.assertEqual(fold_scratch(code),
+                         parse(["addq $1, -8(%rbp)", "movq $0, %r11"]))
+
+    def test_live_scratch_kept(self):
+        code = parse(["movq -8(%rbp), %r11", "addq $1, %r11",
+                      "movq %r11, -8(%rbp)", "movq %r11, %rsi"])
+        self.assertIsNone(fold_scratch(code))
+
+    def test_dead_computation(self):
+        code = parse(["movq -8(%rbp), %r11", "notq %r11", "movq $0, %r11", "retq"])
+        self.assertEqual(optimize(map(str, code)), ["movq $0, %r11", "retq"])
+
+    def test_stack_pointer_kept(self):
+        code = parse(["subq $16, %rsp", "callq printf@PLT",
+                      "movq %rbp, %rsp", "popq %rbp", "retq"])
+        self.assertIsNone(dead_code(code))
+
+class testFlags(unittest.TestCase):
+    def test_logical_result_compared(self):
+        code = parse(["andq %rsi, %rdi", "cmpq $0, %rdi", "jl .L1"])
+        self.assertEqual(reuse_flags(code), parse(["andq %rsi, %rdi", "jl .L1"]))
+
+    def test_subtraction_zero_test(self):
+        code = parse(["subq %rsi, %rdi", "movq %rdi, -8(%rbp)",
+                      "cmpq $0, -8(%rbp)", "jz .L1"])
+        self.assertEqual(reuse_flags(code),
+                         parse(["subq %rsi, %rdi", "movq %rdi, -8(%rbp)", "jz .L1"]))
+
+    def test_subtraction_sign_test_kept(self):
+        # the overflow flag of subq is not that of cmpq $0
+        code = parse(["subq %rsi, %rdi", "cmpq $0, %rdi", "jl .L1"])
+        self.assertIsNone(reuse_flags(code))
+
+class testJumps(unittest.TestCase):
+    def test_jump_to_next(self):
+        code = parse(["jmp .L1", ".L1:", "retq"])
+        self.assertEqual(thread_jumps(code), parse(["retq"]))
+
+    def test_jump_chain(self):
+        code = parse(["jz .L1", "retq", ".L1:", "jmp .L2", ".L2:", "retq"])
+        self.assertEqual(optimize(map(str, code)), ["jz .L2", "retq", ".L2:", "retq"])
+
+    def test_inverted_branch(self):
+        code = parse(["jl .L1", "jmp .L2", ".L1:", "incq %rax", ".L2:", "retq"])
+        self.assertEqual(thread_jumps(code),
+                         parse(["jnl .L2", "incq %rax", ".L2:", "retq"]))
+
+    def test_unreachable_code(self):
+        code = parse(["jmp .L1", "incq %rax", ".L2:", "decq %rax", ".L1:", "retq"])
+        self.assertEqual(optimize(map(str, code)), ["retq"])
+
+class testStrength(unittest.TestCase):
+    def test_immediate_power_of_two(self):
+        code = parse(["imulq $8, %r11"])
+        self.assertEqual(reduce_strength(code), parse(["salq $3, %r11"]))
+
+    def test_known_power_of_two(self):
+        code = parse(["movq $4, -8(%rbp)", "imulq -8(%rbp)"])
+        self.assertEqual(reduce_strength(code),
+                         parse(["movq $4, -8(%rbp)", "salq $2, %rax"]))
+
+    def test_other_constant_kept(self):
+        code = parse(["movq $6, -8(%rbp)", "imulq -8(%rbp)"])
+        self.assertIsNone(reduce_strength(code))
+
+if __name__ == '__main__':
+    unittest.main()
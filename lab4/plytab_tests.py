@@ -0,0 +1,74 @@
+import unittest
+import os
+import tempfile
+from unittest import mock
+import plytab
+
+class Calc:
+    tokens = ('NUMBER', 'PLUS', 'TIMES')
+    precedence = (('left', 'PLUS'), ('left', 'TIMES'))
+    t_ignore = ' '
+    t_PLUS = r'\+'
+    t_TIMES = r'\*'
+
+    def t_NUMBER(self, t):
+        r'[0-9]+'
+        t.value = int(t.value)
+        return t
+
+    def t_error(self, t):
+        t.lexer.skip(1)
+
+    def p_number(self, p):
+        """expr : NUMBER"""
+        p[0] = p[1]
+
+    def p_binop(self, p):
+        """expr : expr PLUS expr
+                | expr TIMES expr"""
+        p[0] = p[1] + p[3] if p[2] == '+' else p[1] * p[3]
+
+    def p_error(self, p):
+        raise SyntaxError(p)
+
+    def calc(self, text):
+        lexer = plytab.lex(self, 'calc_lextab')
+        parser = plytab.yacc(self, 'calc_parsetab', start='expr')
+        return parser.parse(text, lexer=lexer)
+
+class testTables(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        os.environ['PLYTAB_DIR'] = self.dir.name
+        plytab.loaded.clear()
+
+    def test_tables_written_then_read(self):
+        self.assertEqual(Calc().calc('1 + 2 * 3'), 7)
+        self.assertEqual(sorted(os.listdir(self.dir.name)),
+                         ['calc_lextab.py', 'calc_parsetab.py'])
+        plytab.loaded.clear()
+        self.assertEqual(Calc().calc('2 * 3 + 1'), 7)
+        self.assertEqual(len(plytab.loaded), 2)
+
+    def test_stale_tables_ignored(self):
+        Calc().calc('1')
+        class Calc2(Calc):
+            precedence = (('left', 'TIMES'), ('left', 'PLUS'))
+        self.assertEqual(Calc2().calc('1 + 2 * 3'), 9)
+
+    def test_stale_tables_rewritten_once(self):
+        Calc().calc('1')
+        class Calc2(Calc):
+            precedence = (('left', 'TIMES'), ('left', 'PLUS'))
+        with mock.patch.object(plytab, 'write_tab', wraps=plytab.write_tab) as write_tab:
+            for _ in range(3):
+                self.assertEqual(Calc2().calc('1 + 2 * 3'), 9)
+        # both tables, as the precedence is in the signature of each
+        self.assertEqual(write_tab.call_count, 2)
+
+    def tearDown(self):
+        del os.environ['PLYTAB_DIR']
+        self.dir.cleanup()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,6 +7,7 @@ Created on Wed Sep 20 12:35:30 2021
 import re
 import ply.lex as lex
 import sys
+import plytab
 
 
 reserved = {
@@ -96,7 +97,7 @@ def t_error(t):
 
 # lexer instance (object)
 
-lexer = lex.lex()
+lexer = plytab.lex(sys.modules[__name__], 'lab4_scanner_lextab')
 
 def loadsrc(text):
     """Load some source code directly into the lexer"""
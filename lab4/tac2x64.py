@@ -8,9 +8,10 @@ Requires: a working gcc
 """
 
 import json
-import sys
 import os
-from pathlib import Path
+import sys
+from bisect import bisect_left
+import peephole
 
 binops = {'add': 'addq',
           'sub': 'subq',
@@ -56,24 +57,314 @@ jump_map = { 'jmp': (lambda ld: f"jmp {ld}"),
                                   f"jnle %rax, {rd}"]) }
 
 
-arg_reg={'%rdi':0, '%rsi':0, '%rdx':0, '%rcx':0, '%r8':0, '%r9':0}
+# the registers of the first six arguments of a call (System V AMD64 ABI);
+# the others are passed on the stack
+arg_regs = ['%rdi', '%rsi', '%rdx', '%rcx', '%r8', '%r9']
 
 def lookup_temp(temp, temp_map):
+  """The location of the temporary or global `temp': a global lives in the
+  data section, a temporary where `temp_map' puts it, or else in a new
+  stack slot"""
   assert (isinstance(temp, str) and \
-          temp[0] == '%' and \
-          temp[1:].isnumeric()), temp
+          temp[0] in '%@' and \
+          not temp.startswith('%.')), temp
+  if temp[0] == '@': return f'{temp[1:]}(%rip)'
   return temp_map.setdefault(temp, f'{-8 * (len(temp_map) + 1)}(%rbp)')
 
-def tac_to_asm(tac_instrs):
+def in_memory(loc):
+  return loc.endswith(')')
+
+def move(src, dst):
+  """The instructions copying `src' to `dst', through %r11 if both are in
+  memory"""
+  if src == dst: return []
+  if in_memory(src) and in_memory(dst):
+    return [f'movq {src}, %r11', f'movq %r11, {dst}']
+  return [f'movq {src}, {dst}']
+
+def parallel_moves(moves):
+  """The instructions doing all the moves (src, dst) of `moves' at once.
+  The destinations are distinct, the sources in memory are not among them
+  and %r11 is free; a cycle of register moves is broken through %r11."""
+  moves = [(src, dst) for src, dst in moves if src != dst]
+  from_memory = [(src, dst) for src, dst in moves if in_memory(src)]
+  moves = [(src, dst) for src, dst in moves if not in_memory(src)]
+  asm = []
+  while len(moves) > 0:
+    sources = {src for src, _ in moves}
+    ready = next(((src, dst) for src, dst in moves if dst not in sources), None)
+    if ready is None:
+      dst = moves[0][1]
+      asm.append(f'movq {dst}, %r11')
+      moves = [('%r11' if src == dst else src, d) for src, d in moves]
+      continue
+    moves.remove(ready)
+    asm.extend(move(*ready))
+  for src, dst in from_memory: asm.extend(move(src, dst))
+  return asm
+
+# ------------------------------------------------------------------------------
+# register allocation
+
+# %rax, %rcx, %rdx and %r11 are used as scratch registers by the instruction
+# patterns above; printf (called by print) may clobber the caller-saved ones
+caller_saved = ['%rsi', '%rdi', '%r8', '%r9', '%r10']
+callee_saved = ['%rbx', '%r12', '%r13', '%r14', '%r15']
+
+def is_temp(arg):
+  return isinstance(arg, str) and arg.startswith('%') and not arg.startswith('%.')
+
+def instr_uses(instr):
+  """The temporaries read by `instr'"""
+  return [arg for arg in instr['args'] if is_temp(arg)]
+
+def instr_defs(instr):
+  """The temporaries written by `instr'"""
+  return [instr['result']] if is_temp(instr.get('result')) else []
+
+def successors(tac_instrs):
+  """For each instruction of `tac_instrs', the list of the indices of the
+  instructions that can run after it"""
+  labels = {instr['args'][0]: i for i, instr in enumerate(tac_instrs) \
+            if instr['opcode'] == 'label'}
+  succs = []
+  for i, instr in enumerate(tac_instrs):
+    opcode = instr['opcode']
+    if opcode == 'jmp':
+      succs.append([labels[instr['args'][0]]])
+      continue
+    if opcode == 'ret':
+      succs.append([])
+      continue
+    succ = []
+    if opcode in jump_list: succ.append(labels[instr['args'][1]])
+    if i + 1 < len(tac_instrs): succ.append(i + 1)
+    succs.append(succ)
+  return succs
+
+def liveness(tac_instrs):
+  """The lists of the sets of temporaries live in and live out of each
+  instruction of `tac_instrs'"""
+  succs = successors(tac_instrs)
+  uses = [set(instr_uses(instr)) for instr in tac_instrs]
+  defs = [set(instr_defs(instr)) for instr in tac_instrs]
+  live_in = [set() for _ in tac_instrs]
+  live_out = [set() for _ in tac_instrs]
+  changed = True
+  while changed:
+    changed = False
+    for i in reversed(range(len(tac_instrs))):
+      out = set()
+      for j in succs[i]: out |= live_in[j]
+      new_in = uses[i] | (out - defs[i])
+      if out != live_out[i] or new_in != live_in[i]:
+        live_out[i], live_in[i] = out, new_in
+        changed = True
+  return live_in, live_out
+
+def live_intervals(tac_instrs):
+  """The live interval [start, end] of every temporary of `tac_instrs'.
+  Instruction i reads its arguments at position 2i and writes its result
+  at 2i+1, so a result can share a location with an argument read last
+  by the same instruction."""
+  live_in, live_out = liveness(tac_instrs)
+  intervals = dict()
+  def extend(t, pos):
+    iv = intervals.setdefault(t, [pos, pos])
+    iv[0], iv[1] = min(iv[0], pos), max(iv[1], pos)
+  for i, instr in enumerate(tac_instrs):
+    for t in live_in[i]: extend(t, 2 * i)
+    for t in instr_defs(instr): extend(t, 2 * i + 1)
+    for t in live_out[i]: extend(t, 2 * i + 1)
+  return intervals
+
+def is_call(instr):
+  """Whether `instr' calls a function, which may clobber the caller-saved
+  registers"""
+  return instr['opcode'] in ('call', 'print')
+
+def stack_alloc(tac_instrs):
+  """No allocation: tac_to_asm() gives each temporary its own stack slot"""
+  return dict()
+
+def linear_scan(tac_instrs):
+  """Map the temporaries of `tac_instrs' to registers or stack slots by
+  linear scan over their live intervals (Poletto and Sarkar). The
+  intervals live across a call only get callee-saved registers. Under
+  pressure, the interval ending last among the current one and those
+  holding a suitable register is spilled to a stack slot."""
+  intervals = live_intervals(tac_instrs)
+  calls = [2 * i for i, instr in enumerate(tac_instrs) if is_call(instr)]
+  temp_map = dict()
+  active = []     # (end, temp) for the intervals currently in registers
+  free = caller_saved + callee_saved
+  nslots = 0
+  def spill(t):
+    nonlocal nslots
+    nslots += 1
+    temp_map[t] = f'{-8 * nslots}(%rbp)'
+  for t, (start, end) in sorted(intervals.items(), key=lambda item: item[1][0]):
+    for item in [item for item in active if item[0] < start]:
+      active.remove(item)
+      free.append(temp_map[item[1]])
+    k = bisect_left(calls, start)
+    pool = callee_saved if k < len(calls) and calls[k] < end \
+           else caller_saved + callee_saved
+    reg = next((r for r in pool if r in free), None)
+    if reg is not None:
+      free.remove(reg)
+    else:
+      victim = max(((e, u) for e, u in active if temp_map[u] in pool), default=None)
+      if victim is None or victim[0] <= end:
+        spill(t)
+        continue
+      active.remove(victim)
+      reg = temp_map[victim[1]]
+      spill(victim[1])
+    temp_map[t] = reg
+    active.append((end, t))
+  return temp_map
+
+def loop_depths(tac_instrs):
+  """The loop nesting depth of each instruction of `tac_instrs', counted
+  as the number of backward jumps whose range spans it"""
+  delta = [0] * (len(tac_instrs) + 1)
+  for i, succ in enumerate(successors(tac_instrs)):
+    for j in succ:
+      if j <= i:
+        delta[j] += 1
+        delta[i + 1] -= 1
+  depths, depth = [], 0
+  for i in range(len(tac_instrs)):
+    depth += delta[i]
+    depths.append(depth)
+  return depths
+
+def graph_coloring(tac_instrs):
+  """Map the temporaries of `tac_instrs' to registers or stack slots by
+  coloring their interference graph (Chaitin and Briggs).
+
+  The temporaries of a copy are merged first whenever they do not
+  interfere and the merged node passes Briggs's conservative test. Nodes
+  are then simplified while one has fewer neighbours than usable
+  registers, else the node with the lowest spill cost over degree is
+  pushed optimistically; the cost counts each def and use as 10 to the
+  power of its loop depth. The nodes that get no register when popped
+  go to stack slots. The temporaries live across a call only get
+  callee-saved registers, and the parameters live on entry all interfere."""
+  live_in, live_out = liveness(tac_instrs)
+  depths = loop_depths(tac_instrs)
+  adj, cost, allowed = dict(), dict(), dict()
+  def node(t):
+    if t not in adj:
+      adj[t], cost[t], allowed[t] = set(), 0, caller_saved + callee_saved
+  for i, instr in enumerate(tac_instrs):
+    for t in instr_uses(instr) + instr_defs(instr):
+      node(t)
+      cost[t] += 10 ** depths[i]
+    if i == 0:
+      for t in live_in[0]:
+        node(t)
+        adj[t] |= live_in[0] - {t}
+    src = instr['args'][0] if instr['opcode'] == 'copy' else None
+    for d in instr_defs(instr):
+      for t in live_out[i]:
+        if t != d and t != src:
+          node(t)
+          adj[d].add(t)
+          adj[t].add(d)
+    if is_call(instr):
+      for t in live_out[i] - set(instr_defs(instr)): allowed[t] = callee_saved
+
+  alias = dict()
+  def find(t):
+    while t in alias: t = alias[t]
+    return t
+  changed = True
+  while changed:
+    changed = False
+    for instr in tac_instrs:
+      if instr['opcode'] != 'copy' or not is_temp(instr['args'][0]) or \
+         not is_temp(instr['result']): continue
+      a, b = find(instr['result']), find(instr['args'][0])
+      if a == b or b in adj[a]: continue
+      regs = [r for r in allowed[a] if r in allowed[b]]
+      significant = [n for n in adj[a] | adj[b] if len(adj[n]) >= len(allowed[n])]
+      if len(significant) >= len(regs): continue
+      alias[b] = a
+      allowed[a] = regs
+      cost[a] += cost.pop(b)
+      for n in adj.pop(b):
+        adj[n].discard(b)
+        adj[n].add(a)
+        adj[a].add(n)
+      changed = True
+
+  degree = {t: len(ns) for t, ns in adj.items()}
+  remaining = dict.fromkeys(adj)
+  stack = []
+  while len(remaining) > 0:
+    t = next((t for t in remaining if degree[t] < len(allowed[t])), None)
+    if t is None: t = min(remaining, key=lambda t: cost[t] / degree[t])
+    del remaining[t]
+    stack.append(t)
+    for n in adj[t]:
+      if n in remaining: degree[n] -= 1
+  colors = dict()
+  nslots = 0
+  while len(stack) > 0:
+    t = stack.pop()
+    taken = {colors[n] for n in adj[t] if n in colors}
+    colors[t] = next((r for r in allowed[t] if r not in taken), None)
+    if colors[t] is None:
+      nslots += 1
+      colors[t] = f'{-8 * nslots}(%rbp)'
+  return {t: colors[find(t)] for t in list(adj) + list(alias)}
+
+allocators = {'stack': stack_alloc, 'linear': linear_scan, 'color': graph_coloring}
+
+# ------------------------------------------------------------------------------
+
+def fused_compares(tac_instrs):
+  """The indices of the `sub a, b -> t' immediately followed by a conditional
+  jump on t, t being a temporary dead afterwards: the pair is a comparison
+  of a with b, done by a single cmpq (whose flags are also right when a - b
+  overflows). A global result is always kept, liveness only tracks
+  temporaries."""
+  _, live_out = liveness(tac_instrs)
+  fused = set()
+  for i, instr in enumerate(tac_instrs[:-1]):
+    jump = tac_instrs[i + 1]
+    if instr['opcode'] == 'sub' and jump['opcode'] in jump_list and \
+       jump['opcode'] != 'jmp' and jump['args'][0] == instr['result'] and \
+       is_temp(instr['result']) and instr['result'] not in live_out[i + 1]:
+      fused.add(i)
+  return fused
+
+
+def tac_to_asm(tac_instrs, regalloc='stack', name='@main', params=()):
   """
-  Get the x64 instructions correspondign to the TAC instructions
+  Get the x64 instructions correspondign to the TAC instructions of the
+  procedure `name' with parameters `params', with the temporaries allocated
+  by `allocators[regalloc]'
   """
-  temp_map = dict()
+  temp_map = allocators[regalloc](tac_instrs)
+  fused = fused_compares(tac_instrs)
+  # the outgoing arguments are staged at the bottom of the frame by param:
+  # first those passed on the stack, where the callee expects them, then
+  # those passed in registers, loaded by the call
+  nargs = max((instr['args'][0] for instr in tac_instrs \
+               if instr['opcode'] == 'param'), default=0)
+  nstack = max(0, nargs - len(arg_regs))
+  def arg_slot(k):
+    if k > len(arg_regs): return f'{8 * (k - len(arg_regs) - 1)}(%rsp)'
+    return f'{8 * (nstack + k - 1)}(%rsp)'
+  # the labels of different procedures must not clash
+  def label(lab):
+    return f'.L{name[1:]}.{lab[2:]}'
+  exit_label = f'.L{name[1:]}.exit'
   asm = []
-  print("instructions are:#########")
-  for instr in tac_instrs:
-        print(instr)
-        print(type(instr))
+  for i, instr in enumerate(tac_instrs):
         opcode = instr['opcode']
         args = instr['args']
         result = instr['result']
@@ -87,8 +378,17 @@ def tac_to_asm(tac_instrs):
             assert len(args) == 1
             arg = lookup_temp(args[0], temp_map)
             result = lookup_temp(result, temp_map)
-            asm.append(f'movq {arg}, %r11')
-            asm.append(f'movq %r11, {result}')
+            if arg != result:
+                asm.append(f'movq {arg}, %r11')
+                asm.append(f'movq %r11, {result}')
+        elif i in fused:
+            assert len(args) == 2
+            arg1 = lookup_temp(args[0], temp_map)
+            arg2 = lookup_temp(args[1], temp_map)
+            if in_memory(arg1) and in_memory(arg2):
+                asm.extend([f'movq {arg1}, %r11',
+                            f'cmpq {arg2}, %r11'])
+            else: asm.append(f'cmpq {arg2}, {arg1}')
         elif opcode in binops:
             assert len(args) == 2
             arg1 = lookup_temp(args[0], temp_map)
@@ -112,25 +412,41 @@ def tac_to_asm(tac_instrs):
             assert len(args) == 1
             assert result == None
             arg = lookup_temp(args[0], temp_map)
-            asm.extend([f'leaq .lprintfmt(%rip), %rdi',
-                        f'movq {arg}, %rsi',
+            asm.extend([f'movq {arg}, %rsi',
+                        f'leaq .lprintfmt(%rip), %rdi',
                         f'xorq %rax, %rax',
                         f'callq printf@PLT'])
+        elif opcode == 'param':
+            assert len(args) == 2 and isinstance(args[0], int) and args[0] >= 1
+            asm.extend(move(lookup_temp(args[1], temp_map), arg_slot(args[0])))
+        elif opcode == 'call':
+            assert len(args) == 2 and args[0].startswith('@')
+            asm.extend(f'movq {arg_slot(k + 1)}, {reg}' \
+                       for k, reg in enumerate(arg_regs[:args[1]]))
+            asm.append(f'callq {args[0][1:]}')
+            if result is not None:
+                asm.extend(move('%rax', lookup_temp(result, temp_map)))
+        elif opcode == 'ret':
+            assert len(args) <= 1
+            if len(args) == 1:
+                asm.extend(move(lookup_temp(args[0], temp_map), '%rax'))
+            else: asm.append(f'xorq %rax, %rax')
+            asm.append(f'jmp {exit_label}')
         elif opcode == 'label':
             assert len(args) == 1
             # print(args[0])
-            asm.append(f'{args[0]}:')
+            asm.append(f'{label(args[0])}:')
         elif opcode in jump_list:
             if opcode == 'jmp':
                 #just a simple unconditional jump.
                 assert len(args) == 1
-                asm.append(f"jmp {args[0][1:]}") # We remove the %
+                asm.append(f"jmp {label(args[0])}")
             else:
               assert len(args) == 2
-              arg1 = lookup_temp(args[0], temp_map)
-              arg_dest = args[1].replace('%', '') # Because we are jumping to a label not a register
-              asm.extend([f"cmpq $0, {arg1}", 
-                          f"{opcode} {arg_dest}"])
+              arg_dest = label(args[1]) # Because we are jumping to a label not a register
+              if i - 1 not in fused: # else the flags are those of the cmpq
+                  asm.append(f"cmpq $0, {lookup_temp(args[0], temp_map)}")
+              asm.append(f"{opcode} {arg_dest}")
             # else:
             #     assert len(args) == 2
             #     arg1 = lookup_temp(args[0], temp_map)
@@ -140,19 +456,38 @@ def tac_to_asm(tac_instrs):
             #     # print("Jump operation not done yet: ", opcode)
         else:
             assert False, f'unknown opcode: {opcode}'
-  stack_size = len(temp_map)
+  # the parameters live on entry are moved from where the caller put them
+  live_in, _ = liveness(tac_instrs)
+  entry = live_in[0] if len(tac_instrs) > 0 else set()
+  incoming = [(arg_regs[k] if k < len(arg_regs) else \
+               f'{16 + 8 * (k - len(arg_regs))}(%rbp)', lookup_temp(p, temp_map)) \
+              for k, p in enumerate(params) if p in entry]
+  # the callee-saved registers in use are saved in slots below the temporaries
+  nslots = len({loc for loc in temp_map.values() if loc.endswith('(%rbp)')})
+  saved = [(reg, f'{-8 * (nslots + i + 1)}(%rbp)') for i, reg in \
+           enumerate(r for r in callee_saved if r in temp_map.values())]
+  stack_size = nslots + len(saved) + nstack + min(nargs, len(arg_regs))
   if stack_size % 2 != 0: stack_size += 1 # 16 byte alignment for x64
   asm[:0] = [f'pushq %rbp',
              f'movq %rsp, %rbp',
              f'subq ${8 * stack_size}, %rsp'] \
+           + [f'movq {reg}, {slot}' for reg, slot in saved] \
+           + parallel_moves(incoming)
   #  + [f'// {tmp} in {reg}' for (tmp, reg) in temp_map.items()]
+  # falling off the end returns 0, as a ret without value does
+  asm.extend([f'xorq %rax, %rax',
+              f'{exit_label}:'])
+  asm.extend([f'movq {slot}, {reg}' for reg, slot in saved])
   asm.extend([f'movq %rbp, %rsp',
               f'popq %rbp',
-              f'xorq %rax, %rax',
               f'retq'])
   return asm
 
-def compile_tac(fname):
+def tac_to_file(fname, regalloc='stack', optimize=True):
+  """
+  Writes the assembly for the TAC program in fname next to it and
+  returns the name of the .s file
+  """
   if fname.endswith('.tac.json'):
     rname = fname[:-9]
   elif fname.endswith('.json'):
@@ -162,40 +497,66 @@ def compile_tac(fname):
   tjs = None
   with open(fname, 'rb') as fp:
     tjs = json.load(fp)
-  assert isinstance(tjs, list) and len(tjs) == 1, tjs
-  tjs = tjs[0]
-  assert 'proc' in tjs and tjs['proc'] == '@main', tjs
-  asm = []
-  print(tac_to_asm(tjs['body']))
-  for line in tac_to_asm(tjs['body']):
-    if line[:3] == "%.L":
-        l = line[1:]
-        asm.append(l)
-    else:
-        asm.append('\t' + line)
-    
-#   asm = ['\t' + line for line in tac_to_asm(tjs['body'])]
-  asm[:0] = [f'\t.section .rodata',
-             f'.lprintfmt:',
-             f'\t.string "%ld\\n"',
-             f'\t.text',
-             f'\t.globl main',
-             f'main:']
-  xname = rname + '.exe'
+  assert isinstance(tjs, list), tjs
+  gvars = [tlv for tlv in tjs if 'var' in tlv]
+  procs = [tlv for tlv in tjs if 'proc' in tlv]
+  assert any(proc['proc'] == '@main' for proc in procs), tjs
+  asm = [f'\t.section .rodata',
+         f'.lprintfmt:',
+         f'\t.string "%ld\\n"']
+  if len(gvars) > 0: asm.append(f'\t.data')
+  for gvar in gvars:
+    name = gvar['var'][1:]
+    asm.extend([f'\t.globl {name}',
+                f'\t.align 8',
+                f'{name}:',
+                f'\t.quad {gvar["init"]}'])
+  asm.append(f'\t.text')
+  for proc in procs:
+    lines = tac_to_asm(proc['body'], regalloc, proc['proc'], proc.get('args', ()))
+    if optimize: lines = peephole.optimize(lines)
+    name = proc['proc'][1:]
+    asm.extend([f'\t.globl {name}',
+                f'{name}:'])
+    for line in lines:
+      if line.endswith(':'):
+          asm.append(line)
+      else:
+          asm.append('\t' + line)
   sname = rname + '.s'
   with open(sname, 'w') as afp:
     print(*asm, file=afp, sep='\n')
+  return sname
+
+def link(sname):
+  """
+  Assembles sname and links it with the runtime of print, returning the
+  name of the executable; raises CalledProcessError if gcc fails
+  """
+  import subprocess
+  xname = sname[:-2] + '.exe'
+  runtime = os.path.join(os.path.dirname(__file__), 'bx_runtime.c')
+  subprocess.run(['gcc', '-o', xname, sname, runtime], check=True)
+  return xname
+
+def compile_tac(fname, regalloc='stack', optimize=True):
+  sname = tac_to_file(fname, regalloc, optimize)
   print(f'{fname} -> {sname}')
   # SINCE WE ARE ONLY MAKING THE ASSEMBLY FILE, WE DON'T EXECUTE THIS
   if sys.platform != "win32":
-    # We only create the executable on Linux
-    os.system(f'gcc -o {xname} {sname}')
+    # We only create the executable on Linux, with the runtime of print
+    xname = link(sname)
     print(f'{sname} -> {xname}')
   else:
     print("Not making executeable on Windows")
 
 if __name__ == '__main__':
-  if len(sys.argv) != 2:
-    print(f'Usage: {sys.argv[0]} tacfile.tac.json')
-    sys.exit(1)
-  compile_tac(sys.argv[1])
+  import argparse
+  ap = argparse.ArgumentParser()
+  ap.add_argument('fname', metavar='tacfile.tac.json')
+  ap.add_argument('--regalloc', default='stack', choices=allocators.keys(),
+                  help='how to place the temporaries (default: a stack slot each)')
+  ap.add_argument('--no-peephole', dest='optimize', action='store_false',
+                  help='emit the assembly without peephole optimization')
+  args = ap.parse_args()
+  compile_tac(args.fname, args.regalloc, args.optimize)
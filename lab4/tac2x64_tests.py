@@ -0,0 +1,228 @@
+import unittest
+from tac2x64 import *
+
+def instr(opcode, args, result=None):
+    return {"opcode": opcode, "args": args, "result": result}
+
+class testLiveness(unittest.TestCase):
+    def setUp(self):
+        # %0 counts down from 3, printing %1 each time
+        self.body = [instr("const", [3], "%0"),
+                     instr("const", [7], "%1"),
+                     instr("const", [1], "%2"),
+                     instr("label", ["%.L1"]),
+                     instr("jz", ["%0", "%.L2"]),
+                     instr("print", ["%1"]),
+                     instr("sub", ["%0", "%2"], "%0"),
+                     instr("jmp", ["%.L1"]),
+                     instr("label", ["%.L2"])]
+
+    def test_successors(self):
+        succs = successors(self.body)
+        self.assertEqual(succs[4], [8, 5])
+        self.assertEqual(succs[7], [3])
+        self.assertEqual(succs[8], [])
+
+    def test_live_around_loop(self):
+        live_in, live_out = liveness(self.body)
+        self.assertEqual(live_in[3], {"%0", "%1", "%2"})
+        self.assertEqual(live_out[7], {"%0", "%1", "%2"})
+        self.assertEqual(live_out[8], set())
+
+    def test_intervals_cover_loop(self):
+        intervals = live_intervals(self.body)
+        self.assertEqual(intervals["%0"], [1, 15])
+        self.assertEqual(intervals["%2"], [5, 15])
+
+    def tearDown(self):
+        del self.body
+
+class testLinearScan(unittest.TestCase):
+    def overlap(self, iv1, iv2):
+        return iv1[0] <= iv2[1] and iv2[0] <= iv1[1]
+
+    def check_allocation(self, body, temp_map):
+        intervals = live_intervals(body)
+        self.assertEqual(set(temp_map), set(intervals))
+        for t1, iv1 in intervals.items():
+            for t2, iv2 in intervals.items():
+                if t1 < t2 and self.overlap(iv1, iv2):
+                    self.assertNotEqual(temp_map[t1], temp_map[t2])
+
+    def test_no_pressure(self):
+        body = [instr("const", [1], "%0"),
+                instr("const", [2], "%1"),
+                instr("add", ["%0", "%1"], "%2"),
+                instr("print", ["%2"])]
+        temp_map = linear_scan(body)
+        self.check_allocation(body, temp_map)
+        for loc in temp_map.values():
+            self.assertIn(loc, caller_saved)
+
+    def test_result_reuses_argument(self):
+        body = [instr("const", [1], "%0"),
+                instr("neg", ["%0"], "%1"),
+                instr("print", ["%1"])]
+        temp_map = linear_scan(body)
+        self.assertEqual(temp_map["%0"], temp_map["%1"])
+
+    def test_live_across_print(self):
+        body = [instr("const", [1], "%0"),
+                instr("const", [2], "%1"),
+                instr("print", ["%1"]),
+                instr("print", ["%0"])]
+        temp_map = linear_scan(body)
+        self.assertIn(temp_map["%0"], callee_saved)
+        self.assertIn(temp_map["%1"], caller_saved)
+
+    def test_spills_under_pressure(self):
+        n = len(caller_saved) + len(callee_saved) + 3
+        body = [instr("const", [i], f"%{i}") for i in range(n)] + \
+               [instr("add", ["%0", f"%{i}"], "%0") for i in range(1, n)] + \
+               [instr("print", ["%0"])]
+        temp_map = linear_scan(body)
+        self.check_allocation(body, temp_map)
+        spilled = [loc for loc in temp_map.values() if loc.endswith("(%rbp)")]
+        self.assertEqual(len(spilled), 3)
+
+    def test_callee_saved_restored(self):
+        body = [instr("const", [1], "%0"),
+                instr("print", ["%0"]),
+                instr("print", ["%0"])]
+        asm = tac_to_asm(body, 'linear')
+        self.assertIn("movq %rbx, -8(%rbp)", asm)
+        self.assertIn("movq -8(%rbp), %rbx", asm)
+        self.assertNotIn("movq %rbx, -8(%rbp)", tac_to_asm(body, 'stack'))
+
+class testGraphColoring(unittest.TestCase):
+    def test_loop_depths(self):
+        body = [instr("const", [3], "%0"),
+                instr("label", ["%.L1"]),
+                instr("jz", ["%0", "%.L2"]),
+                instr("label", ["%.L3"]),
+                instr("jnz", ["%0", "%.L3"]),
+                instr("jmp", ["%.L1"]),
+                instr("label", ["%.L2"])]
+        self.assertEqual(loop_depths(body), [0, 1, 1, 2, 2, 1, 0])
+
+    def test_copy_coalesced(self):
+        body = [instr("const", [1], "%0"),
+                instr("copy", ["%0"], "%1"),
+                instr("print", ["%1"])]
+        temp_map = graph_coloring(body)
+        self.assertEqual(temp_map["%0"], temp_map["%1"])
+        self.assertEqual(len([line for line in tac_to_asm(body, 'color') \
+                              if line.startswith('movq') and '%r11' in line]), 0)
+
+    def test_interfering_copy_kept(self):
+        body = [instr("const", [1], "%0"),
+                instr("copy", ["%0"], "%1"),
+                instr("neg", ["%1"], "%1"),
+                instr("add", ["%0", "%1"], "%2"),
+                instr("print", ["%2"])]
+        temp_map = graph_coloring(body)
+        self.assertNotEqual(temp_map["%0"], temp_map["%1"])
+
+    def test_spill_outside_loop(self):
+        # one more temporary live at once than there are registers: the one
+        # used in the loop keeps a register
+        n = len(caller_saved) + len(callee_saved) + 1
+        body = [instr("const", [i], f"%{i}") for i in range(n)] + \
+               [instr("label", ["%.L1"]),
+                instr("sub", ["%0", "%1"], "%0"),
+                instr("jnz", ["%0", "%.L1"])] + \
+               [instr("add", ["%0", f"%{i}"], "%0") for i in range(1, n)] + \
+               [instr("print", ["%0"])]
+        temp_map = graph_coloring(body)
+        spilled = [t for t, loc in temp_map.items() if loc.endswith("(%rbp)")]
+        self.assertEqual(len(spilled), 1)
+        self.assertNotIn(spilled[0], ["%0", "%1"])
+
+class testFusedCompare(unittest.TestCase):
+    def setUp(self):
+        # if %0 < %1 then print %0
+        self.body = [instr("const", [1], "%0"),
+                     instr("const", [2], "%1"),
+                     instr("sub", ["%0", "%1"], "%2"),
+                     instr("jl", ["%2", "%.L1"]),
+                     instr("jmp", ["%.L2"]),
+                     instr("label", ["%.L1"]),
+                     instr("print", ["%0"]),
+                     instr("label", ["%.L2"])]
+
+    def test_sub_and_jump_fused(self):
+        self.assertEqual(fused_compares(self.body), {2})
+        asm = tac_to_asm(self.body, 'color')
+        self.assertNotIn("cmpq $0", "\n".join(asm))
+        self.assertEqual(len([line for line in asm if line.startswith("cmpq")]), 1)
+        self.assertEqual([line for line in asm if line.startswith("subq") and \
+                          not line.endswith("%rsp")], [])
+
+    def test_difference_used_later(self):
+        self.body[6] = instr("print", ["%2"])
+        self.assertEqual(fused_compares(self.body), set())
+        self.assertIn("cmpq $0, -24(%rbp)", tac_to_asm(self.body, 'stack'))
+
+    def test_global_result_kept(self):
+        self.body[2] = instr("sub", ["%0", "%1"], "@g")
+        self.body[3] = instr("jl", ["@g", "%.L1"])
+        self.body[6] = instr("print", ["@g"])
+        self.assertEqual(fused_compares(self.body), set())
+        self.assertIn("movq %r11, g(%rip)", tac_to_asm(self.body, 'stack'))
+
+class testProcedures(unittest.TestCase):
+    def run_moves(self, asm, values):
+        for line in asm:
+            src, dst = line[len("movq "):].split(", ")
+            values[dst] = values[src]
+        return values
+
+    def test_parallel_moves_cycle(self):
+        asm = parallel_moves([("%rdi", "%rsi"), ("%rsi", "%rdi"), ("%rdx", "%rbx")])
+        values = self.run_moves(asm, {"%rdi": 1, "%rsi": 2, "%rdx": 3})
+        self.assertEqual((values["%rdi"], values["%rsi"], values["%rbx"]), (2, 1, 3))
+
+    def test_params_interfere(self):
+        body = [instr("add", ["%a", "%b"], "%c"),
+                instr("ret", ["%c"])]
+        temp_map = graph_coloring(body)
+        self.assertNotEqual(temp_map["%a"], temp_map["%b"])
+
+    def test_call_arguments(self):
+        body = [instr("const", [0], "%0")] + \
+               [instr("param", [k, "%0"]) for k in range(1, 9)] + \
+               [instr("call", ["@f", 8], "%1"),
+                instr("ret", ["%1"])]
+        asm = tac_to_asm(body, 'stack', '@g')
+        # two on the stack where the callee finds them, six in registers
+        self.assertIn("movq %r11, 0(%rsp)", asm)
+        self.assertIn("movq %r11, 8(%rsp)", asm)
+        self.assertIn("movq 16(%rsp), %rdi", asm)
+        self.assertIn("movq 56(%rsp), %r9", asm)
+        self.assertIn("callq f", asm)
+        frame = int(asm[2].split("$")[1].split(",")[0])
+        self.assertEqual(frame % 16, 0)
+        self.assertGreaterEqual(frame, 8 * (2 + 8))
+
+    def test_incoming_parameters(self):
+        params = [f"%p{k}" for k in range(1, 9)]
+        body = [instr("add", ["%p1", "%p8"], "%0"),
+                instr("ret", ["%0"])]
+        asm = tac_to_asm(body, 'stack', '@g', params)
+        self.assertIn("movq %rdi, -8(%rbp)", asm)
+        self.assertIn("movq 24(%rbp), %r11", asm)
+
+    def test_labels_and_globals(self):
+        body = [instr("copy", ["@x"], "%0"),
+                instr("jz", ["%0", "%.L1"]),
+                instr("ret", []),
+                instr("label", ["%.L1"]),
+                instr("copy", ["%0"], "@x")]
+        asm = tac_to_asm(body, 'stack', '@h')
+        self.assertIn("movq x(%rip), %r11", asm)
+        self.assertIn("jz .Lh.L1", asm)
+        self.assertIn(".Lh.L1:", asm)
+        self.assertIn("jmp .Lh.exit", asm)
+
+if __name__ == '__main__':
+    unittest.main()
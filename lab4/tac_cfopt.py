@@ -2,13 +2,14 @@ import json
 import sys
 import argparse
 from cfg import *
+from tacrun import Instr, instr_hook, instr_default
 
 
 def get_labels(body):
     labels = set()
     for instr in body:
-        if instr["opcode"] == "label":
-            labels.add(instr["args"][0])
+        if instr.opcode == "label":
+            labels.add(instr.args[0])
 
     return labels
 
@@ -22,22 +23,22 @@ def add_labels(proc):
     body = proc["body"]
     labels = get_labels(body)
     label_counter = len(labels) #Could be 0 but this might save time
-    if body[0]["opcode"] != "label":
+    if body[0].opcode != "label":
         new_lbl, label_counter = new_label(labels, label_counter)
         labels.add(new_lbl)
-        body.insert(0, {"opcode":"label", "args":[new_lbl], "result":None})
+        body.insert(0, Instr(None, "label", [new_lbl]))
 
     labels_added = 0
     init_length = len(body)
     for i in range(1, init_length):
         j = i + labels_added
-        if body[j]["opcode"][0] == 'j':
-            if i == init_length - 1 or (body[j+1]["opcode"] != "label" and
-                                        body[j+1]["opcode"][0] != 'j' and 
-                                        body[j+1]["opcode"] != "ret"):
+        if body[j].opcode[0] == 'j':
+            if i == init_length - 1 or (body[j+1].opcode != "label" and
+                                        body[j+1].opcode[0] != 'j' and 
+                                        body[j+1].opcode != "ret"):
                 new_lbl, label_counter = new_label(labels, label_counter)
                 labels.add(new_lbl)
-                new_instr = {"opcode":"label", "args":[new_lbl], "result":None}
+                new_instr = Instr(None, "label", [new_lbl])
                 body.insert(j + 1, new_instr)
 
     if "args" in proc.keys():
@@ -52,13 +53,13 @@ def proc_to_blocks(proc):
     current_block = []
     for i, instr in enumerate(body):
         if i == len(body)-1 or \
-        (instr["opcode"][0] == 'j' and (body[i+1]["opcode"][0] != 'j' and body[i+1]["opcode"] != "ret")) or \
-        instr["opcode"] == "ret":
+        (instr.opcode[0] == 'j' and (body[i+1].opcode[0] != 'j' and body[i+1].opcode != "ret")) or \
+        instr.opcode == "ret":
             current_block.append(instr)
             blocks.append(current_block.copy())
             current_block = []
 
-        elif instr["opcode"] == "label":
+        elif instr.opcode == "label":
             if current_block != []:
                 blocks.append(current_block.copy())
             current_block = [instr]
@@ -71,26 +72,32 @@ def proc_to_blocks(proc):
 def add_jumps(blocks):
     init_len=len(blocks)
     for i in range(init_len-1):
-        if blocks[i][-1]["opcode"]!='jmp' and blocks[i][-1]["opcode"]!='ret':
-            new_lbl= blocks[i+1][0]["args"][0]
-            blocks[i].append({"opcode":"jmp", "args":[new_lbl], "result":None})
+        if blocks[i][-1].opcode!='jmp' and blocks[i][-1].opcode!='ret':
+            new_lbl= blocks[i+1][0].args[0]
+            blocks[i].append(Instr(None, "jmp", [new_lbl]))
     return blocks
 
 
 def create_nodes(blocks):
     nodes=[]
     for block in blocks:
-        label=block[0]["args"][0]
+        label=block[0].args[0]
         nodes.append(Node(label,block))
     return nodes
 
 
-def main(fname, sname, coal, uce, jp1, jp2):
+def main(fname, sname, coal, uce, jp1, jp2, verbose=False):
+    # the instructions are read as Instr and written back from them, without
+    # a copy of the program as dicts
     with open(fname, 'r') as f:
-        js_obj = json.load(f)
+        js_obj = json.load(f, object_hook=instr_hook)
 
     tac=[]
     for proc in js_obj:
+        if "proc" not in proc:
+            # global variables are left as they are
+            tac.append(proc)
+            continue
         body = []
         new_proc = add_labels(proc)
         proc_name = new_proc["proc"]
@@ -101,8 +108,10 @@ def main(fname, sname, coal, uce, jp1, jp2):
         # print(cfg.edges)
         if not uce:
             cfg.uce()
-        if not jp2:
-            cfg.jp2()
+        if not jp1 or not jp2:
+            threaded = cfg.thread_jumps(jp1=not jp1, jp2=not jp2)
+            if verbose:
+                print(f"{proc_name}: {threaded} jumps threaded", file=sys.stderr)
         if not coal:
             cfg.coalesce()
         body += cfg.serialize()
@@ -110,15 +119,16 @@ def main(fname, sname, coal, uce, jp1, jp2):
         proc_json["proc"] = proc_name
         if "args" in new_proc.keys():
             proc_json["args"] = new_proc["args"]
-        proc_json["body"] = body 
+        proc_json["body"] = body
 
         tac.append(proc_json)
 
     if sname is None:
-        print(tac)
+        json.dump(tac, sys.stdout, indent=2, default=instr_default)
+        print()
     else:
         with open(sname, 'w') as f:
-            json.dump(tac, f, indent=2)
+            json.dump(tac, f, indent=2, default=instr_default)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -128,7 +138,9 @@ if __name__ == "__main__":
     parser.add_argument("--disable-uce", action="store_true", required=False)
     parser.add_argument("--disable-jp1", action="store_true", required=False)
     parser.add_argument("--disable-jp2", action="store_true", required=False)
+    parser.add_argument("-v", "--verbose", action="store_true", required=False,
+                        help="report the number of jumps threaded in each procedure")
     args = parser.parse_args()
 
     cfg = main(args.fname, args.o, args.disable_coal, args.disable_uce,
-         args.disable_jp1, args.disable_jp2)
+         args.disable_jp1, args.disable_jp2, args.verbose)
@@ -6,7 +6,7 @@ class testLoadingFull(unittest.TestCase):
         fname = "./examples/cond_jmps.tac.json"
 
         with open(fname, 'r') as f:
-            js_obj = json.load(f)
+            js_obj = json.load(f, object_hook=instr_hook)
 
         self.proc = js_obj[0]
 
@@ -16,8 +16,8 @@ class testLoadingFull(unittest.TestCase):
         label_count = 0
         labels = set()
         for instr in proc["body"]:
-            if instr["opcode"] == "label":
-                label = instr["args"][0]
+            if instr.opcode == "label":
+                label = instr.args[0]
                 if label not in labels:
                     label_count += 1
                     labels.add(label)
@@ -29,7 +29,7 @@ class testLoadingFull(unittest.TestCase):
         blocks = proc_to_blocks(proc)
         self.assertEqual(len(blocks), 5)
         for block in blocks:
-            self.assertEqual(block[0]["opcode"], "label")
+            self.assertEqual(block[0].opcode, "label")
 
     def test_no_fallthrough(self):
         proc = add_labels(self.proc)
@@ -47,7 +47,7 @@ class testLoading(unittest.TestCase):
         fname = "./examples/cond.tac.json"
 
         with open(fname, 'r') as f:
-            js_obj = json.load(f)
+            js_obj = json.load(f, object_hook=instr_hook)
 
         self.proc = js_obj[0]
 
@@ -57,8 +57,8 @@ class testLoading(unittest.TestCase):
         label_count = 0
         labels = set()
         for instr in proc["body"]:
-            if instr["opcode"] == "label":
-                label = instr["args"][0]
+            if instr.opcode == "label":
+                label = instr.args[0]
                 if label not in labels:
                     label_count += 1
                     labels.add(label)
@@ -70,7 +70,7 @@ class testLoading(unittest.TestCase):
         blocks = proc_to_blocks(proc)
         self.assertEqual(len(blocks), 5)
         for block in blocks:
-            self.assertEqual(block[0]["opcode"], "label")
+            self.assertEqual(block[0].opcode, "label")
 
     def test_fallthrough(self):
         proc = add_labels(self.proc)
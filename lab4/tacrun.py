@@ -4,7 +4,7 @@
 Three Address Code (TAC) intermediate representation
 """
 
-from ply import lex, yacc
+import sys
 from io import StringIO
 
 # ------------------------------------------------------------------------------
@@ -53,6 +53,8 @@ class Instr:
   def load(js_obj):
     opcode = js_obj.get('opcode', None)
     assert opcode is not None
+    # the opcodes are compared against literals, which are interned
+    opcode = sys.intern(opcode)
     args = js_obj.get('args', ())
     result = js_obj.get('result', None)
     return Instr(result, opcode, args)
@@ -61,7 +63,7 @@ class Instr:
   def js_obj(self):
     """A basic Python object ready to JSONify with json.dump()"""
     return {'opcode': self.opcode,
-            'args': self.args,
+            'args': list(self.args),
             'result': self.result}
 
   def __repr__(self):
@@ -83,6 +85,15 @@ class Instr:
       result.write(';')
     return result.getvalue()
 
+def instr_hook(js_obj):
+  """object_hook for json.load() that reads the instructions as Instr"""
+  return Instr.load(js_obj) if 'opcode' in js_obj else js_obj
+
+def instr_default(obj):
+  """default for json.dump() that writes each Instr as its js_obj"""
+  if isinstance(obj, Instr): return obj.js_obj
+  raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
 class Proc:
   def __init__(self, name, args, body):
     self.name = name
@@ -142,8 +153,6 @@ class Gvar:
 
 # ------------------------------------------------------------------------------
 
-import ply.lex
-
 class Lexer:
   reserved = {
     'var': 'VAR',
@@ -194,13 +203,12 @@ class Lexer:
   def __init__(self, text, provenance="<unknown>"):
     self.text = text
     self.provenance = provenance
-    self.lexer = ply.lex.lex(module=self)
+    import plytab
+    self.lexer = plytab.lex(self, 'lab4_tac_lextab')
     self.lexer.input(self.text)
 
 # ------------------------------------------------------------------------------
 
-import ply.yacc
-
 class Parser:
   tokens = Lexer.tokens
 
@@ -287,7 +295,8 @@ class Parser:
 
   def __init__(self, lexer):
     self.lexer = lexer
-    self.parser = ply.yacc.yacc(module=self, start='program')
+    import plytab
+    self.parser = plytab.yacc(self, 'lab4_tac_parsetab', start='program')
 
   def parse(self):
     return self.parser.parse(lexer=self.lexer.lexer, tracking=True)
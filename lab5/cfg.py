@@ -5,7 +5,9 @@ Control Flow Graphs (CFG)
 """
 
 import tac
+import tac_opcodes
 from io import StringIO
+from bisect import bisect_left
 
 # ------------------------------------------------------------------------------
 
@@ -184,14 +186,6 @@ class CFG:
 
 # ------------------------------------------------------------------------------
 
-import re
-
-_enders = re.compile(r'jmp|jz|jnz|jl|jle|jnl|jnle|ret')
-_jumps  = re.compile(r'jmp|jz|jnz|jl|jle|jnl|jnle')
-_jcc    = re.compile(r'jz|jnz|jl|jle|jnl|jnle')
-_jabs   = re.compile(r'jmp|ret')
-_unconditional = re.compile(r'label|jmp|ret')
-
 def apply_label_rewrite(jinstr, tab):
     if jinstr.opcode == 'jmp':
         jinstr.arg1 = tab.get(jinstr.arg1, jinstr.arg1)
@@ -244,7 +238,7 @@ def fallthrough_to_jump(tac_proc):
     instrs, tac_proc.body = tac_proc.body, []
     for cur, instr in enumerate(instrs):
         tac_proc.body.append(instr)
-        if (not _unconditional.fullmatch(instr.opcode) and \
+        if (instr.opcode not in tac_opcodes.no_fallthrough and \
             cur + 1 < len(instrs) and \
             instrs[cur + 1].opcode == 'label'):
             tac_proc.body.append(tac.Instr(None, 'jmp', (instrs[cur + 1].arg1, None)))
@@ -261,16 +255,16 @@ def add_admin_labels(tac_proc):
         instr = instrs[cur]
         tac_proc.body.append(instr)
         cur += 1
-        if _jcc.fullmatch(instr.opcode):
+        if instr.opcode in tac_opcodes.cond_jumps:
             # skip conditional jump sequences
             while cur < len(instrs):
                 instr = instrs[cur]
-                if not _jcc.fullmatch(instr.opcode): break
+                if instr.opcode not in tac_opcodes.cond_jumps: break
                 tac_proc.body.append(instr)
                 cur += 1
             # skip unconditional jump
             instr = instrs[cur]
-            if _jabs.fullmatch(instr.opcode):
+            if instr.opcode in tac_opcodes.abs_jumps:
                 tac_proc.body.append(instr)
                 cur += 1
             tac_proc.body.append(tac.Instr(None, 'label', (next(admin_labels), None)))
@@ -293,12 +287,12 @@ def infer(tac_proc):
         cur += 1
         while cur < len(tac_proc.body):
             instr = tac_proc.body[cur]
-            if _enders.fullmatch(instr.opcode): break
+            if instr.opcode in tac_opcodes.terminators: break
             bl.body.append(instr)
             cur += 1
         while cur < len(tac_proc.body):
             instr = tac_proc.body[cur]
-            if not _enders.fullmatch(instr.opcode): break
+            if instr.opcode not in tac_opcodes.terminators: break
             bl.jumps.append(instr)
             cur += 1
         blocks.append(bl)
@@ -336,44 +330,397 @@ def linearize(tac_proc, cfg):
 
 # ------------------------------------------------------------------------------
 
-def filter_liveset(lab, lset):
-    for x in lset:
-        if isinstance(x, tuple):
-            if x[0] == lab: yield x[1]
-        else: yield x
+def postorder(cfg, unreachable=True):
+    """List of the labels of the blocks of `cfg' in postorder from the entry,
+    followed by the unreachable blocks unless `unreachable' is False"""
+    seen = {cfg.lab_entry}
+    order = []
+    stack = [(cfg.lab_entry, iter(cfg.successors(cfg.lab_entry)))]
+    while len(stack) > 0:
+        lab, succs = stack[-1]
+        for succ in succs:
+            if succ not in seen:
+                seen.add(succ)
+                stack.append((succ, iter(cfg.successors(succ))))
+                break
+        else:
+            stack.pop()
+            order.append(lab)
+    if unreachable:
+        order.extend(bl.label for bl in cfg.nodes() if bl.label not in seen)
+    return order
+
+def dominators(cfg):
+    """Immediate dominators of the blocks reachable from the entry, as a
+    dict from label to label (the entry is mapped to itself), computed
+    with the iterative algorithm of Cooper, Harvey and Kennedy"""
+    order = postorder(cfg, unreachable=False)
+    index = {lab: i for i, lab in enumerate(order)}
+    idom = {cfg.lab_entry: cfg.lab_entry}
+    def intersect(a, b):
+        while a != b:
+            while index[a] < index[b]: a = idom[a]
+            while index[b] < index[a]: b = idom[b]
+        return a
+    changed = True
+    while changed:
+        changed = False
+        for lab in reversed(order):
+            if lab == cfg.lab_entry: continue
+            new_idom = None
+            for pred in cfg.predecessors(lab):
+                # only the predecessors already processed (hence reachable)
+                if pred not in idom: continue
+                new_idom = pred if new_idom is None else intersect(pred, new_idom)
+            if idom.get(lab) != new_idom:
+                idom[lab] = new_idom
+                changed = True
+    return idom
+
+def dominance_frontiers(cfg, idom):
+    """Dominance frontiers of the blocks in `idom' (as returned by
+    dominators()), as a dict from label to set of labels. The entry block
+    counts as having an extra predecessor, the entry into the proc."""
+    df = {lab: set() for lab in idom}
+    for lab in idom:
+        preds = [pred for pred in cfg.predecessors(lab) if pred in idom]
+        if lab == cfg.lab_entry:
+            stop = None
+        elif len(preds) >= 2:
+            stop = idom[lab]
+        else:
+            continue
+        for runner in preds:
+            while runner != stop:
+                df[runner].add(lab)
+                runner = None if runner == cfg.lab_entry else idom[runner]
+    return df
+
+class Liveness:
+    """Liveness analysis of a CFG.
+
+    Temporaries are numbered and live sets are represented as int bitsets.
+    The fixpoint is computed on whole blocks with a worklist, using a gen
+    and kill set computed once per block; the argument of a phi for the
+    predecessor `lab' is live out of `lab' only. The per-instruction sets
+    are derived on demand, one block at a time.
+
+    The analysis can be kept up to date when an instruction is removed,
+    with remove(): the liveness of each temporary is independent of the
+    others, so only the temporaries the instruction mentions are solved
+    again, and only from the blocks where they were live."""
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.temps = []     # bit number -> temporary
+        self._bits = dict() # temporary -> bit number
+        self._where = dict() # instruction -> (label, index in _effects)
+        self._derived = dict()
+        # per block, the instructions in reverse with the bit numbers of
+        # their defs and (non-phi) uses, and the phi arguments as (label, n)
+        self._effects = dict()
+        # per (label, bit number), the indices in _effects of the
+        # instructions of the block mentioning that temporary, increasing
+        self._occurs = dict()
+        self._gen, self._kill, self._phi_uses = dict(), dict(), dict()
+        # bit number -> labels of the blocks whose summary changed for it
+        self._dirty = dict()
+        for bl in cfg.nodes():
+            effects = self._effects[bl.label] = []
+            g, k, pu = set(), set(), dict()
+            for instr in bl.reversed_instrs():
+                self._where[instr] = (bl.label, len(effects))
+                d = tuple(self.number(t) for t in instr.defs())
+                k.update(d)
+                g.difference_update(d)
+                for ns in pu.values(): ns.difference_update(d)
+                if instr.opcode == 'phi':
+                    u = ()
+                    phi = tuple((lab, self.number(t)) for lab, t in instr.arg1.items() \
+                                if tac.Instr._istemp(t))
+                    for lab, n in phi: pu.setdefault(lab, set()).add(n)
+                    mentioned = set(d).union(n for _, n in phi)
+                else:
+                    u = tuple(self.number(t) for t in instr.uses())
+                    phi = None
+                    g.update(u)
+                    mentioned = set(d + u)
+                for n in mentioned:
+                    self._occurs.setdefault((bl.label, n), []).append(len(effects))
+                effects.append((instr, d, u, phi))
+            self._gen[bl.label] = self._mask(g)
+            self._kill[bl.label] = self._mask(k)
+            self._phi_uses[bl.label] = {lab: self._mask(ns) for lab, ns in pu.items()}
+        order = postorder(cfg)
+        self.block_in = {lab: 0 for lab in order}
+        self.block_out = {lab: 0 for lab in order}
+        # visit the blocks in postorder (reverse postorder of the reversed CFG)
+        self._solve(list(reversed(order)))
+
+    def _solve(self, work, m=-1):
+        """Run the worklist from the blocks in `work' until the fixpoint,
+        changing only the bits in the bitset `m' (by default, all)"""
+        live_in, live_out = self.block_in, self.block_out
+        gen, kill, phi_uses = self._gen, self._kill, self._phi_uses
+        pending = set(work)
+        while len(work) > 0:
+            lab = work.pop()
+            pending.discard(lab)
+            out = 0
+            for succ in self.cfg.successors(lab):
+                out |= live_in[succ] | phi_uses[succ].get(lab, 0)
+            out = (live_out[lab] & ~m) | (out & m)
+            if out != live_out[lab]:
+                live_out[lab] = out
+                self._derived.pop(lab, None)
+            new_in = (live_in[lab] & ~m) | ((gen[lab] | (out & ~kill[lab])) & m)
+            if new_in != live_in[lab]:
+                live_in[lab] = new_in
+                for pred in self.cfg.predecessors(lab):
+                    if pred not in pending:
+                        pending.add(pred)
+                        work.append(pred)
+
+    def number(self, tmp):
+        """The bit number of the temporary `tmp'"""
+        n = self._bits.get(tmp)
+        if n is None:
+            n = self._bits[tmp] = len(self.temps)
+            self.temps.append(tmp)
+        return n
+
+    def bit(self, tmp):
+        """The bitset of the single temporary `tmp'"""
+        return 1 << self.number(tmp)
+
+    def bits(self, tmps):
+        """The bitset of the temporaries in the iterable `tmps'"""
+        return self._mask([self.number(t) for t in tmps])
+
+    @staticmethod
+    def _mask(ns):
+        """The bitset of the bit numbers in the collection `ns'"""
+        if len(ns) <= 4:
+            b = 0
+            for n in ns: b |= 1 << n
+            return b
+        # one pass over a buffer rather than a new int per bit
+        buf = bytearray((max(ns) >> 3) + 1)
+        for n in ns: buf[n >> 3] |= 1 << (n & 7)
+        return int.from_bytes(buf, 'little')
+
+    @staticmethod
+    def _numbers(b):
+        while b:
+            low = b & -b
+            yield low.bit_length() - 1
+            b ^= low
+
+    def temps_of(self, b):
+        """The set of temporaries in the bitset `b'"""
+        return {self.temps[n] for n in self._numbers(b)}
+
+    def _derive(self, lab):
+        # the arguments of the phis below the current instruction are
+        # tracked apart: all of them are reported as live in, but only
+        # those for the current block itself are live out
+        ins, outs = dict(), dict()
+        live, phi_all, phi_own = self.block_out[lab], 0, 0
+        for instr, d, u, phi in self._effects[lab]:
+            outs[instr] = live | phi_own
+            if d:
+                d = ~self._mask(d)
+                live &= d
+                phi_all &= d
+                phi_own &= d
+            if u: live |= self._mask(u)
+            for l, n in phi or ():
+                phi_all |= 1 << n
+                if l == lab: phi_own |= 1 << n
+            ins[instr] = live | phi_all
+        self._derived[lab] = (ins, outs)
+        return ins, outs
+
+    def _sets(self, instr):
+        self.update()
+        lab = self._where[instr][0]
+        sets = self._derived.get(lab)
+        return sets if sets is not None else self._derive(lab)
+
+    def live_in_bits(self, instr):
+        return self._sets(instr)[0][instr]
+
+    def live_out_bits(self, instr):
+        return self._sets(instr)[1][instr]
+
+    def live_in(self, instr):
+        """The set of temporaries live just before `instr'"""
+        return self.temps_of(self.live_in_bits(instr))
+
+    def live_out(self, instr):
+        """The set of temporaries live just after `instr'"""
+        return self.temps_of(self.live_out_bits(instr))
+
+    def is_live_out(self, instr, tmp):
+        """Whether `tmp' is live just after `instr'. Only the instructions
+        of the block that mention `tmp' are looked at."""
+        n = self._bits.get(tmp)
+        if n is None: return False
+        if n in self._dirty: self._resolve(n)
+        lab, k = self._where[instr]
+        effects = self._effects[lab]
+        occurs = self._occurs.get((lab, n), ())
+        # the instructions below `instr', going down the block
+        for i in reversed(range(bisect_left(occurs, k))):
+            _, d, u, phi = effects[occurs[i]]
+            if n in u: return True
+            if phi is not None and (lab, n) in phi: return True
+            if n in d: return False
+        return self.block_out[lab] >> n & 1 != 0
+
+    def remove(self, instr):
+        """Update the analysis for `instr' no longer defining or using
+        anything, and return the set of temporaries it mentioned.
+
+        Every such temporary whose live in or phi uses may have changed in
+        the block of `instr' is only marked; it is solved again when it is
+        next asked about (see _resolve()), so that removing several of its
+        uses in a row costs a single update."""
+        lab, k = self._where[instr]
+        effects = self._effects[lab]
+        _, d, u, phi = effects[k]
+        mentioned = set(d + u).union(n for _, n in phi or ())
+        effects[k] = (instr, (), (), None)
+        self._derived.pop(lab, None)
+        for n in mentioned:
+            changed = self._update_block(lab, n)
+            # the check in _update_block() is only right if `n' is current
+            if changed or n in self._dirty:
+                self._dirty.setdefault(n, set()).add(lab)
+        return {self.temps[n] for n in mentioned}
+
+    def update(self):
+        """Solve again all the temporaries marked by remove(); block_in
+        and block_out are only current after this"""
+        for n in list(self._dirty): self._resolve(n)
+
+    def _update_block(self, lab, n):
+        """Recompute the bit `n' of the gen, kill and phi uses of block
+        `lab'. Returns whether that can change the liveness of `n' in
+        other blocks, that is whether its phi uses or live in may change."""
+        m = 1 << n
+        effects = self._effects[lab]
+        g, k, pu = 0, 0, dict()
+        for i in self._occurs[lab, n]:
+            _, d, u, phi = effects[i]
+            if n in d:
+                g, k = 0, m
+                pu.clear()
+            for l, p in phi or ():
+                if p == n: pu[l] = m
+            if n in u: g = m
+        self._gen[lab] = (self._gen[lab] & ~m) | g
+        self._kill[lab] = (self._kill[lab] & ~m) | k
+        old_pu = self._phi_uses[lab]
+        changed = False
+        for l in old_pu.keys() | pu.keys():
+            if old_pu.get(l, 0) & m != pu.get(l, 0):
+                old_pu[l] = (old_pu.get(l, 0) & ~m) | pu.get(l, 0)
+                changed = True
+        if changed: return True
+        # the live in may only be kept by the live out through a loop, so
+        # it is known to stay the same only if gen sets it, or if it was
+        # and still is clear
+        if self.block_in[lab] & m: return g == 0
+        return g != 0 or self.block_out[lab] & m & ~k != 0
+
+    def _resolve(self, n):
+        """Solve the liveness of temporary number `n' again after the
+        summaries of the blocks marked for it changed. Its bit is first
+        cleared from the blocks where it may have been live through them
+        (going up through the blocks where it was live in); the bits left
+        elsewhere do not depend on the marked blocks, so the worklist is
+        then run from the cleared blocks only, and for that bit only: the
+        other marked bits may not be current yet."""
+        m = 1 << n
+        region = self._dirty.pop(n)
+        stack = list(region)
+        while len(stack) > 0:
+            l = stack.pop()
+            for pred in self.cfg.predecessors(l):
+                if pred not in region and self.block_out[pred] & m:
+                    region.add(pred)
+                    if self.block_in[pred] & m: stack.append(pred)
+        for l in region:
+            self.block_in[l] &= ~m
+            self.block_out[l] &= ~m
+            self._derived.pop(l, None)
+        self._solve(list(region), m)
+
+class DefUse:
+    """Def-use and use-def chains of the temporaries of a CFG.
+
+    `defs[t]' and `uses[t]' hold the instructions defining and using the
+    temporary `t', in order of first appearance (as the keys of a dict); in
+    SSA form, `defs[t]' has at most one item. A phi counts as a single use
+    of a temporary whatever the number of its arguments naming it.
+
+    The chains are kept current by the methods that rewrite instructions,
+    and by calling remove() and add() around other changes, so that one
+    index can be shared by several passes."""
+
+    def __init__(self, cfg):
+        self.defs, self.uses = dict(), dict()
+        for instr in cfg.instrs(): self.add(instr)
+
+    @staticmethod
+    def _used(instr):
+        for t in instr.uses():
+            yield t[1] if isinstance(t, tuple) else t
+
+    def add(self, instr):
+        """Record the temporaries defined and used by `instr'"""
+        for t in instr.defs(): self.defs.setdefault(t, dict())[instr] = None
+        for t in self._used(instr): self.uses.setdefault(t, dict())[instr] = None
+
+    def remove(self, instr):
+        """Forget the temporaries defined and used by `instr'"""
+        for t in instr.defs(): self.defs[t].pop(instr, None)
+        for t in self._used(instr): self.uses[t].pop(instr, None)
+
+    def def_of(self, tmp):
+        """The only instruction defining `tmp', or None if there is not
+        exactly one"""
+        ds = self.defs.get(tmp)
+        return next(iter(ds)) if ds is not None and len(ds) == 1 else None
+
+    def uses_of(self, tmp):
+        """The list of instructions using `tmp'"""
+        return list(self.uses.get(tmp, ()))
+
+    def replace_uses(self, old, new):
+        """Rewrite every use of the temporary `old' into a use of `new',
+        visiting only the instructions that use `old'"""
+        users = self.uses.pop(old, dict())
+        for instr in users:
+            if instr.opcode == 'phi':
+                instr.arg1 = {l: new if t == old else t for l, t in instr.arg1.items()}
+            else:
+                if instr.arg1 == old: instr.arg1 = new
+                if instr.arg2 == old: instr.arg2 = new
+        if tac.Instr._istemp(new):
+            self.uses.setdefault(new, dict()).update(users)
 
 def recompute_liveness(cfg, livein, liveout):
     """Perform liveness analysis on the given cfg, storing the results in `livein' and `liveout'.
     Note: both `livein' and `liveout' are cleaned out before computing liveness."""
     livein.clear()
     liveout.clear()
-    # initialize livein with the use sets
+    live = Liveness(cfg)
     for i in cfg.instrs():
-        livein[i] = set(i.uses())
-        liveout[i] = set()
-    dirty = True
-    def update_livein(i, j_livein):
-        nonlocal dirty
-        old_count = len(livein[i])
-        old_set = str(livein[i])
-        i_defs = set(i.defs())
-        for x in j_livein:
-            if ((isinstance(x, tuple) and x[1] in i_defs) or \
-                x in i_defs): continue
-            livein[i].add(x)
-        if old_count != len(livein[i]):
-            dirty = True
-    while dirty:
-        dirty = False
-        for (li, i, lj, j) in cfg.instr_pairs(labeled=True):
-            if li == lj: update_livein(i, livein[j])
-            else: update_livein(i, filter_liveset(li, livein[j]))
-    for li, i, lj, j in cfg.instr_pairs(labeled=True):
-        liveout[i].update(filter_liveset(li, livein[j]))
-    # fix the livein sets to remove tuples
-    for i, li in livein.items():
-        livein[i] = {x[1] if isinstance(x, tuple) else x \
-                     for x in li}
+        livein[i] = live.live_in(i)
+        liveout[i] = live.live_out(i)
+    return live
 
 # ------------------------------------------------------------------------------
 
@@ -0,0 +1,91 @@
+import random
+import unittest
+from tac import Instr, Proc
+from cfg import *
+import ssagen
+
+def random_proc(rng, nblocks=8, ntemps=6, size=4):
+    """A proc of `nblocks' blocks of `size' random instructions each over
+    the temporaries %0 ... %ntemps-1, each block ending with a random
+    jump, and the last one with a return"""
+    temps = [f'%{i}' for i in range(ntemps)]
+    labels = [f'%.L{i}' for i in range(nblocks)]
+    body = []
+    for i, lab in enumerate(labels):
+        body.append(Instr(None, 'label', (lab,)))
+        for _ in range(size):
+            k = rng.randrange(3)
+            if k == 0: body.append(Instr(rng.choice(temps), 'const', (rng.randrange(10),)))
+            elif k == 1: body.append(Instr(rng.choice(temps), 'copy', (rng.choice(temps),)))
+            else: body.append(Instr(rng.choice(temps), 'add', (rng.choice(temps), rng.choice(temps))))
+        if i == nblocks - 1:
+            body.append(Instr(None, 'ret', (rng.choice(temps),)))
+        elif rng.randrange(2):
+            body.append(Instr(None, 'jz', (rng.choice(temps), rng.choice(labels))))
+        else:
+            body.append(Instr(None, 'jmp', (rng.choice(labels),)))
+    return Proc('@main', (), body)
+
+def naive_liveness(cfg):
+    """Live in and live out of every instruction, by iterating over the
+    whole CFG until nothing changes (no phis)"""
+    livein = {i: set() for i in cfg.instrs()}
+    liveout = {i: set() for i in cfg.instrs()}
+    changed = True
+    while changed:
+        changed = False
+        for bl in cfg.nodes():
+            out = set()
+            for succ in cfg.successors(bl.label):
+                out |= livein[cfg[succ].first_instr()]
+            for i in bl.reversed_instrs():
+                new_in = set(i.uses()) | (out - set(i.defs()))
+                if new_in != livein[i] or out != liveout[i]:
+                    livein[i], liveout[i] = new_in, out
+                    changed = True
+                out = new_in
+    return livein, liveout
+
+class testLiveness(unittest.TestCase):
+    def assertSameLiveness(self, live, livein, liveout):
+        for i in livein:
+            self.assertEqual(live.live_in(i), livein[i], i)
+            self.assertEqual(live.live_out(i), liveout[i], i)
+
+    def test_against_naive(self):
+        rng = random.Random(5)
+        for _ in range(50):
+            cfg = infer(random_proc(rng))
+            livein, liveout = naive_liveness(cfg)
+            self.assertSameLiveness(Liveness(cfg), livein, liveout)
+
+    def test_recompute_liveness(self):
+        cfg = infer(random_proc(random.Random(7)))
+        livein, liveout = dict(), dict()
+        live = recompute_liveness(cfg, livein, liveout)
+        self.assertSameLiveness(live, *naive_liveness(cfg))
+
+    def test_remove_against_recompute(self):
+        rng = random.Random(6)
+        for ssa in ssagen.ssagens:
+            for _ in range(8):
+                proc = random_proc(rng)
+                cfg = infer(proc)
+                ssagen.ssagens[ssa](proc, cfg)
+                live = Liveness(cfg)
+                body = [i for i in cfg.instrs() if i.opcode not in ('jz', 'jmp', 'ret')]
+                rng.shuffle(body)
+                for k, instr in enumerate(body):
+                    live.remove(instr)
+                    instr.dest, instr.opcode, instr.arg1, instr.arg2 = None, 'dead', None, None
+                    if k % 5 != 0: continue
+                    full = Liveness(cfg)
+                    for i in cfg.instrs():
+                        self.assertEqual(live.live_in(i), full.live_in(i))
+                        self.assertEqual(live.live_out(i), full.live_out(i))
+                        for t in full.temps:
+                            self.assertEqual(live.is_live_out(i, t),
+                                             t in full.live_out(i))
+
+if __name__ == '__main__':
+    unittest.main()
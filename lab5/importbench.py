@@ -0,0 +1,67 @@
+"""
+Usage: python3 importbench.py [-n N] [-o results.json] module ...
+
+Measures the startup cost of each module: the time a fresh interpreter,
+run from the current directory, takes to import it, as reported by
+python -X importtime. Prints the best of N runs for each module together
+with the modules it pulls in that cost the most, and whether PLY is among
+them; -o also records every import of the best runs as JSON.
+"""
+
+import json
+import subprocess
+import sys
+
+def import_times(module):
+    """
+    Imports module in a fresh interpreter, returning a dict from each
+    module imported to its own and cumulative import time in microseconds
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          capture_output=True, text=True, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'): continue
+        self_us, cumulative, name = line[len('import time:'):].split('|')
+        # skipping the header
+        if not self_us.strip().isdigit(): continue
+        # the imports of module come last, those of the interpreter's
+        # startup are the other unindented ones before them
+        if not name.startswith('  ') and name.strip() != module:
+            times.clear()
+            continue
+        times[name.strip()] = (int(self_us), int(cumulative))
+    return times
+
+def bench(module, runs):
+    """The import times of the fastest of runs imports of module"""
+    # the first run also compiles the bytecode, if it can be written
+    import_times(module)
+    return min((import_times(module) for _ in range(runs)),
+               key=lambda times: times[module][1])
+
+if __name__ == '__main__':
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument('modules', metavar='module', nargs='+')
+    ap.add_argument('-n', '--runs', type=int, default=10,
+                    help='how many times to import each module (default: 10)')
+    ap.add_argument('-o', metavar='results.json',
+                    help='record the import times of every module pulled in')
+    ap.add_argument('--top', type=int, default=5,
+                    help='how many of the costliest imports to show (default: 5)')
+    args = ap.parse_args()
+    results = {}
+    for module in args.modules:
+        times = bench(module, args.runs)
+        results[module] = times
+        ply = any(name == 'ply' or name.startswith('ply.') for name in times)
+        print(f'{module}: {times[module][1] / 1000:.1f} ms'
+              f'{" (imports ply)" if ply else ""}')
+        costliest = sorted((name for name in times if name != module),
+                           key=lambda name: times[name][0], reverse=True)
+        for name in costliest[:args.top]:
+            print(f'  {name}: {times[name][0] / 1000:.1f} ms')
+    if args.o:
+        with open(args.o, 'w') as fp:
+            json.dump(results, fp, indent=1)
@@ -0,0 +1,180 @@
+"""
+PLY lexers and parsers whose tables persist between runs
+
+PLY builds its tables by reflection on every start: it collects the t_ and
+p_ rules, checks them against their source files, compiles the master
+regular expressions of the lexer and generates the LALR tables of the
+parser. lex() and yacc() below do that once and write the result as a
+module in the __plycache__ directory next to the grammar (or $PLYTAB_DIR).
+Later starts import that module instead, as long as its signature, a hash
+of the grammar's source file and declarations, is unchanged. As grammars
+may share $PLYTAB_DIR, their table names must not clash.
+
+Usage: python3 plytab.py module ...
+Imports the modules, so that their tables are generated ahead of time.
+"""
+
+import importlib
+import importlib.util
+import os
+import re
+import sys
+import types
+import zlib
+import ply
+import ply.lex
+
+def source_file(module):
+    """The file defining module, which may be a class instance"""
+    if not isinstance(module, types.ModuleType):
+        module = sys.modules[type(module).__module__]
+    return module.__file__
+
+def signature(module, *extra):
+    with open(source_file(module), 'rb') as fp:
+        h = zlib.crc32(fp.read())
+    decls = [getattr(module, decl, None)
+             for decl in ('tokens', 'literals', 'states', 'precedence')]
+    h = zlib.crc32(repr((ply.__version__, decls, extra)).encode(), h)
+    return f'{h:08x}'
+
+def tabfile(module, tabname):
+    tabdir = os.environ.get('PLYTAB_DIR') or \
+        os.path.join(os.path.dirname(source_file(module)), '__plycache__')
+    return os.path.join(tabdir, f'{tabname}.py')
+
+# the tables already read, as grammars like that of TAC build a lexer per file
+loaded = {}
+
+def read_tab(fname, tabname, sig):
+    """The module in fname if it was written with signature sig, else None.
+    Only such modules are kept in loaded, so that a stale file is read again
+    once it has been rewritten."""
+    tab = loaded.get(fname)
+    if tab is None or tab._signature != sig:
+        try:
+            spec = importlib.util.spec_from_file_location(tabname, fname)
+            tab = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(tab)
+        except (OSError, SyntaxError):
+            return None
+        if getattr(tab, '_signature', None) != sig:
+            return None
+        loaded[fname] = tab
+    return tab
+
+def write_tab(fname, sig, tables):
+    """Writes the tables as a module, atomically, if fname can be written"""
+    try:
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        tmp = f'{fname}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as fp:
+            print(f'# generated by plytab.py, do not edit', file=fp)
+            print(f'_signature = {sig!r}', file=fp)
+            for name, value in tables.items():
+                print(f'_{name} = {value!r}', file=fp)
+        os.replace(tmp, fname)
+    except OSError:
+        pass
+
+# ------------------------------------------------------------------------------
+
+def lex(module, tabname, reflags=int(re.VERBOSE)):
+    """ply.lex.lex(module=module), with the tables cached as tabname"""
+    sig = signature(module, reflags)
+    fname = tabfile(module, tabname)
+    tab = read_tab(fname, tabname, sig)
+    if tab is None:
+        lexer = ply.lex.lex(module=module, reflags=reflags)
+        def name(f):
+            return f and f.__name__
+        write_tab(fname, sig, {
+            'lextokens': lexer.lextokens,
+            'lexliterals': lexer.lexliterals,
+            'lexstateinfo': lexer.lexstateinfo,
+            'lexstatere': {state: [(text, [f and (name(f[0]), f[1]) for f in findex])
+                                   for text, (_, findex)
+                                   in zip(lexer.lexstateretext[state], relist)]
+                           for state, relist in lexer.lexstatere.items()},
+            'lexstateignore': lexer.lexstateignore,
+            'lexstateerrorf': {state: name(f) for state, f in lexer.lexstateerrorf.items()},
+            'lexstateeoff': {state: name(f) for state, f in lexer.lexstateeoff.items()},
+        })
+        return lexer
+
+    def rule(fname):
+        return fname and getattr(module, fname)
+    lexer = ply.lex.Lexer()
+    lexer.lextokens = tab._lextokens
+    lexer.lexliterals = tab._lexliterals
+    lexer.lextokens_all = lexer.lextokens | set(lexer.lexliterals)
+    lexer.lexstateinfo = tab._lexstateinfo
+    lexer.lexreflags = reflags
+    for state, relist in tab._lexstatere.items():
+        lexer.lexstatere[state] = [(re.compile(text, reflags),
+                                    [f and (rule(f[0]), f[1]) for f in findex])
+                                   for text, findex in relist]
+        lexer.lexstateretext[state] = [text for text, _ in relist]
+    lexer.lexre = lexer.lexstatere['INITIAL']
+    lexer.lexretext = lexer.lexstateretext['INITIAL']
+    lexer.lexstateignore = tab._lexstateignore
+    lexer.lexignore = lexer.lexstateignore.get('INITIAL', '')
+    lexer.lexstateerrorf = {state: rule(f) for state, f in tab._lexstateerrorf.items()}
+    lexer.lexerrorf = lexer.lexstateerrorf.get('INITIAL', None)
+    lexer.lexstateeoff = {state: rule(f) for state, f in tab._lexstateeoff.items()}
+    lexer.lexeoff = lexer.lexstateeoff.get('INITIAL', None)
+    return lexer
+
+# ------------------------------------------------------------------------------
+
+class Production:
+    """What LRParser needs of a ply.yacc.Production"""
+    def __init__(self, str, name, len, func, file, line):
+        self.str = str
+        self.name = name
+        self.len = len
+        self.func = func
+        self.callable = None
+        self.file = file
+        self.line = line
+
+    def __str__(self):
+        return self.str
+
+    def bind(self, pdict):
+        if self.func:
+            self.callable = pdict[self.func]
+
+class Namespace:
+    """A mapping view of the attributes of a module or object"""
+    def __init__(self, module):
+        self.module = module
+
+    def __getitem__(self, name):
+        return getattr(self.module, name)
+
+def yacc(module, tabname, start=None):
+    """ply.yacc.yacc(module=module, start=start), with the tables cached as tabname"""
+    import ply.yacc
+    sig = signature(module, start)
+    fname = tabfile(module, tabname)
+    tab = read_tab(fname, tabname, sig)
+    if tab is None:
+        parser = ply.yacc.yacc(module=module, start=start)
+        write_tab(fname, sig, {
+            'lr_action': parser.action,
+            'lr_goto': parser.goto,
+            'lr_productions': [(p.str, p.name, p.len, p.func, p.file, p.line)
+                               for p in parser.productions],
+        })
+        return parser
+
+    lrtab = types.SimpleNamespace(lr_action=tab._lr_action, lr_goto=tab._lr_goto,
+                                  lr_productions=[Production(*p) for p in tab._lr_productions])
+    for p in lrtab.lr_productions:
+        p.bind(Namespace(module))
+    return ply.yacc.LRParser(lrtab, getattr(module, 'p_error', None))
+
+if __name__ == '__main__':
+    for name in sys.argv[1:]:
+        importlib.import_module(name)
@@ -2,42 +2,38 @@
 
 import tac
 import cfg as cfglib
-import re, random, os
+from tac_opcodes import arg1_uses, arg2_uses, dest_defs
 
 # ------------------------------------------------------------------------------
 # liveness
 
-_arg1_use = re.compile(r'add|sub|mul|div|mod|neg|and|or|xor|not|shl|shr|copy|ret|jz|jnz|jl|jle|jnl|jnle')
-_arg2_use = re.compile(r'add|sub|mul|div|mod|and|or|xor|shl|shr|param')
-_dest_def = re.compile(r'add|sub|mul|div|mod|neg|and|or|xor|not|shl|shr|const|copy|phi|call')
-
 def use_set(instr):
     s = set()
-    if _arg1_use.fullmatch(instr.opcode) and instr.arg1: s.add(instr.arg1)
-    if _arg2_use.fullmatch(instr.opcode) and instr.arg2: s.add(instr.arg2)
+    if instr.opcode in arg1_uses and instr.arg1: s.add(instr.arg1)
+    if instr.opcode in arg2_uses and instr.arg2: s.add(instr.arg2)
     if instr.opcode == 'phi': s.update(instr.arg1.values())
     return s
 
 def rewrite_use_temps_nonphi(instr, fn):
-    if _arg1_use.fullmatch(instr.opcode) and instr.arg1:
+    if instr.opcode in arg1_uses and instr.arg1:
         instr.arg1 = fn(instr.arg1)
-    if _arg2_use.fullmatch(instr.opcode) and instr.arg2:
+    if instr.opcode in arg2_uses and instr.arg2:
         instr.arg2 = fn(instr.arg2)
 
 def def_set(instr):
     s = set()
-    if _dest_def.fullmatch(instr.opcode) and instr.dest: s.add(instr.dest)
+    if instr.opcode in dest_defs and instr.dest: s.add(instr.dest)
     return s
 
 def rewrite_temps(instr, fn):
-    if _arg1_use.fullmatch(instr.opcode) and instr.arg1:
+    if instr.opcode in arg1_uses and instr.arg1:
         instr.arg1 = fn(instr.arg1)
-    if _arg2_use.fullmatch(instr.opcode) and instr.arg2:
+    if instr.opcode in arg2_uses and instr.arg2:
         instr.arg2 = fn(instr.arg2)
     if instr.opcode == 'phi':
         for l, t in instr.arg1.items():
             instr.arg1[l] = fn(t)
-    if _dest_def.fullmatch(instr.opcode) and instr.dest:
+    if instr.opcode in dest_defs and instr.dest:
         instr.dest = fn(instr.dest)
 
 # ------------------------------------------------------------------------------
@@ -52,11 +48,10 @@ def tmp_version(tmp):
     except ValueError: return ''
 
 def crude_ssagen(tlv, cfg):
-    livein, liveout = dict(), dict()
-    cfglib.recompute_liveness(cfg, livein, liveout)
+    live = cfglib.Liveness(cfg)
     for bl in cfg.nodes():
         prev_labs = list(cfg.predecessors(bl.label))
-        ts = livein[bl.first_instr()]
+        ts = live.live_in(bl.first_instr())
         if bl.label == cfg.lab_entry: prev_labs.append(cfg.proc_name)
         if len(prev_labs) == 0: prev_labs = [cfg.proc_name]
         bl.body[:0] = [tac.Instr(t, 'phi', ({l: t for l in prev_labs}, None)) \
@@ -79,9 +74,248 @@ def crude_ssagen(tlv, cfg):
             for lab_prev, root in instr.arg1.items():
                 instr.arg1[lab_prev] = ver_maps[lab_prev].get(root, root)
 
+def pruned_ssagen(tlv, cfg):
+    """SSA generation placing phis only where they are needed: a temporary
+    gets a phi at the start of a block if the block is in the iterated
+    dominance frontier of the blocks defining it and the temporary is live
+    in there. The temporaries are then renamed walking the dominator tree,
+    with a stack of versions per temporary."""
+    live = cfglib.Liveness(cfg)
+    idom = cfglib.dominators(cfg)
+    df = cfglib.dominance_frontiers(cfg, idom)
+    def_labs = dict()
+    for bl in cfg.nodes():
+        for instr in bl.instrs():
+            if instr.dest and instr.dest.startswith('%'):
+                def_labs.setdefault(instr.dest, set()).add(bl.label)
+    live_in = dict()
+    phis = {bl.label: [] for bl in cfg.nodes()}
+    phi_root = dict()
+    for t, labs in def_labs.items():
+        work, placed = list(labs), set()
+        while len(work) > 0:
+            for lab in df.get(work.pop(), ()):
+                if lab in placed: continue
+                placed.add(lab)
+                if lab not in live_in:
+                    live_in[lab] = live.live_in(cfg[lab].first_instr())
+                if t not in live_in[lab]: continue
+                prev_labs = list(cfg.predecessors(lab))
+                if lab == cfg.lab_entry: prev_labs.append(cfg.proc_name)
+                phi = tac.Instr(t, 'phi', ({l: t for l in prev_labs}, None))
+                phis[lab].append(phi)
+                phi_root[phi] = t
+                if lab not in labs: work.append(lab)
+    for lab, bl_phis in phis.items():
+        cfg[lab].body[:0] = bl_phis
+
+    children = {lab: [] for lab in phis}
+    for lab, dom in idom.items():
+        if lab != dom: children[dom].append(lab)
+    versions = cfglib.counter(transfn=lambda x: f'.{x}')
+    stacks = dict()
+    def top(t):
+        vers = stacks.get(t)
+        return vers[-1] if vers else t
+    # the unreachable blocks are renamed on their own
+    roots = [cfg.lab_entry] + [lab for lab in phis if lab not in idom]
+    for root in roots:
+        # an item (lab, None) renames block lab; (lab, pushed) pops the
+        # versions it pushed once its subtree is done
+        todo = [(root, None)]
+        while len(todo) > 0:
+            lab, pushed = todo.pop()
+            if pushed is not None:
+                for t in pushed: stacks[t].pop()
+                continue
+            pushed = []
+            for instr in cfg[lab].instrs():
+                if instr.opcode != 'phi':
+                    rewrite_use_temps_nonphi(instr, top)
+                if instr.dest and instr.dest.startswith('%'):
+                    t = instr.dest
+                    instr.dest = t + next(versions)
+                    stacks.setdefault(t, []).append(instr.dest)
+                    pushed.append(t)
+            for succ in cfg.successors(lab):
+                for phi in phis[succ]:
+                    phi.arg1[lab] = top(phi_root[phi])
+            todo.append((lab, pushed))
+            todo.extend((child, None) for child in children[lab])
+
+ssagens = {'crude': crude_ssagen, 'pruned': pruned_ssagen}
+
+# ------------------------------------------------------------------------------
+# out of SSA
+
+def sequentialize(copies, tmp):
+    """The copies (dest, src) of the parallel copy `copies' in an order in
+    which they can be performed one at a time. The dests must be distinct.
+    Every cycle of copies is broken by saving one of its values in the
+    temporary `tmp', which is free to reuse once the cycle is done."""
+    pending = {d: s for d, s in copies if d != s}
+    readers = dict()
+    for s in pending.values(): readers[s] = readers.get(s, 0) + 1
+    ready = [d for d in pending if d not in readers]
+    seq = []
+    while len(pending) > 0:
+        while len(ready) > 0:
+            d = ready.pop()
+            s = pending.pop(d)
+            seq.append((d, s))
+            readers[s] -= 1
+            if readers[s] == 0 and s in pending: ready.append(s)
+        if len(pending) > 0:
+            # only cycles are left, in which every dest is read exactly once
+            d = next(iter(pending))
+            seq.append((tmp, d))
+            for x, s in pending.items():
+                if s == d:
+                    pending[x] = tmp
+                    break
+            readers[tmp], readers[d] = 1, 0
+            ready.append(d)
+    return seq
+
+def remove_trivial_phis(cfg, du=None):
+    """Remove the phis whose arguments are all the same temporary, apart
+    from the dest itself: the dest is that temporary under another name,
+    and its uses are rewritten to it, which can make the phis using it
+    trivial in turn. The removed phis become 'dead' instructions. Needs
+    SSA form; the def-use chains `du' are built if not given."""
+    if du is None: du = cfglib.DefUse(cfg)
+    work = [instr for instr in cfg.instrs() if instr.opcode == 'phi']
+    while len(work) > 0:
+        phi = work.pop()
+        if phi.opcode != 'phi': continue
+        srcs = set(phi.arg1.values())
+        srcs.discard(phi.dest)
+        if len(srcs) != 1: continue
+        src = srcs.pop()
+        if not tac.Instr._istemp(src): continue
+        du.remove(phi)
+        work.extend(instr for instr in du.uses_of(phi.dest) if instr.opcode == 'phi')
+        du.replace_uses(phi.dest, src)
+        phi.dest = None
+        phi.opcode = 'dead'
+        phi.arg1 = None
+        phi.arg2 = None
+
+def out_of_ssa(tlv, cfg, du=None):
+    """Replace the phis of `cfg' by copies. The phis at the start of a block
+    become a parallel copy on each incoming edge, placed at the end of the
+    predecessor if it has no other successor, else at the start of the
+    block if it has no other predecessor, else in a new block splitting
+    the (critical) edge. The parallel copies are sequentialized, and then
+    the copies are coalesced with coalesce(). The trivial phis are removed
+    beforehand, using the def-use chains `du' if given."""
+    remove_trivial_phis(cfg, du)
+    labels = {bl.label for bl in cfg.nodes()}
+    fresh_labels = (lab for lab in cfglib.counter(transfn=lambda n: f'%.L{n}') \
+                    if lab not in labels)
+    tmps = set(tlv.t_args)
+    for instr in cfg.instrs():
+        tmps.update(instr.defs())
+        tmps.update(use_set(instr))
+    tmp = next(t for t in cfglib.counter(transfn=lambda n: f'%{n}') if t not in tmps)
+    edges = []
+    for bl in cfg.nodes():
+        phis = [instr for instr in bl.body if instr.opcode == 'phi']
+        if len(phis) == 0: continue
+        bl.body = [instr for instr in bl.body if instr.opcode != 'phi']
+        prev_labs = list(cfg.predecessors(bl.label))
+        if bl.label == cfg.lab_entry: prev_labs.append(cfg.proc_name)
+        for lab_prev in prev_labs:
+            copies = [(phi.dest, phi.arg1[lab_prev]) for phi in phis \
+                      if lab_prev in phi.arg1]
+            edges.append((lab_prev, bl.label, len(prev_labs), copies))
+    for lab_from, lab_to, n_preds, copies in edges:
+        seq = [tac.Instr(d, 'copy', (s, None)) for d, s in sequentialize(copies, tmp)]
+        if len(seq) == 0: continue
+        if lab_from != cfg.proc_name and cfg.out_degree(lab_from) == 1:
+            cfg[lab_from].body.extend(seq)
+        elif n_preds == 1:
+            cfg[lab_to].body[:0] = seq
+        else:
+            lab = next(fresh_labels)
+            cfg.add_node(cfglib.Block(lab, seq, [tac.Instr(None, 'jmp', (lab_to, None))]))
+            if lab_from == cfg.proc_name:
+                cfg.lab_entry = lab
+            else:
+                for jinstr in cfg[lab_from].jumps:
+                    cfglib.apply_label_rewrite(jinstr, {lab_to: lab})
+                cfg.remove_edge(lab_from, lab_to)
+                cfg.add_edge(lab_from, lab)
+    coalesce(tlv, cfg)
+
+def coalesce(tlv, cfg):
+    """Remove the copies between temporaries that do not interfere, giving
+    them the same name, then rename the temporaries other than the
+    arguments of `tlv' to %0, %1, ...
+
+    Two temporaries interfere when one of them is live out of an
+    instruction defining the other, unless that instruction is a copy
+    between them; the arguments are defined together at the entry. The
+    temporaries are merged into classes that interfere with whatever any
+    of their members interferes with. Only the interferences between the
+    temporaries of copies are recorded, as int bitsets."""
+    live = cfglib.Liveness(cfg)
+    copies = dict()
+    for instr in cfg.instrs():
+        if instr.opcode == 'copy' and tac.Instr._istemp(instr.dest) \
+           and tac.Instr._istemp(instr.arg1):
+            copies[instr] = None
+    arg_bits = live.bits(tlv.t_args)
+    cands = arg_bits
+    for instr in copies: cands |= live.bit(instr.dest) | live.bit(instr.arg1)
+    adj = dict()        # bit number -> bitset of the interfering candidates
+    for t in tlv.t_args:
+        adj[live.number(t)] = live.block_in.get(cfg.lab_entry, 0) & cands | arg_bits
+    for bl in cfg.nodes():
+        out = live.block_out.get(bl.label, 0)
+        for instr in bl.reversed_instrs():
+            d = live.bits(instr.defs())
+            if d & cands:
+                o = out & cands
+                if instr in copies: o &= ~live.bit(instr.arg1)
+                n = d.bit_length() - 1
+                adj[n] = adj.get(n, 0) | o
+            out = out & ~d | live.bits(instr.uses())
+
+    parent = dict()     # bit number -> bit number of a temporary of its class
+    members = dict()    # bit number of a representative -> bitset of its class
+    def find(n):
+        while n in parent: n = parent[n]
+        return n
+    for instr in copies:
+        a, b = find(live.number(instr.dest)), find(live.number(instr.arg1))
+        if a == b: continue
+        ma, mb = members.get(a, 1 << a), members.get(b, 1 << b)
+        if adj.get(a, 0) & mb or adj.get(b, 0) & ma: continue
+        # an argument stays the representative of its class
+        if mb & arg_bits: a, b = b, a
+        parent[b] = a
+        members[a] = ma | mb
+        adj[a] = adj.get(a, 0) | adj.pop(b, 0)
+        members.pop(b, None)
+
+    names = dict()
+    fresh = (t for t in cfglib.counter(transfn=lambda n: f'%{n}') \
+             if t not in tlv.t_args)
+    def rename(t):
+        n = find(live.number(t))
+        if n not in names:
+            names[n] = live.temps[n] if (1 << n) & arg_bits else next(fresh)
+        return names[n]
+    for bl in cfg.nodes():
+        for instr in bl.instrs(): instr.rewrite_temps(rename)
+        bl.body = [instr for instr in bl.body \
+                   if instr.opcode != 'copy' or instr.dest != instr.arg1]
+
 # ------------------------------------------------------------------------------
 
 def make_dotfiles(cfg, procname, fname, verbosity):
+    import os
     if fname.endswith('.tac.json'): fname = fname[:-5]
     kwargs = dict()
     if verbosity >= 1:
@@ -93,18 +327,18 @@ def make_dotfiles(cfg, procname, fname, verbosity):
     os.system(f'dot -Tpdf -O {fname}.{procname}.dot')
 
 if __name__ == '__main__':
-    import os
     from argparse import ArgumentParser
     ap = ArgumentParser(description='TAC library, parser, and interpreter')
     ap.add_argument('file', metavar='FILE', type=str, nargs=1, help='A TAC file')
     ap.add_argument('-v', dest='verbosity', default=0, action='count',
                     help='increase verbosity')
+    ap.add_argument('--ssa', dest='ssa', default='crude', choices=ssagens.keys(),
+                    help='how to place the phis (default: crude)')
     args = ap.parse_args()
-    gvars, procs = dict(), dict()
     for tlv in tac.load_tac(args.file[0]):
         if isinstance(tlv, tac.Proc):
             cfg = cfglib.infer(tlv)
-            crude_ssagen(tlv, cfg)
+            ssagens[args.ssa](tlv, cfg)
             make_dotfiles(cfg, tlv.name[1:], args.file[0], args.verbosity)
             if args.verbosity >= 2:
                 cfglib.linearize(tlv, cfg)
@@ -0,0 +1,168 @@
+import io
+import random
+import unittest
+from contextlib import redirect_stdout
+from tac import Instr, Proc, execute
+import cfg as cfglib
+from cfg_tests import random_proc
+from ssagen import *
+
+def proc(*body):
+    return Proc('@main', (), [Instr(*i) for i in body])
+
+def phis(cfg):
+    return [i for i in cfg.instrs() if i.opcode == 'phi']
+
+def run(proc):
+    out = io.StringIO()
+    with redirect_stdout(out):
+        return execute({}, {proc.name: proc}, proc.name, [])
+
+# %1 is redefined on one side of a diamond and used after the join, %3
+# is redefined there too but dead after it
+DIAMOND = (
+    (None, 'label', ('%.L0',)),
+    ('%0', 'const', (1,)),
+    ('%1', 'const', (2,)),
+    ('%3', 'const', (5,)),
+    (None, 'jz', ('%0', '%.L2')),
+    (None, 'label', ('%.L1',)),
+    ('%1', 'const', (3,)),
+    ('%3', 'const', (6,)),
+    (None, 'jmp', ('%.L3',)),
+    (None, 'label', ('%.L2',)),
+    (None, 'jmp', ('%.L3',)),
+    (None, 'label', ('%.L3',)),
+    ('%2', 'add', ('%0', '%1')),
+    (None, 'ret', ('%2',)))
+
+class testSSAGen(unittest.TestCase):
+    def assertSSA(self, cfg):
+        defs = [t for i in cfg.instrs() for t in i.defs()]
+        self.assertEqual(len(defs), len(set(defs)))
+
+    def test_pruned_diamond(self):
+        p = proc(*DIAMOND)
+        cfg = cfglib.infer(p)
+        pruned_ssagen(p, cfg)
+        self.assertSSA(cfg)
+        (phi,) = phis(cfg)
+        self.assertEqual(tmp_root(phi.dest), '%1')
+        self.assertEqual(len(phi.arg1), 2)
+        cfglib.linearize(p, cfg)
+        self.assertEqual(run(p), 4)
+
+    def test_crude_diamond(self):
+        p = proc(*DIAMOND)
+        cfg = cfglib.infer(p)
+        crude_ssagen(p, cfg)
+        self.assertSSA(cfg)
+        # one phi per temporary live in, at every block but the entry
+        self.assertEqual(len(phis(cfg)), 5)
+        cfglib.linearize(p, cfg)
+        self.assertEqual(run(p), 4)
+
+    def test_pruned_fewer_phis(self):
+        rng = random.Random(8)
+        for _ in range(30):
+            orig = random_proc(rng)
+            counts = dict()
+            for ssa in ssagens:
+                p = proc(*((i.dest, i.opcode, (i.arg1, i.arg2)) for i in orig.body))
+                cfg = cfglib.infer(p)
+                ssagens[ssa](p, cfg)
+                self.assertSSA(cfg)
+                counts[ssa] = len(phis(cfg))
+            self.assertLessEqual(counts['pruned'], counts['crude'])
+
+class testSequentialize(unittest.TestCase):
+    def check(self, copies, ncycles=0):
+        env = {t: t for c in copies for t in c}
+        expected = dict(env)
+        expected.update((d, env[s]) for d, s in copies)
+        seq = sequentialize(copies, '%t')
+        for d, s in seq: env[d] = env[s]
+        env.pop('%t', None)
+        self.assertEqual(env, expected)
+        self.assertEqual(len(seq), len([c for c in copies if c[0] != c[1]]) + ncycles)
+
+    def test_chain(self):
+        self.check([('%a', '%b'), ('%b', '%c'), ('%c', '%d')])
+
+    def test_self_copy(self):
+        self.check([('%a', '%a'), ('%b', '%a')])
+
+    def test_swap(self):
+        self.check([('%a', '%b'), ('%b', '%a')], 1)
+
+    def test_cycle(self):
+        self.check([('%a', '%b'), ('%b', '%c'), ('%c', '%d'), ('%d', '%a')], 1)
+
+    def test_cycle_with_tails(self):
+        self.check([('%a', '%b'), ('%b', '%a'), ('%c', '%a'), ('%d', '%b'),
+                    ('%e', '%c')], 1)
+
+    def test_two_cycles(self):
+        self.check([('%a', '%b'), ('%b', '%a'), ('%c', '%d'), ('%d', '%e'),
+                    ('%e', '%c')], 2)
+
+    def test_fan_out(self):
+        self.check([('%b', '%a'), ('%c', '%a'), ('%a', '%c')], 1)
+
+class testOutOfSSA(unittest.TestCase):
+    # %2 and %3 are swapped on the back edge %.L1 -> %.L1, which is critical
+    LOOP = (
+        (None, 'label', ('%.L0',)),
+        ('%0', 'const', (3,)),
+        ('%1', 'const', (1,)),
+        ('%2', 'const', (10,)),
+        ('%3', 'const', (20,)),
+        (None, 'label', ('%.L1',)),
+        ('%4', 'copy', ('%2',)),
+        ('%2', 'copy', ('%3',)),
+        ('%3', 'copy', ('%4',)),
+        ('%0', 'sub', ('%0', '%1')),
+        (None, 'jnz', ('%0', '%.L1')),
+        (None, 'label', ('%.L2',)),
+        ('%5', 'sub', ('%2', '%3')),
+        (None, 'ret', ('%5',)))
+
+    def test_critical_edge(self):
+        for ssa in ssagens:
+            with self.subTest(ssa=ssa):
+                p = proc(*self.LOOP)
+                cfg = cfglib.infer(p)
+                ssagens[ssa](p, cfg)
+                # with the copies propagated, the phis are a parallel swap
+                du = cfglib.DefUse(cfg)
+                for i in list(cfg.instrs()):
+                    if i.opcode == 'copy':
+                        du.remove(i)
+                        du.replace_uses(i.dest, i.arg1)
+                        i.dest, i.opcode, i.arg1, i.arg2 = None, 'dead', None, None
+                nblocks = len(list(cfg.nodes()))
+                out_of_ssa(p, cfg, du)
+                self.assertEqual(phis(cfg), [])
+                # the back edge goes through a new block holding its copies
+                self.assertEqual(len(list(cfg.nodes())), nblocks + 1)
+                (lab,) = set(cfg.predecessors('%.L1')) - {'%.L0'}
+                self.assertEqual(list(cfg.successors(lab)), ['%.L1'])
+                self.assertEqual(list(cfg.predecessors(lab)), ['%.L1'])
+                self.assertTrue(all(i.opcode == 'copy' for i in cfg[lab].body))
+                cfglib.linearize(p, cfg)
+                p.body = [i for i in p.body if i.opcode != 'dead']
+                self.assertEqual(run(p), 10)
+
+    def test_no_critical_edge(self):
+        p = proc(*DIAMOND)
+        cfg = cfglib.infer(p)
+        pruned_ssagen(p, cfg)
+        nblocks = len(list(cfg.nodes()))
+        out_of_ssa(p, cfg)
+        self.assertEqual(phis(cfg), [])
+        self.assertEqual(len(list(cfg.nodes())), nblocks)
+        cfglib.linearize(p, cfg)
+        self.assertEqual(run(p), 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,6 +7,8 @@ Also includes a parser and interpreter.
 """
 
 from io import StringIO
+import weakref
+from operator import itemgetter
 
 # ------------------------------------------------------------------------------
 
@@ -161,17 +163,57 @@ class Instr:
 
     @property
     def js_obj(self):
-        """A basic Python object ready to JSONify with json.dump()"""
+        """A basic Python object ready to JSONify with json.dump(); the
+        trailing None arguments are left out, as in the BX compilers"""
+        args = [self.arg1, self.arg2]
+        while args and args[-1] is None: args.pop()
         return {'opcode': self.opcode,
-                'args': (self.arg1, self.arg2),
+                'args': args,
                 'result': self.dest}
 
+class _Body(list):
+    """The instruction list of a Proc: every change to it that can keep or
+    shrink its length bumps the version of the proc, so that decode()
+    notices. Appending is left at full speed, as it always grows the list."""
+
+    __slots__ = ('proc',)
+
+    def __init__(self, proc, instrs):
+        super().__init__(instrs)
+        self.proc = proc
+
+def _bumping(meth):
+    def bump(self, *args, **kwargs):
+        self.proc.version += 1
+        return meth(self, *args, **kwargs)
+    bump.__name__ = meth.__name__
+    return bump
+
+for _meth in ('__setitem__', '__delitem__', '__imul__', 'insert', 'pop',
+              'remove', 'clear', 'sort', 'reverse'):
+    setattr(_Body, _meth, _bumping(getattr(list, _meth)))
+del _meth
+
 class Proc:
     def __init__(self, name, t_args, body):
         self.name = name
+        self.version = 0
         self.body = body or []
         self.t_args = tuple(t_args)
 
+    @property
+    def body(self):
+        return self._body
+
+    @body.setter
+    def body(self, instrs):
+        self._body = _Body(self, instrs)
+        self.version += 1
+
+    def changed(self):
+        """Note that an instruction of the body was edited in place"""
+        self.version += 1
+
     def __str__(self):
         result = StringIO()
         result.write(f'proc {self.name}({", ".join(self.t_args)}):\n')
@@ -218,8 +260,8 @@ class Gvar:
                 'init': self.value}
 
 # ------------------------------------------------------------------------------
-
-import ply.lex
+# The lexer and parser import PLY when they are first built, so that
+# programs that only read .tac.json files do not pay for it
 
 class Lexer:
     reserved = {
@@ -271,13 +313,12 @@ class Lexer:
     def __init__(self, text, provenance="<unknown>"):
         self.text = text
         self.provenance = provenance
-        self.lexer = ply.lex.lex(module=self)
+        import plytab
+        self.lexer = plytab.lex(self, 'lab5_tac_lextab')
         self.lexer.input(self.text)
 
 # ------------------------------------------------------------------------------
 
-import ply.yacc
-
 class Parser:
     tokens = Lexer.tokens
 
@@ -364,7 +405,8 @@ class Parser:
 
     def __init__(self, lexer):
         self.lexer = lexer
-        self.parser = ply.yacc.yacc(module=self, start='program')
+        import plytab
+        self.parser = plytab.yacc(self, 'lab5_tac_parsetab', start='program')
 
     def parse(self):
         return self.parser.parse(lexer=self.lexer.lexer, tracking=True)
@@ -409,167 +451,410 @@ jumps = {
     'jnle': (lambda k: untwoc(k) > 0),
 }
 
-class TempMap(dict):
-    """Mapping temporaries to values"""
-
-    def __init__(self, gvars):
-        super().__init__()
-        self.gvars = gvars
-
-    def _valid_temp(self, tmp):
-        return isinstance(tmp, str) and \
-               (tmp.startswith('%') or tmp.startswith('@'))
-
-    def _valid_value(self, val):
-        return isinstance(val, int) and \
-               0 <= val <= 0xffffffffffffffff
-
-    def __getitem__(self, tmp):
-        if tmp.startswith('@'):
-            return self.gvars[tmp].value
-        return super().__getitem__(tmp)
-
-    def copy(self):
-        tm = TempMap(self.gvars.copy())
-        for k, v in super().items():
-            tm[k] = v
-        return tm
-
-    def __setitem__(self, tmp, val):
-        assert self._valid_temp(tmp)
-        if not self._valid_value(val):
-            raise RuntimeError(f'Illegal value: {val}: '
-                               f'{-0x8000000000000000 <= val} '
-                               f'{val < 0x8000000000000000}')
-        if tmp.startswith('@'):
-            self.gvars[tmp].value = val
-        else:
-            super().__setitem__(tmp, val)
+# Registers only ever hold 64-bit words, so the operations below that do not
+# depend on the sign can work on the words directly
+wrapping_binops = {
+    'add' : (lambda u, v: (u + v) & full_mask),
+    'sub' : (lambda u, v: (u - v) & full_mask),
+    'mul' : (lambda u, v: (u * v) & full_mask),
+    'and' : (lambda u, v: u & v),
+    'or'  : (lambda u, v: u | v),
+    'xor' : (lambda u, v: u ^ v),
+}
 
-def execute(gvars, procs, proc_name, args, **kwargs):
-    show_proc = kwargs.get('show_proc', False)
-    show_instr = kwargs.get('show_instr', False)
-    only_decimal = kwargs.get('only_decimal', True)
-    depth = kwargs.get('depth', 0)
-    indent = '  ' * depth
+class _Undefined:
+    """The value of a temporary before it is first assigned. It can be
+    copied around, as the phis do on the paths where it is never used,
+    but using it in any other way raises a RuntimeError naming it."""
+    __slots__ = ('tmp', 'proc')
 
-    values = TempMap(gvars)
-    proc = procs[proc_name]
+    def __init__(self, tmp, proc):
+        self.tmp = tmp
+        self.proc = proc
 
-    for i in range(len(proc.t_args)):
-        values[proc.t_args[i]] = args[i]
+    def __repr__(self):
+        return f'<undefined {self.tmp}>'
 
-    oldvalues = values.copy()
+    def _fail(self, *args):
+        raise RuntimeError(f'Undefined temporary {self.tmp} used in {self.proc}')
 
-    proc_desc = f'{proc_name}({",".join(k + "=" + str(v) for k, v in values.items())})'
-    if show_proc: print(f'// {indent}entering {proc_desc}')
+    __eq__ = __ne__ = __lt__ = __le__ = __gt__ = __ge__ = __bool__ = _fail
+    __add__ = __radd__ = __sub__ = __rsub__ = __mul__ = __rmul__ = _fail
+    __and__ = __rand__ = __or__ = __ror__ = __xor__ = __rxor__ = _fail
+    __lshift__ = __rlshift__ = __rshift__ = __rrshift__ = _fail
+    __neg__ = __invert__ = __index__ = __int__ = _fail
+    __hash__ = None
 
-    labels = dict()
-    for i, instr in enumerate(proc.body):
-        if instr.opcode != 'label': continue
-        if instr.arg1 in labels:
-            raise RuntimeError(f'Reused label {instr.arg1}')
-        ni = i + 1 # next instruction index
-        while ni < len(proc.body):
-            if proc.body[ni].opcode != 'label': break
-            ni += 1
-        labels[instr.arg1] = ni
+def _check_value(val):
+    if not (isinstance(val, int) and 0 <= val <= 0xffffffffffffffff):
+        if isinstance(val, _Undefined): val._fail()
+        raise RuntimeError(f'Illegal value: {val}')
+    return val
 
-    lab_prev, lab_cur = None, proc_name
+# ------------------------------------------------------------------------------
+
+# Operation codes of pre-decoded instructions, roughly in order of frequency
+(_COPY, _BINOP, _JCC, _JMP, _CONST, _PCOPY, _LOADG, _STOREG, _PARAM,
+ _CALL, _PRINT, _RET, _UNOP, _NOP, _FALLOFF, _TRAP) = range(16)
+
+class Code:
+    """A proc pre-decoded for execute().
+
+    Every temporary of the proc is numbered ahead of time with a slot in a
+    flat register list of length `nslots', the arguments coming first at
+    `arg_slots'. A fresh register list starts out as a copy of `init_regs',
+    holding an _Undefined value for each temporary. Globals are numbered
+    separately in `globals' and are only touched by _LOADG and _STOREG,
+    which copy between a global and its shadow slot around the instruction
+    that uses or defines it.
+
+    Each instruction is a tuple in `ops' whose first item is one of the
+    _XXX operation codes and whose other items are the operands, with jump
+    destinations already resolved to indices into `ops'. Labels produce no
+    code. The phis at the start of a block are turned into one parallel
+    copy per incoming edge: inline for the fallthrough edge, and in a
+    trampoline appended after the body for every jump, so that no frame
+    ever needs to be snapshotted at runtime. The source label of an edge
+    is the label most recently passed before the jump or fallthrough.
+
+    The source instruction at each index is kept in `instrs' for tracing
+    (None for the helpers added by the decoder)."""
+
+    __slots__ = ('name', 'version', 'size', 't_args', 'arg_slots', 'nslots',
+                 'init_regs', 'globals', 'ops', 'instrs')
+
+    def __init__(self, proc):
+        self.name = proc.name
+        self.version = proc.version
+        self.size = len(proc.body)
+        self.t_args = proc.t_args
+        slots, gslots = dict(), dict()
+        ops, instrs = [], []
+        labels = dict()     # label -> index of the first op of its block
+        block_phis = dict() # label -> phis at the start of its block
+
+        def slot(tmp):
+            s = slots.get(tmp)
+            if s is None: s = slots[tmp] = len(slots)
+            return s
+
+        def gslot(gsym):
+            return gslots.setdefault(gsym, len(gslots))
+
+        def use(x):
+            """Slot holding the current value of temporary or global `x'"""
+            if x.startswith('@'):
+                ops.append((_LOADG, slot(x), gslot(x)))
+                instrs.append(None)
+            return slot(x)
+
+        def emit(op, instr):
+            ops.append(op)
+            instrs.append(instr)
+            if instr is not None and instr.dest and instr.dest.startswith('@'):
+                ops.append((_STOREG, gslot(instr.dest), slot(instr.dest)))
+                instrs.append(None)
+
+        def emit_edge(lab_from, phis, tgt=None):
+            """Emit the parallel copy performing `phis' when coming from
+            `lab_from', then continue at index `tgt' (by default, with
+            whatever op gets emitted next)"""
+            dsts, srcs = [], []
+            for phi in phis:
+                x = phi.arg1.get(lab_from)
+                if x is None:
+                    emit((_TRAP, f'cannot resolve phi: '
+                                 f'came from {lab_from}, '
+                                 f'can only handle [{",".join(phi.arg1.keys())}]'), None)
+                    return
+                dsts.append(slot(phi.dest))
+                srcs.append(use(x))
+            if len(srcs) > 1: get = itemgetter(*srcs)
+            else: get = lambda regs, s=srcs[0]: (regs[s],)
+            stores = [phi.dest for phi in phis if phi.dest.startswith('@')]
+            if tgt is None or stores:
+                emit((_PCOPY, tuple(dsts), get, len(ops) + 1), None)
+                for gsym in stores:
+                    emit((_STOREG, gslot(gsym), slot(gsym)), None)
+                if tgt is not None: emit((_JMP, tgt), None)
+            else:
+                emit((_PCOPY, tuple(dsts), get, tgt), None)
+
+        self.arg_slots = tuple(slot(t) for t in self.t_args)
+        lab_cur = self.name
+        body = proc.body
+        cur = 0
+        while cur < len(body):
+            instr = body[cur]
+            cur += 1
+            opcode = instr.opcode
+            if opcode == 'label':
+                lab_prev, run = lab_cur, [instr.arg1]
+                while cur < len(body) and body[cur].opcode == 'label':
+                    run.append(body[cur].arg1)
+                    cur += 1
+                phis = []
+                while cur < len(body) and body[cur].opcode == 'phi':
+                    phis.append(body[cur])
+                    cur += 1
+                if phis: emit_edge(lab_prev, phis)
+                for lab in run:
+                    if lab in labels:
+                        raise RuntimeError(f'Reused label {lab}')
+                    labels[lab] = len(ops)
+                    block_phis[lab] = phis
+                lab_cur = run[-1]
+            elif opcode == 'copy':
+                emit((_COPY, slot(instr.dest), use(instr.arg1)), instr)
+            elif opcode in binops:
+                u, v = use(instr.arg1), use(instr.arg2)
+                fn = wrapping_binops.get(opcode, binops[opcode])
+                emit((_BINOP, slot(instr.dest), fn, u, v), instr)
+            elif opcode in jumps:
+                emit((_JCC, jumps[opcode], use(instr.arg1), lab_cur, instr.arg2), instr)
+            elif opcode == 'jmp':
+                emit((_JMP, lab_cur, instr.arg1), instr)
+            elif opcode == 'const':
+                if not isinstance(instr.arg1, int):
+                    emit((_TRAP, f'Missing or bad argument: {instr.arg1}'), instr)
+                else:
+                    emit((_CONST, slot(instr.dest), twoc(instr.arg1)), instr)
+            elif opcode == 'phi':
+                emit((_TRAP, f'phi not at the start of a block: {instr}'), instr)
+            elif opcode == 'param':
+                if not isinstance(instr.arg1, int) or instr.arg1 < 1:
+                    print(f'Bad argument to param: '
+                          f'expecting int >= 1, got {instr.arg1}')
+                emit((_PARAM, instr.arg1 - 1, use(instr.arg2)), instr)
+            elif opcode == 'call':
+                if instr.arg1.startswith('@__bx_print'):
+                    emit((_PRINT, instr.arg1), instr)
+                else:
+                    dest = slot(instr.dest) if instr.dest else None
+                    emit((_CALL, dest, instr.arg1, instr.arg2), instr)
+            elif opcode == 'ret':
+                emit((_RET, None if instr.arg1 == None else use(instr.arg1)), instr)
+            elif opcode in unops:
+                emit((_UNOP, slot(instr.dest), unops[opcode], use(instr.arg1)), instr)
+            elif opcode == 'nop':
+                emit((_NOP,), instr)
+            else:
+                emit((_TRAP, f'Unknown opcode {opcode}'), instr)
+        emit((_FALLOFF,), None)
+
+        # resolve the jumps, going through a trampoline for edges with phis;
+        # a jmp whose trampoline is a single parallel copy just becomes it
+        trampolines = dict()
+        def target(lab_from, lab_to):
+            if not block_phis[lab_to]: return labels[lab_to]
+            edge = (lab_from, lab_to)
+            if edge not in trampolines:
+                start = len(ops)
+                emit_edge(lab_from, block_phis[lab_to], labels[lab_to])
+                trampolines[edge] = (start, len(ops) - start)
+            return trampolines[edge][0]
+        for i in range(len(ops)):
+            op = ops[i]
+            if op[0] != _JMP and op[0] != _JCC: continue
+            lab_from, lab_to = op[-2], op[-1]
+            if lab_to not in labels:
+                ops[i] = (_TRAP, f'Unknown jump destination {lab_to}')
+                continue
+            tgt = target(lab_from, lab_to)
+            if op[0] == _JMP and tgt != labels[lab_to] and \
+               trampolines[lab_from, lab_to][1] == 1:
+                ops[i] = ops[tgt]
+            else:
+                ops[i] = op[:-2] + (tgt,)
+
+        self.nslots = len(slots)
+        self.init_regs = tuple(_Undefined(tmp, self.name) for tmp in slots)
+        self.globals = tuple(gslots)
+        self.ops = ops
+        self.instrs = instrs
+
+_code_cache = weakref.WeakKeyDictionary()
+
+def decode(proc):
+    """Return the pre-decoded Code for `proc'. The result is cached until
+    `proc.body' is assigned, modified or appended to, which changes the
+    version of `proc' or the length of its body; editing the fields of an
+    instruction must be followed by a call to `proc.changed()'."""
+    code = _code_cache.get(proc)
+    if code is None or code.version != proc.version or code.size != len(proc.body):
+        code = Code(proc)
+        _code_cache[proc] = code
+    return code
+
+def execute(gvars, procs, proc_name, args, **kwargs):
+    """Run the proc `proc_name' on `args' and return its result.
+
+    Calls between TAC procs do not recurse in Python: the caller's frame
+    (code, pc, registers, return destination) is pushed on an explicit
+    stack, so the call depth is only bounded by memory."""
+    show_proc = kwargs.get('show_proc', False)
+    show_instr = kwargs.get('show_instr', False)
+    only_decimal = kwargs.get('only_decimal', True)
+    depth = kwargs.get('depth', 0)
+
+    codes = dict()
+    def load(name):
+        """The Code of proc `name' and its table of globals"""
+        entry = codes.get(name)
+        if entry is None:
+            code = decode(procs[name])
+            entry = codes[name] = (code, [gvars[gsym] for gsym in code.globals])
+        return entry
+
+    def describe(code, args):
+        return f'{code.name}({",".join(t + "=" + str(v) for t, v in zip(code.t_args, args))})'
+
+    stack = []
+    code, gtab = load(proc_name)
+    regs = list(code.init_regs)
+    for i, s in enumerate(code.arg_slots):
+        regs[s] = _check_value(args[i])
+    if show_proc: print(f'// {"  " * depth}entering {describe(code, args)}')
+
+    ops = code.ops
     pc = 0
     params = []
-    while pc in range(len(proc.body)):
-        instr = proc.body[pc]
+    while True:
+        op = ops[pc]
         pc += 1
 
-        if show_instr: print(f'// {indent}[{pc+1: 4d}] {instr}')
-        if instr.opcode == 'nop':
-            pass
-        elif instr.opcode == 'label':
-            lab_prev, lab_cur = lab_cur, instr.arg1
-        elif instr.opcode == 'phi':
-            for lab, tmp in instr.arg1.items():
-                if lab == lab_prev:
-                    values[instr.dest] = oldvalues[tmp]
-                    break
-            else:
-                raise RuntimeError(f'cannot resolve phi: '
-                                   f'came from {lab_prev}, '
-                                   f'can only handle [{",".join(instr.arg1.keys())}]')
-        elif instr.opcode == 'jmp':
-            if instr.arg1 not in labels:
-                raise RuntimeError(f'Unknown jump destination {instr.arg1}')
-            lab_prev, lab_cur = lab_cur, instr.arg1
-            oldvalues = values.copy()
-            pc = labels[lab_cur]
-        elif instr.opcode in jumps:
-            k = values[instr.arg1]
-            if instr.arg2 not in labels:
-                raise RuntimeError(f'Unknown jump destination {instr.arg2}')
-            if jumps[instr.opcode](k):
-                lab_prev, lab_cur = lab_cur, instr.arg2
-                oldvalues = values.copy()
-                pc = labels[lab_cur]
-        elif instr.opcode == 'const':
-            if not isinstance(instr.arg1, int):
-                print(f'Missing or bad argument: {instr.arg1}')
-                raise RuntimeError
-            values[instr.dest] = twoc(instr.arg1)
-        elif instr.opcode == 'copy':
-            values[instr.dest] = values[instr.arg1]
-        elif instr.opcode == 'param':
-            if not isinstance(instr.arg1, int) or instr.arg1 < 1:
-                print(f'Bad argument to param: '
-                      f'expecting int >= 1, got {instr.arg1}')
-            # make params big enough to hold instr.arg1 items
-            for _ in range(instr.arg1 - len(params)):
+        if show_instr and code.instrs[pc-1]:
+            print(f'// {"  " * (depth + len(stack))}[{pc+1: 4d}] {code.instrs[pc-1]}')
+        kind = op[0]
+        if kind == _COPY:
+            regs[op[1]] = regs[op[2]]
+        elif kind == _BINOP:
+            regs[op[1]] = op[2](regs[op[3]], regs[op[4]])
+        elif kind == _JCC:
+            if op[1](regs[op[2]]): pc = op[3]
+        elif kind == _JMP:
+            pc = op[1]
+        elif kind == _CONST:
+            regs[op[1]] = op[2]
+        elif kind == _PCOPY:
+            for d, v in zip(op[1], op[2](regs)):
+                regs[d] = v
+            pc = op[3]
+        elif kind == _LOADG:
+            regs[op[1]] = gtab[op[2]].value
+        elif kind == _STOREG:
+            gtab[op[1]].value = regs[op[2]]
+        elif kind == _PARAM:
+            # make params big enough to hold the op[1]-th item
+            for _ in range(op[1] + 1 - len(params)):
                 params.append(None)
-            params[instr.arg1 - 1] = values[instr.arg2]
-        elif instr.opcode == 'call':
-            if instr.arg1.startswith('@__bx_print'):
-                if len(params) != 1:
-                    raise RuntimeError(f'Bad number of arguments to print(): '
-                                       f'expected 1, got {len(params)}')
-                if instr.arg1 == '@__bx_print_int':
-                    u = params[0]
-                    if only_decimal: print(str(untwoc(u)))
-                    else: print(f'{untwoc(u): 20d}  0x{u:016x}  0b{u:064b}')
-                elif instr.arg1 == '@__bx_print_bool':
-                    print('false' if params[0] == 0 else 'true')
-                else:
-                    raise RuntimeError(f'Unknown print() specialization: {instr.arg1}')
+            params[op[1]] = regs[op[2]]
+        elif kind == _CALL:
+            if len(params) < op[3]:
+                raise RuntimeError(f'Bad number of arguments to {op[2]}(): '
+                                   f'expected {op[3]}, got {len(params)}')
+            stack.append((code, gtab, pc, regs, op[1], args))
+            code, gtab = load(op[2])
+            args, params = params, []
+            regs = list(code.init_regs)
+            for i, s in enumerate(code.arg_slots):
+                regs[s] = _check_value(args[i])
+            if show_proc:
+                print(f'// {"  " * (depth + len(stack))}entering {describe(code, args)}')
+            ops = code.ops
+            pc = 0
+        elif kind == _PRINT:
+            if len(params) != 1:
+                raise RuntimeError(f'Bad number of arguments to print(): '
+                                   f'expected 1, got {len(params)}')
+            if op[1] == '@__bx_print_int':
+                u = params[0]
+                if only_decimal: print(str(untwoc(u)))
+                else: print(f'{untwoc(u): 20d}  0x{u:016x}  0b{u:064b}')
+            elif op[1] == '@__bx_print_bool':
+                print('false' if params[0] == 0 else 'true')
             else:
-                if len(params) < instr.arg2:
-                    raise RuntimeError(f'Bad number of arguments to {instr.arg1}(): '
-                                       f'expected {instr.arg2}, got {len(params)}')
-                kwargs['depth'] = depth + 1
-                result = execute(gvars, procs, instr.arg1, params, **kwargs)
-                if instr.dest:
-                    values[instr.dest] = result
+                raise RuntimeError(f'Unknown print() specialization: {op[1]}')
             params = []
-        elif instr.opcode == 'ret':
-            retval = None if instr.arg1 == None else values[instr.arg1]
-            if show_proc:
-                print(f'// {indent}{proc_desc} --> {retval}')
-            return retval
-        elif instr.opcode in binops:
-            u = values[instr.arg1]
-            v = values[instr.arg2]
-            values[instr.dest] = binops[instr.opcode](u, v)
-        elif instr.opcode in unops:
-            u = values[instr.arg1]
-            if instr.arg2 != None:
-                print(f'Unary operator {instr.opcode} has two arguments!')
-                raise RuntimeError
-            values[instr.dest] = unops[instr.opcode](u)
+        elif kind == _RET or kind == _FALLOFF:
+            retval = None if kind == _FALLOFF or op[1] == None else regs[op[1]]
+            if kind == _FALLOFF:
+                print(f'// {"  " * (depth + len(stack))}{describe(code, args)} --> NONE')
+            elif show_proc:
+                print(f'// {"  " * (depth + len(stack))}{describe(code, args)} --> {retval}')
+            if not stack: return retval if retval is None else _check_value(retval)
+            code, gtab, pc, regs, dest, args = stack.pop()
+            if dest is not None:
+                regs[dest] = _check_value(retval)
+            ops = code.ops
+            params = []
+        elif kind == _UNOP:
+            regs[op[1]] = op[2](regs[op[3]])
+        elif kind == _NOP:
+            pass
         else:
-            print(f'Unknown opcode {instr.opcode}')
-            raise RuntimeError
-    print(f'// {indent}{proc_desc} --> NONE')
+            raise RuntimeError(op[1])
 
 # --------------------------------------------------------------------------------
 
 import json
+import re
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+def read_tac_json(fp, chunk_size=1 << 16):
+    """Yield the Gvar and Proc objects of the .tac.json file open as `fp'
+    one top-level entry at a time, so that only the text and objects of
+    the current entry are held in memory"""
+    decoder = json.JSONDecoder()
+    buf, pos = '', 0
+    expect = '['
+    while True:
+        pos = _whitespace.match(buf, pos).end()
+        if pos == len(buf):
+            buf, pos = fp.read(chunk_size), 0
+            if not buf:
+                raise json.JSONDecodeError('Unterminated TAC', buf, pos)
+            continue
+        c = buf[pos]
+        if expect == '[':
+            if c != '[':
+                raise json.JSONDecodeError("Expecting '['", buf, pos)
+            pos += 1
+            expect = 'entry or ]'
+        elif c == ']' and expect != 'entry':
+            return
+        elif expect == ', or ]':
+            if c != ',':
+                raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+            pos += 1
+            expect = 'entry'
+        else:
+            try:
+                obj, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # the entry may be incomplete: read as much again as is
+                # buffered, so that long entries are decoded a bounded
+                # number of times
+                chunk = fp.read(max(chunk_size, len(buf) - pos))
+                if not chunk: raise
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+            yield Gvar.load(obj) or Proc.load(obj)
+            expect = ', or ]'
+        if pos >= chunk_size:
+            buf, pos = buf[pos:], 0
+
+def write_tac_json(tlvs, fp):
+    """Write the Gvar and Proc objects of the iterable `tlvs' to `fp' in
+    .tac.json form as they come, one top-level entry per line"""
+    fp.write('[')
+    sep = '\n'
+    for tlv in tlvs:
+        fp.write(sep)
+        json.dump(tlv.js_obj, fp)
+        sep = ',\n'
+    fp.write('\n]\n')
 
 def load_tac(tac_file):
     """Load the TAC instructions from the given `tac_file'"""
@@ -580,11 +865,19 @@ def load_tac(tac_file):
             parser = Parser(lexer)
             return parser.parse()
         elif tac_file.endswith('.tac.json'):
-            return [Gvar.load(obj) or Proc.load(obj) \
-                    for obj in json.load(fp)]
+            return list(read_tac_json(fp))
         else:
             raise ValueError(f'TAC file must be a .tac or a .tac.json')
 
+def iter_tac(tac_file):
+    """Like load_tac, but yield the Gvar and Proc objects one by one,
+    reading a .tac.json file incrementally"""
+    if tac_file.endswith('.tac.json'):
+        with open(tac_file, 'r') as fp:
+            yield from read_tac_json(fp)
+    else:
+        yield from load_tac(tac_file)
+
 if __name__ == '__main__':
     from argparse import ArgumentParser
     ap = ArgumentParser(description='TAC parser and interpreter')
@@ -620,7 +913,7 @@ if __name__ == '__main__':
         prog = load_tac(srcfile)
         if args.dump_json and srcfile.endswith('.tac'):
             with open(srcfile + '.json', 'w') as fp:
-                json.dump([tlv.js_obj for tlv in prog], fp, indent=2)
+                write_tac_json(prog, fp)
         for tlv in prog:
             if tlv.name in seen:
                 raise RuntimeError(f'Repeated definition of {tlv.name}')
@@ -2,84 +2,57 @@ from tac import *
 import ssagen
 from cfg import *
 import json
+import os
 import sys
-import argparse
 
 def dse(cfg):
-    live_in, live_out = dict(), dict()
+    """Dead store elimination: every instruction defining a temporary that
+    is not live afterwards becomes a 'dead' instruction, except for those
+    with side effects. Liveness is computed once and updated as the
+    instructions die; the instructions defining the temporaries that a
+    dead instruction mentioned are checked again in the next round, so
+    that the liveness of a temporary is solved again about once a round."""
     exceptions=["call", "div", "mod"]
-    case=True
-    while case:
-        recompute_liveness(cfg, live_in, live_out)
-        case=False
-        for instr in cfg.instrs():
-            case_i = True
-            new_def = False
-            for new_temp in instr.defs():
-                new_def= True
-                if new_temp in live_out[instr]:
-                    case_i=False
-            if new_def:
-                if case_i:
-                    if instr.opcode == 'copy':
-                        instr.dest = None
-                        instr.opcode = 'dead'
-                        instr.arg1 = None
-                        instr.arg2 = None
-                        case=True
-                    elif instr.opcode in exceptions:
-                       continue
-                    else:
-                        instr.dest = None
-                        instr.opcode = 'dead'
-                        instr.arg1 = None
-                        instr.arg2 = None
-                        case = True
+    live = Liveness(cfg)
+    defs = dict()
+    for instr in cfg.instrs():
+        for new_temp in instr.defs():
+            defs.setdefault(new_temp, []).append(instr)
+    work = list(cfg.instrs())
+    while work:
+        recheck = dict()
+        for instr in work:
+            if instr.opcode == 'dead' or instr.opcode in exceptions:
+                continue
+            new_defs = list(instr.defs())
+            if not new_defs or any(live.is_live_out(instr, t) for t in new_defs):
+                continue
+            for t in live.remove(instr):
+                for d in defs.get(t, ()): recheck[d] = None
+            instr.dest = None
+            instr.opcode = 'dead'
+            instr.arg1 = None
+            instr.arg2 = None
+        work = list(recheck)
 
-def cpg(cfg):
-    nodes = cfg._blockmap
-    for node in nodes.values():
-        instrs = [instr for instr in node.instrs()]
-        if len(node.body)>0:
-            for instr in instrs:
-                if instr.opcode == 'copy':
-                    propogate(cfg, instr.dest, instr.arg1)
-                    instr.dest = None
-                    instr.opcode = 'dead'
-                    if instr.arg1 is not None:
-                        instr.arg1 = None
-                    if instr.arg2 is not None:
-                        instr.arg2 = None
+def cpg(cfg, du=None):
+    """Copy propagation: for every copy `%d = copy %s' between temporaries,
+    the uses of %d are rewritten to use %s and the copy becomes a 'dead'
+    instruction. Needs SSA form. The uses are found with the def-use
+    chains `du', which are built if not given and kept current.
 
-def propogate(cfg, new, old):
-    nodes = cfg._blockmap
-    for node in nodes.values():
-        instrs = [instr for instr in node.instrs()]
-        for instr in instrs:
-            if instr.dest == new:
-                instr.dest = old
-
-            if isinstance(instr.arg1, dict):
-                arg1 = {}
-                for k,v in instr.arg1.items():
-                    if v == new:
-                        arg1[k] = old
-                    else:
-                        arg1[k] = v
-                instr.arg1 = arg1
-            elif instr.arg1 == new:
-                instr.arg1 = old
-
-            if isinstance(instr.arg2, dict):
-                arg2 = {}
-                for k,v in instr.arg2.items():
-                    if v == new:
-                        arg2[k] = old
-                    else:
-                        arg2[k] = v
-                instr.arg2 = arg2
-            elif instr.arg2 is not None and instr.arg2 == new:
-                instr.arg2 = old
+    Copies to or from globals are left alone: a global can change between
+    the copy and a use, and its stores must stay."""
+    if du is None: du = DefUse(cfg)
+    for instr in list(cfg.instrs()):
+        if instr.opcode == 'copy' and Instr._istemp(instr.dest) \
+           and Instr._istemp(instr.arg1):
+            du.remove(instr)
+            du.replace_uses(instr.dest, instr.arg1)
+            instr.dest = None
+            instr.opcode = 'dead'
+            instr.arg1 = None
+            instr.arg2 = None
 
 def remove_dead(proc):
     new_body = []
@@ -90,41 +63,46 @@ def remove_dead(proc):
             new_body.append(instr)
     proc.body = new_body
 
-def main(fname, sname):
-    tac_obj=load_tac(fname)
-    tac=[]
-    
-    for proc in tac_obj:
-        if isinstance(proc, Gvar):
-            continue
-        proc_name = proc.name
-        cfg = infer(proc)
-        ssagen.crude_ssagen(proc,cfg)
-        dse(cfg)
-        cpg(cfg) 
-        linearize(proc,cfg)
-        remove_dead(proc)
-        
-        # proc_json = {}
-        # proc_json["proc"] = proc_name
-        # if len(proc.t_args) >0:
-        #     proc_json["args"] = proc["args"]
-        # proc_json["body"] = body 
+def optimize(proc, ssa='crude', keep_ssa=False):
+    cfg = infer(proc)
+    ssagen.ssagens[ssa](proc,cfg)
+    dse(cfg)
+    du = DefUse(cfg)
+    cpg(cfg, du)
+    if not keep_ssa: ssagen.out_of_ssa(proc, cfg, du)
+    linearize(proc,cfg)
+    remove_dead(proc)
+    return proc
 
-    tac = [proc.js_obj for proc in tac_obj]
+def main(fname, sname, ssa='crude', keep_ssa=False):
+    # one procedure at a time, from reading it to writing it out
+    tac = (tlv if isinstance(tlv, Gvar) else optimize(tlv, ssa, keep_ssa) \
+           for tlv in iter_tac(fname))
 
     if sname is None:
-        print(tac)
+        write_tac_json(tac, sys.stdout)
     else:
-        with open(sname, 'w') as f:
-            json.dump(tac, f, indent=2)
+        # the input is still being read while the output is written, which
+        # may well be the same file
+        tmp = f'{sname}.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                write_tac_json(tac, f)
+            os.replace(tmp, sname)
+        except BaseException:
+            if os.path.exists(tmp): os.remove(tmp)
+            raise
 
 
 
 if __name__ == "__main__":
+    import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("fname")
     parser.add_argument("-o")
+    parser.add_argument("--ssa", default="crude", choices=ssagen.ssagens.keys())
+    parser.add_argument("--keep-ssa", action="store_true",
+                        help="leave the phis in the output")
     args = parser.parse_args()
     
-    cfg = main(args.fname, args.o)
\ No newline at end of file
+    cfg = main(args.fname, args.o, args.ssa, args.keep_ssa)
\ No newline at end of file
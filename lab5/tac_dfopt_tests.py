@@ -0,0 +1,172 @@
+import copy
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from tac_dfopt import *
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lab4'))
+import tac2x64
+
+def instr(opcode, args, result=None):
+    return {"opcode": opcode, "args": args, "result": result}
+
+def println(arg):
+    return [instr("param", [1, arg]),
+            instr("call", ["@__bx_print_int", 1])]
+
+# @g counts the iterations of a loop that sums 10 + 9 + ... + 1 in %1 and
+# swaps %8 and %9 each time, then 5! is computed by a recursive call
+PROGRAM = [
+    {"var": "@g", "init": 3},
+    {"proc": "@fact", "args": ["%0"], "body": [
+        instr("label", ["%.L0"]),
+        instr("jz", ["%0", "%.L1"]),
+        instr("const", [1], "%1"),
+        instr("sub", ["%0", "%1"], "%2"),
+        instr("param", [1, "%2"]),
+        instr("call", ["@fact", 1], "%3"),
+        instr("mul", ["%0", "%3"], "%4"),
+        instr("ret", ["%4"]),
+        instr("label", ["%.L1"]),
+        instr("const", [1], "%5"),
+        instr("ret", ["%5"])]},
+    {"proc": "@main", "args": [], "body": [
+        instr("label", ["%.L0"]),
+        instr("const", [10], "%0"),
+        instr("const", [0], "%1"),
+        instr("const", [1], "%2"),
+        instr("const", [1], "%8"),
+        instr("const", [2], "%9"),
+        instr("label", ["%.L1"]),
+        instr("jz", ["%0", "%.L2"]),
+        instr("copy", ["%1"], "%3"),
+        instr("add", ["%3", "%0"], "%1"),
+        instr("const", [99], "%4"),
+        instr("sub", ["%0", "%2"], "%0"),
+        instr("add", ["@g", "%2"], "@g"),
+        instr("copy", ["%8"], "%7"),
+        instr("copy", ["%9"], "%8"),
+        instr("copy", ["%7"], "%9"),
+        instr("jmp", ["%.L1"]),
+        instr("label", ["%.L2"]),
+        *println("%1"),
+        *println("@g"),
+        *println("%8"),
+        instr("const", [5], "%5"),
+        instr("param", [1, "%5"]),
+        instr("call", ["@fact", 1], "%6"),
+        *println("%6"),
+        instr("ret", [])]},
+]
+EXPECTED = "55\n13\n1\n120\n"
+
+def split(tlvs):
+    gvars, procs = dict(), dict()
+    for tlv in tlvs:
+        if isinstance(tlv, Gvar): gvars[tlv.name] = tlv
+        else: procs[tlv.name] = tlv
+    return gvars, procs
+
+def load_program():
+    return split(Gvar.load(js_obj) or Proc.load(js_obj) \
+                 for js_obj in copy.deepcopy(PROGRAM))
+
+def optimized(**kwargs):
+    """The program after a run of tac_dfopt's main() on it"""
+    with tempfile.TemporaryDirectory() as d:
+        fname = os.path.join(d, 'prog.tac.json')
+        sname = os.path.join(d, 'opt.tac.json')
+        with open(fname, 'w') as f: json.dump(PROGRAM, f)
+        main(fname, sname, **kwargs)
+        return split(load_tac(sname))
+
+def run(gvars, procs):
+    out = io.StringIO()
+    with redirect_stdout(out):
+        execute(gvars, procs, '@main', [])
+    return out.getvalue()
+
+class testOptimize(unittest.TestCase):
+    def test_original(self):
+        self.assertEqual(run(*load_program()), EXPECTED)
+
+    def test_semantics(self):
+        for ssa in ssagen.ssagens:
+            for keep_ssa in (False, True):
+                with self.subTest(ssa=ssa, keep_ssa=keep_ssa):
+                    self.assertEqual(run(*optimized(ssa=ssa, keep_ssa=keep_ssa)),
+                                     EXPECTED)
+
+    def test_roundtrip_json(self):
+        gvars, procs = optimized(ssa='pruned')
+        for proc in procs.values():
+            for i in proc.body:
+                js_obj = json.loads(json.dumps(i.js_obj))
+                self.assertNotIn(None, js_obj['args'][-1:])
+                j = Instr.load(js_obj)
+                self.assertEqual((j.dest, j.opcode, j.arg1, j.arg2),
+                                 (i.dest, i.opcode, i.arg1, i.arg2))
+
+    def test_in_place(self):
+        with tempfile.TemporaryDirectory() as d:
+            fname = os.path.join(d, 'prog.tac.json')
+            with open(fname, 'w') as f: json.dump(PROGRAM, f)
+            main(fname, fname)
+            self.assertEqual(os.listdir(d), ['prog.tac.json'])
+            self.assertEqual(run(*split(load_tac(fname))), EXPECTED)
+
+    def test_dse(self):
+        gvars, procs = load_program()
+        main = procs['@main']
+        cfg = infer(main)
+        ssagen.crude_ssagen(main, cfg)
+        dse(cfg)
+        ops = [i.opcode for i in cfg.instrs()]
+        self.assertEqual(ops.count('dead'), 1)
+        self.assertNotIn(99, [i.arg1 for i in cfg.instrs() if i.opcode == 'const'])
+        # the store to a global stays, as do the calls
+        self.assertIn('@g', [i.dest for i in cfg.instrs()])
+        self.assertEqual(ops.count('call'), 5)
+
+    def test_cpg(self):
+        gvars, procs = load_program()
+        main = procs['@main']
+        cfg = infer(main)
+        ssagen.crude_ssagen(main, cfg)
+        cpg(cfg)
+        for i in cfg.instrs():
+            self.assertFalse(i.opcode == 'copy' and Instr._istemp(i.arg1), i)
+            if i.opcode != 'dead': self.assertNotIn('%3', set(i.uses()) | set(i.defs()))
+
+class testEndToEnd(unittest.TestCase):
+    def test_tac2x64_accepts_output(self):
+        for ssa in ssagen.ssagens:
+            gvars, procs = optimized(ssa=ssa)
+            for proc in procs.values():
+                body = json.loads(json.dumps(proc.js_obj))['body']
+                for regalloc in tac2x64.allocators:
+                    with self.subTest(ssa=ssa, proc=proc.name, regalloc=regalloc):
+                        tac2x64.tac_to_asm(body, regalloc, proc.name, proc.t_args)
+
+    @unittest.skipUnless(sys.platform == 'linux' and shutil.which('gcc'),
+                         'needs gcc to assemble and link')
+    def test_compiled_output(self):
+        for ssa in ssagen.ssagens:
+            gvars, procs = optimized(ssa=ssa)
+            with self.subTest(ssa=ssa), tempfile.TemporaryDirectory() as d:
+                fname = os.path.join(d, 'prog.tac.json')
+                with open(fname, 'w') as f:
+                    json.dump([tlv.js_obj for tlv in [*gvars.values(), *procs.values()]], f)
+                sname = tac2x64.tac_to_file(fname, 'linear')
+                xname = tac2x64.link(sname)
+                result = subprocess.run([xname], capture_output=True, text=True)
+                self.assertEqual(result.stdout, EXPECTED)
+
+if __name__ == '__main__':
+    unittest.main()
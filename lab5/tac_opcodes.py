@@ -0,0 +1,31 @@
+"""
+Classification of the TAC opcodes, derived from tac.opcode_kinds
+
+Each category is a frozenset of opcodes, so that a test is a single set
+membership instead of a regular expression match.
+"""
+
+from tac import opcode_kinds
+
+def _where(test):
+    return frozenset(op for op, kind in opcode_kinds.items() if test(kind))
+
+# opcodes whose arg1 (resp. arg2) is a variable read by the instruction
+# (the optional argument of ret, when present, is such a variable)
+arg1_uses = _where(lambda kind: kind[1] in 'VO')
+arg2_uses = _where(lambda kind: kind[2] == 'V')
+
+# opcodes whose dest is a variable written by the instruction (optional for call)
+dest_defs = _where(lambda kind: kind[0] in 'VO')
+
+# jumps: opcodes with a label argument that are not labels themselves;
+# the conditional ones also read a variable
+jumps = _where(lambda kind: 'L' in kind) - {'label'}
+cond_jumps = frozenset(op for op in jumps if opcode_kinds[op][1] == 'V')
+
+# opcodes that end a basic block, and those among them that never fall through
+terminators = jumps | {'ret'}
+abs_jumps = terminators - cond_jumps
+
+# opcodes that never need an explicit jump to a label right after them
+no_fallthrough = abs_jumps | {'label'}
@@ -0,0 +1,207 @@
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from tac import *
+
+def proc(name, t_args, *body):
+    return Proc(name, t_args, [Instr(*i) for i in body])
+
+def run(*procs, gvars=(), args=()):
+    out = io.StringIO()
+    with redirect_stdout(out):
+        result = execute({g.name: g for g in gvars}, {p.name: p for p in procs},
+                         '@main', list(args))
+    return result, out.getvalue()
+
+class testUndefined(unittest.TestCase):
+    def assertUndefined(self, tmp, *procs):
+        with self.assertRaisesRegex(RuntimeError, f'Undefined temporary {tmp} '):
+            run(*procs)
+
+    def test_binop(self):
+        self.assertUndefined('%1', proc('@main', (),
+            ('%0', 'const', (1,)),
+            ('%2', 'add', ('%0', '%1')),
+            (None, 'ret', ('%2',))))
+
+    def test_jz(self):
+        self.assertUndefined('%0', proc('@main', (),
+            (None, 'label', ('%.L0',)),
+            (None, 'jz', ('%0', '%.L0')),
+            (None, 'ret', ())))
+
+    def test_copied_then_used(self):
+        self.assertUndefined('%0', proc('@main', (),
+            ('%1', 'copy', ('%0',)),
+            ('%2', 'neg', ('%1',)),
+            (None, 'ret', ())))
+
+    def test_param(self):
+        self.assertUndefined('%0',
+            proc('@main', (),
+                 (None, 'param', (1, '%0')),
+                 (None, 'call', ('@f', 1)),
+                 (None, 'ret', ())),
+            proc('@f', ('%0',),
+                 (None, 'ret', ())))
+
+    def test_ret(self):
+        self.assertUndefined('%3', proc('@main', (), (None, 'ret', ('%3',))))
+
+    def test_copy_never_used(self):
+        result, _ = run(proc('@main', (),
+            ('%1', 'copy', ('%0',)),
+            ('%2', 'const', (4,)),
+            (None, 'ret', ('%2',))))
+        self.assertEqual(result, 4)
+
+class testCalls(unittest.TestCase):
+    # @down(n) counts @g up n times on the way down and returns n
+    down = proc('@down', ('%0',),
+        (None, 'label', ('%.L0',)),
+        ('%1', 'const', (1,)),
+        ('@g', 'add', ('@g', '%1')),
+        (None, 'jz', ('%0', '%.L1')),
+        ('%2', 'sub', ('%0', '%1')),
+        (None, 'param', (1, '%2')),
+        ('%3', 'call', ('@down', 1)),
+        ('%4', 'add', ('%3', '%1')),
+        (None, 'ret', ('%4',)),
+        (None, 'label', ('%.L1',)),
+        (None, 'ret', ('%0',)))
+
+    def main(self, n):
+        return proc('@main', (),
+            ('%0', 'const', (n,)),
+            (None, 'param', (1, '%0')),
+            ('%1', 'call', ('@down', 1)),
+            (None, 'param', (1, '@g')),
+            (None, 'call', ('@__bx_print_int', 1)),
+            (None, 'ret', ('%1',)))
+
+    def test_globals(self):
+        g = Gvar('@g', 5)
+        result, out = run(self.main(3), self.down, gvars=[g])
+        self.assertEqual(result, 3)
+        self.assertEqual(out, '9\n')
+        self.assertEqual(g.value, 9)
+
+    def test_deep_recursion(self):
+        n = 10 * sys.getrecursionlimit()
+        g = Gvar('@g', 0)
+        result, out = run(self.main(n), self.down, gvars=[g])
+        self.assertEqual(result, n)
+        self.assertEqual(out, f'{n + 1}\n')
+
+    def test_arguments(self):
+        result, _ = run(
+            proc('@main', (),
+                 ('%0', 'const', (7,)),
+                 ('%1', 'const', (2,)),
+                 (None, 'param', (2, '%1')),
+                 (None, 'param', (1, '%0')),
+                 ('%2', 'call', ('@sub', 2)),
+                 (None, 'ret', ('%2',))),
+            proc('@sub', ('%0', '%1'),
+                 ('%2', 'sub', ('%0', '%1')),
+                 (None, 'ret', ('%2',))))
+        self.assertEqual(result, 5)
+
+class testPhis(unittest.TestCase):
+    def test_swap_on_critical_edge(self):
+        # the back edge %.L1 -> %.L1 is critical; %2 and %3 swap on it
+        result, _ = run(proc('@main', (),
+            (None, 'label', ('%.L0',)),
+            ('%0.0', 'const', (2,)),
+            ('%1', 'const', (1,)),
+            ('%2.0', 'const', (10,)),
+            ('%3.0', 'const', (20,)),
+            (None, 'label', ('%.L1',)),
+            ('%0.1', 'phi', ({'%.L0': '%0.0', '%.L1': '%0.2'},)),
+            ('%2.1', 'phi', ({'%.L0': '%2.0', '%.L1': '%3.1'},)),
+            ('%3.1', 'phi', ({'%.L0': '%3.0', '%.L1': '%2.1'},)),
+            ('%0.2', 'sub', ('%0.1', '%1')),
+            (None, 'jnz', ('%0.2', '%.L1')),
+            (None, 'label', ('%.L2',)),
+            ('%4', 'sub', ('%2.1', '%3.1')),
+            (None, 'ret', ('%4',))))
+        self.assertEqual(result, 10)
+
+    def test_unresolved_phi(self):
+        with self.assertRaisesRegex(RuntimeError, 'cannot resolve phi'):
+            run(proc('@main', (),
+                (None, 'label', ('%.L0',)),
+                ('%0', 'const', (1,)),
+                (None, 'jmp', ('%.L1',)),
+                (None, 'label', ('%.L1',)),
+                ('%1', 'phi', ({'%.L2': '%0'},)),
+                (None, 'ret', ('%1',))))
+
+class testDecodeCache(unittest.TestCase):
+    def main(self):
+        return proc('@main', (),
+            ('%0', 'const', (1,)),
+            (None, 'ret', ('%0',)))
+
+    def test_replace_instr(self):
+        p = self.main()
+        self.assertEqual(run(p)[0], 1)
+        p.body[0] = Instr('%0', 'const', (2,))
+        self.assertEqual(run(p)[0], 2)
+
+    def test_edit_instr(self):
+        p = self.main()
+        self.assertEqual(run(p)[0], 1)
+        p.body[0].arg1 = 3
+        p.changed()
+        self.assertEqual(run(p)[0], 3)
+
+    def test_grow_and_shrink(self):
+        p = self.main()
+        self.assertEqual(run(p)[0], 1)
+        p.body.insert(1, Instr('%0', 'add', ('%0', '%0')))
+        self.assertEqual(run(p)[0], 2)
+        del p.body[1]
+        self.assertEqual(run(p)[0], 1)
+        p.body.append(p.body.pop())
+        self.assertIs(decode(p), decode(p))
+
+class testLazyImports(unittest.TestCase):
+    PROGRAM = '''var @g = 4;
+proc @main():
+%.L0:
+  %0 = const 1;
+  %1 = add @g, %0;
+  param 1, %1;
+  call @__bx_print_int, 1;
+  ret;
+'''
+
+    def imported(self, script, *args, cwd):
+        """The modules imported by a run of the lab5 `script' on `args'"""
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), script)
+        proc = subprocess.run([sys.executable, '-X', 'importtime', script, *args],
+                              capture_output=True, text=True, cwd=cwd)
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        return {line.split('|')[-1].strip() for line in proc.stderr.splitlines() \
+                if line.startswith('import time:')}
+
+    def assertNoPly(self, modules):
+        self.assertFalse([m for m in modules if m == 'ply' or m.startswith('ply.')])
+
+    def test_tac_json_input(self):
+        with tempfile.TemporaryDirectory() as d:
+            with open(os.path.join(d, 'prog.tac'), 'w') as f: f.write(self.PROGRAM)
+            # reading the .tac text goes through PLY, dumping the .tac.json
+            self.assertIn('ply.lex', self.imported('tac.py', '--dump-json', 'prog.tac', cwd=d))
+            self.assertNoPly(self.imported('tac.py', 'prog.tac.json', cwd=d))
+            self.assertNoPly(self.imported('tac_dfopt.py', 'prog.tac.json', '-o', 'opt.tac.json', cwd=d))
+            for ssa in ('crude', 'pruned'):
+                self.assertNoPly(self.imported('ssagen.py', '--ssa', ssa, 'prog.tac.json', cwd=d))
+
+if __name__ == '__main__':
+    unittest.main()
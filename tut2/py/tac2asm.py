@@ -13,6 +13,7 @@ import json
 import sys
 import os
 from pathlib import Path
+import peephole
 
 binops = {'add': 'addq',
           'sub': 'subq',
@@ -110,7 +111,7 @@ def tac_to_asm(tac_instrs):
               f'retq'])
   return asm
 
-def compile_tac(fname):
+def compile_tac(fname, optimize=True):
   if fname.endswith('.tac.json'):
     rname = fname[:-9]
   elif fname.endswith('.json'):
@@ -123,7 +124,9 @@ def compile_tac(fname):
   assert isinstance(tjs, list) and len(tjs) == 1, tjs
   tjs = tjs[0]
   assert 'proc' in tjs and tjs['proc'] == '@main', tjs
-  asm = ['\t' + line for line in tac_to_asm(tjs['body'])]
+  lines = tac_to_asm(tjs['body'])
+  if optimize: lines = peephole.optimize(lines)
+  asm = ['\t' + line for line in lines]
   asm[:0] = [f'\t.section .rodata',
              f'.lprintfmt:',
              f'\t.string "%ld\\n"',